@@ -203,7 +203,8 @@ export interface ServerToClientEvents {
 }
 
 export interface ClientToServerEvents {
-    registerInit: (callback: (challenge: string) => void) => string | undefined;
+    // Challenge is null when the server refuses to issue one, e.g. the client is throttled
+    registerInit: (callback: (challenge: string | null) => void) => string | undefined;
     registerFollowUp: (
         payload: RegisterFollowUpPayload,
         callback: (status: StatusResponse) => void,
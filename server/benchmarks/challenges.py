@@ -0,0 +1,75 @@
+"""Measure issuing authentication challenges for many pending handshakes.
+
+Compares generating challenges with a `secrets.choice` call per character (the
+way registerInit used to) with bulk generation, then fills a ChallengeManager
+with pending handshakes and reports the rate and memory they take.
+
+Usage:
+    poetry run python benchmarks/challenges.py [--handshakes 100000]
+"""
+import argparse
+import secrets
+import time
+import tracemalloc
+
+from loguru import logger
+
+from sdex_server.crypto.challenges import ChallengeManager
+from sdex_server.crypto.randomness import (
+    CHALLENGE_ALPHABET,
+    CHALLENGE_LENGTH,
+    generate_challenge,
+)
+
+
+def generate_challenge_per_character() -> str:
+    return "".join(secrets.choice(CHALLENGE_ALPHABET) for _ in range(CHALLENGE_LENGTH))
+
+
+def generation_rate(generate, count: int) -> float:
+    started = time.perf_counter()
+    for _ in range(count):
+        generate()
+    return count / (time.perf_counter() - started)
+
+
+def fill_challenges(handshakes: int) -> ChallengeManager:
+    challenges = ChallengeManager(
+        ttl_seconds=60, max_pending=handshakes, max_issued_per_sid=5
+    )
+    for i in range(handshakes):
+        challenges.issue(f"sid-{i}")
+    return challenges
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--handshakes", type=int, default=100_000)
+    args = parser.parse_args()
+    logger.remove()
+
+    count = max(args.handshakes // 10, 1)
+    per_character = generation_rate(generate_challenge_per_character, count)
+    bulk = generation_rate(generate_challenge, count)
+    print(f"{'per-character generation':<28}{per_character:>12.0f} challenges/s")
+    print(f"{'bulk generation':<28}{bulk:>12.0f} challenges/s")
+
+    started = time.perf_counter()
+    challenges = fill_challenges(args.handshakes)
+    issue_rate = args.handshakes / (time.perf_counter() - started)
+    print(f"{'issue for pending handshakes':<28}{issue_rate:>12.0f} challenges/s")
+
+    tracemalloc.start()
+    challenges = fill_challenges(args.handshakes)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{'memory':<28}{memory / 2**20:>12.1f} MiB "
+        f"for {len(challenges)} pending handshakes "
+        f"({memory / len(challenges):.0f} B each)"
+    )
+    print(f"{'issue over the limit':<28}{str(challenges.issue('one-more')):>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Measure event loop lag caused by database access under a register/checkKey load.
+
+Compares calling the synchronous DatabaseManager directly from coroutines (the way
+Socket.IO handlers used to) with awaiting AsyncDatabaseManager.
+
+Usage:
+    poetry run python benchmarks/event_loop_lag.py [--clients 50] [--operations 40]
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from loguru import logger
+
+from sdex_server.database.async_database import AsyncDatabaseManager
+from sdex_server.database.database import DatabaseManager
+from sdex_server.database.models import User
+
+PROBE_INTERVAL = 0.001
+
+
+async def probe_lag(lags: list[float], stop: asyncio.Event) -> None:
+    """Record how late the loop wakes up a task which sleeps for a fixed time."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(time.perf_counter() - started - PROBE_INTERVAL)
+
+
+async def sync_client(db: DatabaseManager, client_id: int, operations: int) -> None:
+    for i in range(operations):
+        key = f"key-{client_id}-{i}"
+        db.add_user(User(login=f"user-{client_id}-{i}", public_key=key))
+        db.check_public_key(key)
+        await asyncio.sleep(0)
+
+
+async def async_client(
+    db: AsyncDatabaseManager, client_id: int, operations: int
+) -> None:
+    for i in range(operations):
+        key = f"key-{client_id}-{i}"
+        await db.add_user(User(login=f"user-{client_id}-{i}", public_key=key))
+        await db.check_public_key(key)
+
+
+async def run_scenario(name: str, clients: int, operations: int) -> dict[str, float]:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = Path(tmp_dir) / "benchmark.db"
+        lags: list[float] = []
+        stop = asyncio.Event()
+        probe = asyncio.create_task(probe_lag(lags, stop))
+        started = time.perf_counter()
+        if name == "sync":
+            sync_db = DatabaseManager(db_path)
+            await asyncio.gather(
+                *(sync_client(sync_db, i, operations) for i in range(clients))
+            )
+        else:
+            async_db = AsyncDatabaseManager(
+                db_path, readers=4, max_messages_per_recipient=1, ttl_seconds=1
+            )
+            await asyncio.gather(
+                *(async_client(async_db, i, operations) for i in range(clients))
+            )
+            async_db.close()
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await probe
+    lags.sort()
+    return {
+        "operations_per_second": clients * operations * 2 / elapsed,
+        "lag_p50_ms": statistics.median(lags) * 1000,
+        "lag_p99_ms": lags[int(len(lags) * 0.99) - 1] * 1000,
+        "lag_max_ms": lags[-1] * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--operations", type=int, default=40)
+    args = parser.parse_args()
+    logger.remove()
+
+    print(f"{'scenario':<10}{'ops/s':>12}{'lag p50':>12}{'lag p99':>12}{'lag max':>12}")
+    for name in ("sync", "async"):
+        result = asyncio.run(run_scenario(name, args.clients, args.operations))
+        print(
+            f"{name:<10}"
+            f"{result['operations_per_second']:>12.0f}"
+            f"{result['lag_p50_ms']:>10.2f}ms"
+            f"{result['lag_p99_ms']:>10.2f}ms"
+            f"{result['lag_max_ms']:>10.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Measure how many registrations per second the database layer commits.
+
+Concurrent clients register users through AsyncDatabaseManager, the way a burst
+of "registerFollowUp" events does. Each configuration runs against a fresh
+database. Batch size 1 commits every write on its own, as the server used to.
+Larger batches group writes made at the same time into one transaction.
+
+Usage:
+    poetry run python benchmarks/registrations.py [--users 5000] [--concurrency 200]
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+from loguru import logger
+
+from sdex_server.database.async_database import AsyncDatabaseManager
+from sdex_server.database.models import User
+
+CONFIGURATIONS = (
+    # (write_batch_size, write_batch_window)
+    (1, 0.0),
+    (64, 0.0),
+    (64, 0.002),
+)
+
+
+async def register_users(
+    db_path: Path, users: int, concurrency: int, batch_size: int, window: float
+) -> float:
+    db_manager = AsyncDatabaseManager(
+        db_path,
+        readers=1,
+        max_messages_per_recipient=1,
+        ttl_seconds=60,
+        write_batch_size=batch_size,
+        write_batch_window=window,
+    )
+    await db_manager.open()
+    pending = iter(range(users))
+
+    async def client() -> None:
+        for i in pending:
+            user = User(login=f"user-{i}", public_key=f"public-key-{i}")
+            if not await db_manager.add_user(user):
+                raise RuntimeError(f"Registration of {user.login} failed.")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    db_manager.close()
+    return users / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+    # Queries log every registration, which would dominate the measurement
+    logger.remove()
+
+    print(f"{args.users} registrations, {args.concurrency} concurrent clients")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for batch_size, window in CONFIGURATIONS:
+            db_path = Path(tmp_dir) / f"registrations-{batch_size}-{window}.db"
+            rate = asyncio.run(
+                register_users(
+                    db_path, args.users, args.concurrency, batch_size, window
+                )
+            )
+            name = f"batch {batch_size}, window {window * 1000:g} ms"
+            print(f"{name:<26}{rate:>10.0f} registrations/s")
+
+
+if __name__ == "__main__":
+    main()
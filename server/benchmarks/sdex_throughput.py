@@ -0,0 +1,56 @@
+"""Measure SDEx cipher throughput for different message sizes.
+
+Reports MB/s of calculating whole messages and of streaming them in 64 KiB
+chunks, the way large media would be processed.
+
+Usage:
+    poetry run python benchmarks/sdex_throughput.py [--max-size 1048576]
+"""
+import argparse
+import os
+import time
+
+from sdex_server.crypto.sdex import SdexCipher
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def throughput(calculate, data: bytes) -> float:
+    """MB/s of repeating the calculation for at least a tenth of a second."""
+    rounds = 0
+    started = time.perf_counter()
+    while (elapsed := time.perf_counter() - started) < 0.1 or not rounds:
+        calculate(data)
+        rounds += 1
+    return len(data) * rounds / elapsed / 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-size", type=int, default=1024 * 1024)
+    args = parser.parse_args()
+
+    cipher = SdexCipher(os.urandom(64))
+
+    def stream(data: bytes) -> None:
+        chunks = (
+            data[i : i + STREAM_CHUNK_SIZE]
+            for i in range(0, len(data), STREAM_CHUNK_SIZE)
+        )
+        for _ in cipher.calculate_stream(chunks):
+            pass
+
+    print(f"{'size':>10}{'message MB/s':>16}{'stream MB/s':>16}")
+    size = 32
+    while size <= args.max_size:
+        data = os.urandom(size)
+        print(
+            f"{size:>10}"
+            f"{throughput(cipher.calculate_message, data):>16.2f}"
+            f"{throughput(stream, data):>16.2f}"
+        )
+        size *= 8
+
+
+if __name__ == "__main__":
+    main()
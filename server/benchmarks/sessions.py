@@ -0,0 +1,120 @@
+"""Measure memory and lookups of the in-memory session registry.
+
+Compares the layout presence used to have, a bidict of public keys and sids plus
+a set of authenticated sids, with SessionRegistry. Every user's public key comes
+in the "connect" payload and again with "registerFollowUp", where the server
+keeps it for per-user rate limits. Reports memory taken per connected user by
+the indexes and the copies of the key they keep (sid strings excluded) and the
+time of the lookups "chat" does: the sender's public key and authentication by
+sid, then the receiver's sid by a public key parsed from the payload and the
+receiver's authentication.
+
+Usage:
+    poetry run python benchmarks/sessions.py [--users 100000] [--lookups 200000]
+"""
+import argparse
+import base64
+import os
+import random
+import time
+import tracemalloc
+from typing import Callable
+
+from bidict import bidict
+
+from sdex_server.connection.sessions import SessionRegistry, intern_public_key
+
+
+def random_public_key() -> str:
+    # Same length as a PEM encoded 2048-bit RSA public key
+    body = base64.b64encode(os.urandom(270)).decode()
+    return f"-----BEGIN RSA PUBLIC KEY-----\n{body}\n-----END RSA PUBLIC KEY-----\n"
+
+
+def copy(public_key: str) -> str:
+    """Equal string parsed from another payload."""
+    return public_key.encode().decode()
+
+
+class BidictLayout:
+    def __init__(self) -> None:
+        self.public_keys_sids_mapping: bidict[str, str] = bidict()
+        self.authenticated_users: set[str] = set()
+        self.rate_limited_keys: dict[str, str] = {}
+
+    def connect(self, public_key: str, sid: str) -> None:
+        self.public_keys_sids_mapping.forceput(copy(public_key), sid)
+        self.authenticated_users.add(sid)
+        self.rate_limited_keys[sid] = copy(public_key)
+
+    def chat_lookups(self, sender_sid: str, public_key_to: str) -> bool:
+        sender_key = self.public_keys_sids_mapping.inverse.get(sender_sid, None)
+        if not sender_key or sender_sid not in self.authenticated_users:
+            return False
+        receiver_sid = self.public_keys_sids_mapping.get(public_key_to, None)
+        return receiver_sid in self.authenticated_users
+
+
+class RegistryLayout:
+    def __init__(self) -> None:
+        self.sessions = SessionRegistry()
+        self.rate_limited_keys: dict[str, str] = {}
+
+    def connect(self, public_key: str, sid: str) -> None:
+        self.sessions.bind(copy(public_key), sid)
+        self.sessions.authenticate(sid)
+        self.rate_limited_keys[sid] = intern_public_key(copy(public_key))
+
+    def chat_lookups(self, sender_sid: str, public_key_to: str) -> bool:
+        sender = self.sessions.get(sender_sid)
+        if not sender or not sender.authenticated:
+            return False
+        receiver = self.sessions.get_by_public_key(public_key_to)
+        return receiver is not None and receiver.authenticated
+
+
+def measure(
+    layout_class: Callable[[], BidictLayout | RegistryLayout],
+    public_keys: list[str],
+    sids: list[str],
+    pairs: list[tuple[str, str]],
+) -> tuple[float, float]:
+    tracemalloc.start()
+    layout = layout_class()
+    for public_key, sid in zip(public_keys, sids):
+        layout.connect(public_key, sid)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    for sender_sid, public_key_to in pairs:
+        layout.chat_lookups(sender_sid, public_key_to)
+    elapsed = time.perf_counter() - started
+    return memory / len(sids), elapsed / len(pairs) * 1e9
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=200_000)
+    args = parser.parse_args()
+
+    public_keys = [random_public_key() for _ in range(args.users)]
+    sids = [base64.urlsafe_b64encode(os.urandom(15)).decode() for _ in public_keys]
+    # Keys in payloads are new strings, not the objects stored on connect
+    pairs = [
+        (random.choice(sids), copy(random.choice(public_keys)))
+        for _ in range(args.lookups)
+    ]
+
+    print(f"{args.users} connected users, {args.lookups} chat lookups")
+    for name, layout_class in (
+        ("bidict + set", BidictLayout),
+        ("SessionRegistry", RegistryLayout),
+    ):
+        memory, lookup = measure(layout_class, public_keys, sids, pairs)
+        print(f"{name:<18}{memory:>8.0f} B/user{lookup:>10.0f} ns/chat")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""Measure throughput and latency of the Socket.IO server under simulated clients.
+
+Starts the app in-process against a temporary database and connects simulated
+python-socketio clients. Every client generates an RSA key pair and registers
+with registerInit/registerFollowUp. Clients then exchange chatInit and send chat
+and chatBatch traffic to their neighbour. Results of each scenario are printed
+as JSON, so they can be compared between releases.
+
+Usage:
+    poetry run python benchmarks/socketio_load.py [--clients 20] [--messages 50]
+        [--batch-size 20] [--key-size 1024] [--output results.json]
+"""
+import argparse
+import asyncio
+import base64
+import importlib
+import json
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+import rsa
+import socketio
+import uvicorn
+
+
+class SimulatedClient:
+    def __init__(self, login: str, key_size: int) -> None:
+        self.login = login
+        public_key, self.private_key = rsa.newkeys(key_size)
+        self.public_key = public_key.save_pkcs1().decode()
+        self.socket = socketio.AsyncClient()
+        self.socket.on("chatInit", self.on_chat_init)
+        self.socket.on("chat", self.on_chat)
+        self.socket.on("chatBatch", self.on_chat)
+
+    async def on_chat_init(self, data: dict[str, Any]) -> str:
+        return "session-key-part"
+
+    async def on_chat(self, data: Any) -> bool:
+        return True
+
+    async def connect(self, url: str) -> None:
+        await self.socket.connect(
+            url, socketio_path="/ws/socket.io", auth={"publicKey": self.public_key}
+        )
+
+    async def register(self) -> bool:
+        challenge = await self.socket.call("registerInit")
+        signature = rsa.sign(challenge.encode(), self.private_key, "SHA-256")
+        status = await self.socket.call(
+            "registerFollowUp",
+            {
+                "login": self.login,
+                "publicKey": self.public_key,
+                "signature": base64.b64encode(signature).decode(),
+            },
+        )
+        return status == "success"
+
+    async def chat_init(self, receiver: "SimulatedClient") -> bool:
+        response = await self.socket.call(
+            "chatInit",
+            {
+                "publicKeyFrom": self.public_key,
+                "publicKeyTo": receiver.public_key,
+                "sessionKeyPartEncrypted": "session-key-part",
+            },
+        )
+        return response is not None
+
+    def message(self, receiver: "SimulatedClient", number: int) -> dict[str, Any]:
+        return {
+            "publicKeyFrom": self.public_key,
+            "publicKeyTo": receiver.public_key,
+            "text": f"encrypted message {number}",
+            "createdAt": "2023-01-01T00:00:00.000Z",
+        }
+
+    async def chat(self, receiver: "SimulatedClient", number: int) -> bool:
+        status = await self.socket.call("chat", self.message(receiver, number))
+        return status in ("success", "accepted") or (
+            isinstance(status, dict) and status.get("status") == "accepted"
+        )
+
+    async def chat_batch(
+        self, receiver: "SimulatedClient", number: int, batch_size: int
+    ) -> bool:
+        statuses = await self.socket.call(
+            "chatBatch",
+            [self.message(receiver, number + i) for i in range(batch_size)],
+        )
+        return isinstance(statuses, list) and all(
+            status == "success" for status in statuses
+        )
+
+
+async def measure(
+    operations: list[Callable[[], Awaitable[bool]]], messages_per_operation: int = 1
+) -> dict[str, float]:
+    """Run operations of every client concurrently and summarize latencies."""
+    latencies: list[float] = []
+    errors = 0
+
+    async def run_sequentially(client_operations) -> None:
+        nonlocal errors
+        for operation in client_operations:
+            started = time.perf_counter()
+            try:
+                successful = await operation()
+            except socketio.exceptions.TimeoutError:
+                successful = False
+            latencies.append(time.perf_counter() - started)
+            errors += not successful
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_sequentially(ops) for ops in operations))
+    elapsed = time.perf_counter() - started
+    quantiles = (
+        statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    )
+    return {
+        "operations": len(latencies),
+        "errors": errors,
+        "messages_per_second": len(latencies) * messages_per_operation / elapsed,
+        "latency_p50_ms": quantiles[49] * 1000,
+        "latency_p99_ms": quantiles[98] * 1000,
+    }
+
+
+async def run_benchmark(app: Any, args: argparse.Namespace) -> dict[str, Any]:
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    url = f"http://127.0.0.1:{listener.getsockname()[1]}"
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning"))
+    server_task = asyncio.create_task(server.serve(sockets=[listener]))
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    clients = [SimulatedClient(f"user-{i}", args.key_size) for i in range(args.clients)]
+    receivers = clients[1:] + clients[:1]
+    await asyncio.gather(*(client.connect(url) for client in clients))
+    results = {
+        "register": await measure([[client.register] for client in clients]),
+        "chatInit": await measure(
+            [
+                [lambda c=client, r=receiver: c.chat_init(r)]
+                for client, receiver in zip(clients, receivers)
+            ]
+        ),
+        "chat": await measure(
+            [
+                [
+                    lambda c=client, r=receiver, n=n: c.chat(r, n)
+                    for n in range(args.messages)
+                ]
+                for client, receiver in zip(clients, receivers)
+            ]
+        ),
+        "chatBatch": await measure(
+            [
+                [
+                    lambda c=client, r=receiver, n=n: c.chat_batch(
+                        r, n, args.batch_size
+                    )
+                    for n in range(0, args.messages, args.batch_size)
+                ]
+                for client, receiver in zip(clients, receivers)
+            ],
+            messages_per_operation=args.batch_size,
+        ),
+    }
+
+    await asyncio.gather(*(client.socket.disconnect() for client in clients))
+    server.should_exit = True
+    await server_task
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--key-size", type=int, default=1024)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        server_public_key, server_private_key = rsa.newkeys(args.key_size)
+        (Path(tmp_dir) / "id_rsa.pub").write_bytes(server_public_key.save_pkcs1())
+        (Path(tmp_dir) / "id_rsa").write_bytes(server_private_key.save_pkcs1())
+        # Settings are read when the server module is imported
+        os.environ.update(
+            {
+                "SQLITE_DB_PATH": str(Path(tmp_dir) / "benchmark.db"),
+                "HOST_ADDRESS": "127.0.0.1",
+                "HOST_PORT": "0",
+                "SERVER_PUBLIC_KEY_PATH": str(Path(tmp_dir) / "id_rsa.pub"),
+                "SERVER_PRIVATE_KEY_PATH": str(Path(tmp_dir) / "id_rsa"),
+            }
+        )
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+        # Measure the server's capacity, not its rate limits
+        for group in ("AUTH", "QUERY", "CHAT"):
+            os.environ.setdefault(f"RATE_LIMIT_{group}_PER_SECOND", "0")
+        server = importlib.import_module("sdex_server.main")
+        results = asyncio.run(run_benchmark(server.create_app(), args))
+
+    report = {
+        "config": {
+            "clients": args.clients,
+            "messages_per_client": args.messages,
+            "batch_size": args.batch_size,
+            "key_size": args.key_size,
+            "python": sys.version.split()[0],
+        },
+        "scenarios": results,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        args.output.write_text(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
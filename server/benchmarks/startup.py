@@ -0,0 +1,139 @@
+"""Measure how fast a worker starts and answers its first requests.
+
+Every run starts a fresh interpreter against a temporary database, so imports
+and caches are cold. The run reports the time of importing the server module,
+creating the app with create_app, running its lifespan startup until the server
+accepts connections, and the latency of the first and the second request of a
+kind: a /metrics scrape and, for a registered client, a "checkKey" query which
+hits the database. The first registration, verified by a worker process, is
+timed as well. Medians of all runs are printed as JSON.
+
+Usage:
+    poetry run python benchmarks/startup.py [--runs 5] [--key-size 1024]
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+from typing import Any
+
+import rsa
+import uvicorn
+from socketio_load import SimulatedClient
+
+
+def scrape_metrics(url: str) -> None:
+    with urllib.request.urlopen(f"{url}/metrics") as response:
+        response.read()
+
+
+async def timed(operation) -> float:
+    started = time.perf_counter()
+    await operation()
+    return time.perf_counter() - started
+
+
+async def serve(app: Any, key_size: int) -> dict[str, float]:
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    url = f"http://127.0.0.1:{listener.getsockname()[1]}"
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning"))
+    started = time.perf_counter()
+    server_task = asyncio.create_task(server.serve(sockets=[listener]))
+    while not server.started:
+        await asyncio.sleep(0.001)
+    timings = {"startup_ms": time.perf_counter() - started}
+
+    loop = asyncio.get_running_loop()
+    for kind in ("first", "second"):
+        timings[f"metrics_{kind}_ms"] = await timed(
+            lambda: loop.run_in_executor(None, scrape_metrics, url)
+        )
+    client = SimulatedClient("user", key_size)
+    await client.connect(url)
+    timings["register_first_ms"] = await timed(client.register)
+    for kind in ("first", "second"):
+        timings[f"check_key_{kind}_ms"] = await timed(
+            lambda: client.socket.call("checkKey", client.public_key)
+        )
+    await client.socket.disconnect()
+
+    server.should_exit = True
+    await server_task
+    return timings
+
+
+def run_worker(key_size: int) -> None:
+    """Start the server in this process and print its timings as JSON."""
+    started = time.perf_counter()
+    server = importlib.import_module("sdex_server.main")
+    imported = time.perf_counter()
+    app = server.create_app()
+    created = time.perf_counter()
+    timings = {
+        "import_ms": imported - started,
+        "create_app_ms": created - imported,
+        **asyncio.run(serve(app, key_size)),
+    }
+    print(json.dumps({name: value * 1000 for name, value in timings.items()}))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--key-size", type=int, default=1024)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        run_worker(args.key_size)
+        return
+
+    runs = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        server_public_key, server_private_key = rsa.newkeys(2048)
+        (Path(tmp_dir) / "id_rsa.pub").write_bytes(server_public_key.save_pkcs1())
+        (Path(tmp_dir) / "id_rsa").write_bytes(server_private_key.save_pkcs1())
+        env = {
+            **os.environ,
+            "HOST_ADDRESS": "127.0.0.1",
+            "HOST_PORT": "0",
+            "SERVER_PUBLIC_KEY_PATH": str(Path(tmp_dir) / "id_rsa.pub"),
+            "SERVER_PRIVATE_KEY_PATH": str(Path(tmp_dir) / "id_rsa"),
+        }
+        env.setdefault("LOG_LEVEL", "WARNING")
+        for run in range(args.runs):
+            env["SQLITE_DB_PATH"] = str(Path(tmp_dir) / f"startup-{run}.db")
+            output = subprocess.run(
+                [sys.executable, __file__, "--worker", f"--key-size={args.key_size}"],
+                env=env,
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            runs.append(json.loads(output.splitlines()[-1]))
+
+    report = {
+        "config": {
+            "runs": args.runs,
+            "key_size": args.key_size,
+            "python": sys.version.split()[0],
+        },
+        "median": {
+            name: round(statistics.median(run[name] for run in runs), 2)
+            for name in runs[0]
+        },
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
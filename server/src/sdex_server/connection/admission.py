@@ -0,0 +1,56 @@
+import time
+
+from sdex_server.messages import TOO_MANY_CONNECTIONS_DROP_CONNECTION_MESSAGE
+
+
+class ConnectionAdmission:
+    """Decides which sockets may connect to this worker and how long they may stay.
+
+    At most `max_connections` sockets may be connected at a time. Sockets which
+    don't authenticate within `deadline_seconds` of connecting are returned by
+    `expired`, so they can be disconnected. The public key a client connects with
+    isn't verified yet, so it isn't counted here. A user has one session, the
+    presence registry keeps the socket which authenticated with the key last.
+    """
+
+    def __init__(self, max_connections: int, deadline_seconds: float) -> None:
+        self.max_connections = max_connections
+        self.deadline_seconds = deadline_seconds
+        self._connections: set[str] = set()
+        # Sids waiting for authentication, in the order of their deadlines
+        self._unauthenticated: dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._connections)
+
+    def admit(self, sid: str) -> str | None:
+        """Register the connecting sid.
+
+        Returns the reason to refuse the connection or None if it's admitted.
+        """
+        if len(self._connections) >= self.max_connections:
+            return TOO_MANY_CONNECTIONS_DROP_CONNECTION_MESSAGE
+        self._connections.add(sid)
+        self._unauthenticated[sid] = time.monotonic() + self.deadline_seconds
+        return None
+
+    def authenticated(self, sid: str) -> None:
+        """Stop the deadline of the sid."""
+        self._unauthenticated.pop(sid, None)
+
+    def release(self, sid: str) -> None:
+        """Forget the disconnected sid."""
+        self._connections.discard(sid)
+        self._unauthenticated.pop(sid, None)
+
+    def expired(self) -> list[str]:
+        """Take sids which didn't authenticate before their deadline."""
+        now = time.monotonic()
+        expired = []
+        for sid, deadline in self._unauthenticated.items():
+            if deadline > now:
+                break
+            expired.append(sid)
+        for sid in expired:
+            del self._unauthenticated[sid]
+        return expired
@@ -0,0 +1,196 @@
+import asyncio
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Coroutine
+
+from fastapi_socketio import SocketManager
+from loguru import logger
+from socketio.exceptions import TimeoutError
+
+from sdex_server.logger import sampled_logger
+from sdex_server.type_definitions import ResponseStatusType
+
+
+@dataclass
+class Transfer:
+    upload_id: str
+    sender_sid: str
+    receiver_sid: str
+    size: int
+    received: int = 0
+    next_index: int = 0
+    in_flight: int = 0
+    timer: asyncio.TimerHandle | None = field(default=None, repr=False)
+
+
+class AttachmentRelay:
+    """Relays attachments from senders to receivers in binary chunks.
+
+    The sender starts a transfer announcing the attachment's size, then sends
+    numbered chunks with the upload id and finally ends the transfer. Every
+    chunk is forwarded to the receiver as soon as it arrives and the sender's
+    ack waits for the receiver's ack. At most `window` chunks of a transfer may
+    wait for the receiver, further chunks are refused with the "busy" status
+    until earlier ones are acknowledged, so memory held by a transfer doesn't
+    depend on the attachment's size. Transfers idle for longer than `timeout`
+    seconds are aborted.
+    """
+
+    def __init__(
+        self,
+        socket_manager: SocketManager,
+        max_transfers: int,
+        max_size: int,
+        window: int,
+        timeout: float,
+    ) -> None:
+        self.socket_manager = socket_manager
+        self.max_transfers = max_transfers
+        self.max_size = max_size
+        self.window = window
+        self.timeout = timeout
+        self._transfers: dict[str, Transfer] = {}
+        # Keeps references to abort tasks so they aren't garbage collected
+        self._tasks: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._transfers)
+
+    async def start(
+        self, sender_sid: str, receiver_sid: str, size: int, metadata: dict[str, Any]
+    ) -> str | None:
+        """Announce the attachment to the receiver.
+
+        Returns id of the upload or None if the attachment is too large, too many
+        transfers are in progress or the receiver didn't accept it.
+        """
+        if size > self.max_size:
+            logger.info("Attachment too large. Rejecting the transfer.")
+            return None
+        if len(self._transfers) >= self.max_transfers:
+            logger.info("Too many attachment transfers. Rejecting the transfer.")
+            return None
+        transfer = Transfer(
+            upload_id=uuid.uuid4().hex,
+            sender_sid=sender_sid,
+            receiver_sid=receiver_sid,
+            size=size,
+        )
+        self._transfers[transfer.upload_id] = transfer
+        self._touch(transfer)
+        accepted = await self._call(
+            "attachmentStart",
+            {**metadata, "uploadId": transfer.upload_id, "size": size},
+            receiver_sid,
+        )
+        if not accepted:
+            logger.info("Receiver didn't accept the attachment.")
+            self._remove(transfer.upload_id)
+            return None
+        return transfer.upload_id
+
+    async def relay(
+        self, sender_sid: str, upload_id: str, index: int, chunk: bytes
+    ) -> ResponseStatusType:
+        """Forward the chunk of the attachment to the receiver.
+
+        Chunks must be sent in order. Returns "busy" if too many chunks of the
+        transfer wait for the receiver, the same chunk may be sent again later.
+        """
+        transfer = self._transfers.get(upload_id, None)
+        if not transfer or transfer.sender_sid != sender_sid:
+            logger.info("Unknown upload id. Rejecting the chunk.")
+            return "error"
+        if index != transfer.next_index:
+            logger.info("Chunk out of order. Rejecting the chunk.")
+            return "error"
+        if transfer.received + len(chunk) > transfer.size:
+            logger.info("Chunk beyond the attachment's size. Rejecting the chunk.")
+            return "error"
+        if transfer.in_flight >= self.window:
+            sampled_logger.info("Transfer window full. Refusing the chunk.")
+            return "busy"
+        transfer.next_index += 1
+        transfer.received += len(chunk)
+        transfer.in_flight += 1
+        self._touch(transfer)
+        try:
+            acknowledged = await self._call(
+                "attachmentChunk",
+                {"uploadId": upload_id, "index": index, "data": chunk},
+                transfer.receiver_sid,
+            )
+        finally:
+            transfer.in_flight -= 1
+        if not acknowledged:
+            logger.info(f"Receiver didn't acknowledge a chunk of {upload_id}.")
+            await self.abort(upload_id)
+            return "error"
+        return "success"
+
+    async def finish(self, sender_sid: str, upload_id: str) -> ResponseStatusType:
+        """End the transfer after all chunks were acknowledged by the receiver."""
+        transfer = self._transfers.get(upload_id, None)
+        if not transfer or transfer.sender_sid != sender_sid:
+            logger.info("Unknown upload id. Ignoring the request.")
+            return "error"
+        if transfer.received != transfer.size or transfer.in_flight:
+            logger.info("Attachment not fully relayed. Ignoring the request.")
+            return "error"
+        self._remove(upload_id)
+        acknowledged = await self._call(
+            "attachmentEnd", {"uploadId": upload_id}, transfer.receiver_sid
+        )
+        return "success" if acknowledged else "error"
+
+    async def abort(self, upload_id: str) -> None:
+        """Stop the transfer and tell both clients to discard the attachment."""
+        transfer = self._remove(upload_id)
+        if not transfer:
+            return
+        for sid in (transfer.sender_sid, transfer.receiver_sid):
+            await self.socket_manager.emit(
+                "attachmentAbort", {"uploadId": upload_id}, to=sid
+            )
+
+    async def drop(self, sid: str) -> None:
+        """Abort transfers from or to the disconnected client."""
+        upload_ids = [
+            transfer.upload_id
+            for transfer in self._transfers.values()
+            if sid in (transfer.sender_sid, transfer.receiver_sid)
+        ]
+        for upload_id in upload_ids:
+            await self.abort(upload_id)
+
+    async def _call(self, event: str, data: dict[str, Any], to: str) -> bool:
+        try:
+            response = await self.socket_manager.call(
+                event, data, to=to, timeout=self.timeout
+            )
+        except TimeoutError:
+            logger.error(f'Timeout while waiting for the receiver\'s "{event}" ack.')
+            return False
+        return bool(response)
+
+    def _touch(self, transfer: Transfer) -> None:
+        if transfer.timer:
+            transfer.timer.cancel()
+        transfer.timer = asyncio.get_running_loop().call_later(
+            self.timeout, self._timed_out, transfer.upload_id
+        )
+
+    def _timed_out(self, upload_id: str) -> None:
+        logger.info(f"Transfer {upload_id} idle for too long. Aborting it.")
+        self._spawn(self.abort(upload_id))
+
+    def _spawn(self, coroutine: Coroutine[Any, Any, None]) -> None:
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _remove(self, upload_id: str) -> Transfer | None:
+        transfer = self._transfers.pop(upload_id, None)
+        if transfer and transfer.timer:
+            transfer.timer.cancel()
+        return transfer
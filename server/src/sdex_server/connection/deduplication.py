@@ -0,0 +1,147 @@
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Collection, Generic, Sequence, TypeVar
+
+from sdex_server.metrics import DEDUPLICATED_MESSAGES
+
+T = TypeVar("T")
+
+
+@dataclass
+class Outcome(Generic[T]):
+    # Resolved with the outcome, retries of an unfinished delivery wait for it
+    result: asyncio.Future[T]
+    expires_at: float = float("inf")
+
+
+class DeliveryDeduplicator:
+    """Remembers outcomes of deliveries of messages with client-supplied ids.
+
+    A client which didn't get an answer in time sends the message again with the
+    same id. Retries of a message still being delivered wait for that delivery
+    and retries of a delivered one get the remembered outcome, so the receiver
+    gets the message once. Outcomes listed in `retryable` aren't remembered, the
+    next retry delivers the message again, as does a retry waiting for a delivery
+    which was cancelled. At most `max_entries` outcomes are kept for
+    `ttl_seconds` each, the oldest ones are forgotten first.
+    """
+
+    def __init__(
+        self, max_entries: int, ttl_seconds: float, retryable: Collection[Any] = ()
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.retryable = retryable
+        self._outcomes: OrderedDict[tuple[str, str], Outcome[Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._outcomes)
+
+    async def deliver_once(
+        self, key: tuple[str, str], deliver: Callable[[], Awaitable[T]]
+    ) -> T:
+        """Deliver the message with the key unless it was already delivered.
+
+        The key is the sender's public key and the message id. Returns the
+        outcome of the delivery.
+        """
+
+        async def deliver_message(indexes: list[int]) -> list[T]:
+            return [await deliver()]
+
+        (outcome,) = await self.deliver_each_once([key], deliver_message)
+        return outcome
+
+    async def deliver_each_once(
+        self,
+        keys: Sequence[tuple[str, str] | None],
+        deliver: Callable[[list[int]], Awaitable[list[T]]],
+    ) -> list[T]:
+        """Deliver a batch of messages, those with a key at most once.
+
+        `deliver` gets indexes of the messages which need delivering and returns
+        their outcomes in the same order. Messages without a key are always
+        delivered. Returns outcomes of all messages. A retry whose first delivery
+        was cancelled delivers the message again.
+        """
+        outcomes: list[T | None] = [None] * len(keys)
+        pending = list(range(len(keys)))
+        while pending:
+            now = time.monotonic()
+            claimed: dict[int, Outcome[T]] = {}
+            waiting: dict[int, Outcome[T]] = {}
+            for index in pending:
+                key = keys[index]
+                outcome = self._outcomes.get(key, None) if key else None
+                if outcome and outcome.expires_at > now:
+                    DEDUPLICATED_MESSAGES.inc()
+                    waiting[index] = outcome
+                elif key:
+                    claimed[index] = self._claim(key, now)
+            delivering = [index for index in pending if index not in waiting]
+            if delivering:
+                await self._deliver(keys, delivering, claimed, deliver, outcomes)
+
+            pending = []
+            for index, outcome in waiting.items():
+                try:
+                    outcomes[index] = await asyncio.shield(outcome.result)
+                except asyncio.CancelledError:
+                    if not outcome.result.cancelled():
+                        raise
+                    # The first delivery was cancelled, deliver the message again
+                    pending.append(index)
+        return outcomes  # type: ignore
+
+    async def _deliver(
+        self,
+        keys: Sequence[tuple[str, str] | None],
+        delivering: list[int],
+        claimed: dict[int, Outcome[T]],
+        deliver: Callable[[list[int]], Awaitable[list[T]]],
+        outcomes: list[T | None],
+    ) -> None:
+        try:
+            results = await deliver(delivering)
+        except BaseException as e:
+            for index, outcome in claimed.items():
+                self._forget(keys[index], outcome)  # type: ignore
+                if isinstance(e, asyncio.CancelledError):
+                    # Retries waiting for the outcome deliver the message again
+                    outcome.result.cancel()
+                else:
+                    outcome.result.set_exception(e)
+                    # Retrieved, as there may be no retries waiting for it
+                    outcome.result.exception()
+            raise
+        expires_at = time.monotonic() + self.ttl_seconds
+        for index, result in zip(delivering, results):
+            outcomes[index] = result
+            outcome = claimed.get(index, None)
+            if not outcome:
+                continue
+            outcome.result.set_result(result)
+            if result in self.retryable:
+                self._forget(keys[index], outcome)  # type: ignore
+            else:
+                outcome.expires_at = expires_at
+
+    def _claim(self, key: tuple[str, str], now: float) -> Outcome[Any]:
+        outcome: Outcome[Any] = Outcome(asyncio.get_running_loop().create_future())
+        self._outcomes[key] = outcome
+        self._outcomes.move_to_end(key)
+        self._forget_oldest(now)
+        return outcome
+
+    def _forget(self, key: tuple[str, str], outcome: Outcome[Any]) -> None:
+        if self._outcomes.get(key, None) is outcome:
+            del self._outcomes[key]
+
+    def _forget_oldest(self, now: float) -> None:
+        while self._outcomes:
+            key, oldest = next(iter(self._outcomes.items()))
+            if len(self._outcomes) <= self.max_entries and oldest.expires_at > now:
+                return
+            del self._outcomes[key]
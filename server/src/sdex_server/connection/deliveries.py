@@ -0,0 +1,126 @@
+import asyncio
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Coroutine
+
+from fastapi_socketio import SocketManager
+from loguru import logger
+
+
+@dataclass
+class PendingDelivery:
+    delivery_id: str
+    sender_sid: str
+    receiver_sid: str
+    data: dict[str, Any]
+    attempts: int = 0
+    timer: asyncio.TimerHandle | None = field(default=None, repr=False)
+
+
+class PendingDeliveries:
+    """Messages forwarded to receivers whose acknowledgement hasn't arrived yet.
+
+    Forwarding doesn't block the sender. The message is emitted to the receiver
+    and, when the receiver acknowledges it, a "delivered" receipt with the
+    delivery id is emitted back to the sender. A delivery which isn't acknowledged
+    within `timeout` seconds is re-sent up to `max_retries` times before the
+    sender gets a receipt with the "error" status. Every attempt carries the same
+    "deliveryId", so a receiver whose ack was lost or late can skip the copies of
+    a message it already got.
+    """
+
+    def __init__(
+        self,
+        socket_manager: SocketManager,
+        max_pending: int,
+        timeout: float,
+        max_retries: int,
+    ) -> None:
+        self.socket_manager = socket_manager
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._pending: dict[str, PendingDelivery] = {}
+        # Keeps references to retry tasks so they aren't garbage collected
+        self._tasks: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    async def start(
+        self, sender_sid: str, receiver_sid: str, data: dict[str, Any]
+    ) -> str | None:
+        """Start delivering the message.
+
+        Returns id of the delivery or None if too many deliveries are pending.
+        """
+        if len(self._pending) >= self.max_pending:
+            logger.info("Too many pending deliveries. Rejecting the message.")
+            return None
+        delivery = PendingDelivery(
+            delivery_id=uuid.uuid4().hex,
+            sender_sid=sender_sid,
+            receiver_sid=receiver_sid,
+            data=data,
+        )
+        self._pending[delivery.delivery_id] = delivery
+        await self._send(delivery)
+        return delivery.delivery_id
+
+    async def _send(self, delivery: PendingDelivery) -> None:
+        delivery.attempts += 1
+
+        async def acknowledged(response: Any = None) -> None:
+            await self._finish(delivery.delivery_id, bool(response))
+
+        await self.socket_manager.emit(
+            "chat",
+            {**delivery.data, "deliveryId": delivery.delivery_id},
+            to=delivery.receiver_sid,
+            callback=acknowledged,
+        )
+        delivery.timer = asyncio.get_running_loop().call_later(
+            self.timeout, self._timed_out, delivery.delivery_id
+        )
+
+    async def drop(self, sid: str) -> None:
+        """Stop deliveries from or to the disconnected client.
+
+        Senders of messages to the client get a receipt with the "error" status
+        right away. Deliveries of the client's own messages are forgotten.
+        """
+        for delivery in list(self._pending.values()):
+            if delivery.receiver_sid == sid:
+                await self._finish(delivery.delivery_id, False)
+            elif delivery.sender_sid == sid:
+                self._pending.pop(delivery.delivery_id)
+                if delivery.timer:
+                    delivery.timer.cancel()
+
+    def _timed_out(self, delivery_id: str) -> None:
+        delivery = self._pending.get(delivery_id, None)
+        if not delivery:
+            return
+        if delivery.attempts <= self.max_retries:
+            logger.info(f"Delivery {delivery_id} timed out. Re-sending the message.")
+            self._spawn(self._send(delivery))
+        else:
+            logger.error(f"Delivery {delivery_id} timed out. Giving up.")
+            self._spawn(self._finish(delivery_id, False))
+
+    def _spawn(self, coroutine: Coroutine[Any, Any, None]) -> None:
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _finish(self, delivery_id: str, delivered: bool) -> None:
+        delivery = self._pending.pop(delivery_id, None)
+        if not delivery:
+            return
+        if delivery.timer:
+            delivery.timer.cancel()
+        await self.socket_manager.emit(
+            "delivered",
+            {"deliveryId": delivery_id, "status": "success" if delivered else "error"},
+            to=delivery.sender_sid,
+        )
@@ -0,0 +1,139 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Callable, Coroutine
+
+from fastapi_socketio import SocketManager
+from loguru import logger
+
+
+@dataclass
+class Receiver:
+    slots: asyncio.Semaphore
+    queued: int = 0
+    sending: int = 0
+    on_drained: Callable[[], Coroutine[Any, Any, None]] | None = field(
+        default=None, repr=False
+    )
+
+
+class OutboundQueues:
+    """Bounded queues of events waiting to be delivered to receivers.
+
+    Every receiver gets at most `max_in_flight` events at a time, further events
+    wait in the receiver's queue in the order they were sent. When `max_queued`
+    events already wait, new ones are refused, so a slow receiver can't make the
+    server buffer an unbounded number of messages and doesn't delay deliveries
+    to other receivers. A receiver's state is dropped once its queue is empty.
+
+    Events refused this way may be spilled to a slower store and flushed to the
+    receiver later, see `spill`.
+    """
+
+    def __init__(
+        self, socket_manager: SocketManager, max_queued: int, max_in_flight: int
+    ) -> None:
+        self.socket_manager = socket_manager
+        self.max_queued = max_queued
+        self.max_in_flight = max_in_flight
+        self._receivers: dict[str, Receiver] = {}
+        # Receivers with spilled events, mapped to whether more were spilled
+        # since their flush started
+        self._spilled: dict[str, bool] = {}
+        # Keeps references to drain callbacks so they aren't garbage collected
+        self._tasks: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return sum(
+            receiver.queued + receiver.sending for receiver in self._receivers.values()
+        )
+
+    async def send(
+        self, receiver_sid: str, event: str, data: Any, flushing: bool = False
+    ) -> bool | None:
+        """Deliver the event to the receiver and wait for their ack.
+
+        Returns None without sending the event if the receiver's queue is full or
+        their spilled events are not flushed yet, unless the event is `flushing`
+        them. Raises TimeoutError if the receiver doesn't acknowledge the event.
+        """
+        if receiver_sid in self._spilled and not flushing:
+            return None
+        receiver = self._receivers.get(receiver_sid, None)
+        if not receiver:
+            receiver = Receiver(asyncio.Semaphore(self.max_in_flight))
+            self._receivers[receiver_sid] = receiver
+        elif receiver.queued >= self.max_queued:
+            logger.info(f"Outbound queue of sid={receiver_sid} is full.")
+            return None
+        receiver.queued += 1
+        try:
+            await receiver.slots.acquire()
+        except asyncio.CancelledError:
+            receiver.queued -= 1
+            self._release(receiver_sid, receiver)
+            raise
+        receiver.queued -= 1
+        receiver.sending += 1
+        try:
+            return await self.socket_manager.call(event, data, to=receiver_sid)
+        finally:
+            receiver.sending -= 1
+            receiver.slots.release()
+            self._release(receiver_sid, receiver)
+
+    def after_drained(
+        self, receiver_sid: str, callback: Callable[[], Coroutine[Any, Any, None]]
+    ) -> bool:
+        """Run the callback once all events queued for the receiver are delivered.
+
+        Returns False if a callback is already waiting for the receiver's queue.
+        """
+        receiver = self._receivers.get(receiver_sid, None)
+        if not receiver:
+            self._spawn(callback())
+            return True
+        if receiver.on_drained:
+            return False
+        receiver.on_drained = callback
+        return True
+
+    def spill(
+        self, receiver_sid: str, flush: Callable[[], Coroutine[Any, Any, None]]
+    ) -> None:
+        """Flush events spilled for the receiver once their queue drains.
+
+        Until the flush finishes, further events for the receiver are refused, so
+        they are spilled behind the earlier ones instead of overtaking them. The
+        flush sends spilled events with `flushing` and runs again if more events
+        were spilled while it was running.
+        """
+        if receiver_sid in self._spilled:
+            self._spilled[receiver_sid] = True
+            return
+        self._spilled[receiver_sid] = False
+
+        async def flush_spilled() -> None:
+            try:
+                while True:
+                    self._spilled[receiver_sid] = False
+                    await flush()
+                    if not self._spilled[receiver_sid]:
+                        return
+            finally:
+                del self._spilled[receiver_sid]
+
+        if not self.after_drained(receiver_sid, flush_spilled):
+            del self._spilled[receiver_sid]
+
+    def _release(self, receiver_sid: str, receiver: Receiver) -> None:
+        if receiver.queued or receiver.sending:
+            return
+        if self._receivers.get(receiver_sid, None) is receiver:
+            del self._receivers[receiver_sid]
+        if receiver.on_drained:
+            self._spawn(receiver.on_drained())
+
+    def _spawn(self, coroutine: Coroutine[Any, Any, None]) -> None:
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
@@ -1,13 +1,50 @@
-from typing import Any
+"""Validators of payloads sent by clients.
+
+Validators return the payload parsed with its schema from `payload_schemas`, or
+None if the payload is invalid.
+"""
+from typing import Any, TypeVar
+
+from pydantic import ValidationError
+
+from sdex_server.connection import payload_schemas
+from sdex_server.connection.payload_schemas import (
+    AttachmentChunkPayload,
+    AttachmentEndPayload,
+    AttachmentStartPayload,
+    ChatFanOutPayload,
+    ChatInitPayload,
+    ChatPayload,
+    ConnectPayload,
+    Payload,
+    RegisterFollowUpPayload,
+    SyncDirectoryPayload,
+    UpdatePublicKeyPayload,
+)
+
+P = TypeVar("P", bound=Payload)
+
+
+def _parse(schema: type[P], data: Any) -> P | None:
+    if not isinstance(data, dict):
+        return None
+    try:
+        return schema.parse_obj(data)
+    except ValidationError:
+        return None
 
 
-def validate_connect_payload(data: Any) -> bool:
-    """Validate the payload for user connection."""
-    if not isinstance(data, dict):
-        return False
-    if not data.get("publicKey", None):
-        return False
-    return True
+def _is_public_key(data: Any) -> bool:
+    return isinstance(data, str) and 0 < len(data) <= payload_schemas.LIMITS.public_key
+
+
+def validate_connect_payload(data: Any) -> ConnectPayload | None:
+    """Validate the payload for user connection.
+
+    The payload may contain a resumption ticket issued after earlier successful
+    authentication.
+    """
+    return _parse(ConnectPayload, data)
 
 
 def validate_register_init_payload(data: Any) -> bool:
@@ -17,46 +54,84 @@ def validate_register_init_payload(data: Any) -> bool:
     return True
 
 
-def validate_register_follow_up_payload(data: Any) -> bool:
+def validate_register_follow_up_payload(data: Any) -> RegisterFollowUpPayload | None:
     """Validate the payload for user registration."""
-    if not isinstance(data, dict):
-        return False
-    if not data.get("login", None):
-        return False
-    if not data.get("publicKey", None):
-        return False
-    if not data.get("signature", None):
-        return False
-    return True
+    return _parse(RegisterFollowUpPayload, data)
 
 
-def validate_chat_payload(data: Any) -> bool:
+def validate_chat_payload(data: Any) -> ChatPayload | None:
     """Validate the payload with sent message."""
-    if not isinstance(data, dict):
-        return False
-    if not data.get("publicKeyTo", None):
-        return False
-    if not data.get("publicKeyFrom", None):
-        return False
-    if not data.get("text", None):
-        return False
-    if not data.get("createdAt", None):
-        return False
-    return True
+    return _parse(ChatPayload, data)
 
 
-def validate_check_key_payload(data: Any) -> bool:
+def validate_chat_batch_payload(
+    data: Any, max_size: int
+) -> list[ChatPayload | None] | None:
+    """Validate the payload with a batch of sent messages.
+
+    Messages in the batch are validated separately, so one bad message doesn't
+    reject the whole batch. Bad messages are None in the returned list.
+    """
+    if not isinstance(data, list):
+        return None
+    if not 0 < len(data) <= max_size:
+        return None
+    return [validate_chat_payload(message) for message in data]
+
+
+def validate_chat_fan_out_payload(data: Any, max_size: int) -> ChatFanOutPayload | None:
+    """Validate the payload with a message sent to many recipients.
+
+    Every recipient may appear only once.
+    """
+    if not isinstance(data, dict):
+        return None
+    recipients = data.get("recipients", None)
+    if not isinstance(recipients, list) or not 0 < len(recipients) <= max_size:
+        return None
+    payload = _parse(ChatFanOutPayload, data)
+    if not payload:
+        return None
+    public_keys = {recipient.public_key_to for recipient in payload.recipients}
+    if len(public_keys) != len(payload.recipients):
+        return None
+    return payload
+
+
+def validate_check_key_payload(data: Any) -> str | None:
     """Validate the payload for check key request."""
-    if not isinstance(data, str):
-        return False
-    return True
+    return data if _is_public_key(data) else None
 
 
-def validate_check_online_payload(data: Any) -> bool:
+def validate_check_online_payload(data: Any) -> str | None:
     """Validate the payload for check online request."""
-    if not isinstance(data, str):
-        return False
-    return True
+    return data if _is_public_key(data) else None
+
+
+def validate_public_keys_list_payload(data: Any, max_size: int) -> list[str] | None:
+    """Validate the payload with a list of public keys for bulk presence requests."""
+    if not isinstance(data, list):
+        return None
+    if not 0 < len(data) <= max_size:
+        return None
+    if not all(_is_public_key(public_key) for public_key in data):
+        return None
+    return data
+
+
+def validate_sync_directory_payload(
+    data: Any, max_size: int
+) -> SyncDirectoryPayload | None:
+    """Validate the payload for contact directory sync request.
+
+    Fingerprints are hex encoded SHA-256 digests of users' public keys.
+    """
+    if not isinstance(data, dict):
+        return None
+    fingerprints = data.get("fingerprints", None)
+    if not isinstance(fingerprints, list) or not 0 < len(fingerprints) <= max_size:
+        return None
+    return _parse(SyncDirectoryPayload, data)
 
 
 def validate_check_has_crypto_context(data: Any) -> bool:
@@ -66,25 +141,26 @@ def validate_check_has_crypto_context(data: Any) -> bool:
     return True
 
 
-def validate_chat_init_payload(data: Any) -> bool:
+def validate_chat_init_payload(data: Any) -> ChatInitPayload | None:
     """Validate the payload for chat initialization request."""
-    if not isinstance(data, dict):
-        return False
-    if not data.get("publicKeyFrom", None):
-        return False
-    if not data.get("publicKeyTo", None):
-        return False
-    if not data.get("sessionKeyPartEncrypted", None):
-        return False
-    return True
+    return _parse(ChatInitPayload, data)
 
 
-def validate_update_public_key_payload(data: Any) -> bool:
+def validate_update_public_key_payload(data: Any) -> UpdatePublicKeyPayload | None:
     """Validate the payload for update login request."""
-    if not isinstance(data, dict):
-        return False
-    if not data.get("login", None):
-        return False
-    if not data.get("publicKey", None):
-        return False
-    return True
+    return _parse(UpdatePublicKeyPayload, data)
+
+
+def validate_attachment_start_payload(data: Any) -> AttachmentStartPayload | None:
+    """Validate the payload starting an attachment transfer."""
+    return _parse(AttachmentStartPayload, data)
+
+
+def validate_attachment_chunk_payload(data: Any) -> AttachmentChunkPayload | None:
+    """Validate the payload with a binary chunk of an attachment."""
+    return _parse(AttachmentChunkPayload, data)
+
+
+def validate_attachment_end_payload(data: Any) -> AttachmentEndPayload | None:
+    """Validate the payload ending an attachment transfer."""
+    return _parse(AttachmentEndPayload, data)
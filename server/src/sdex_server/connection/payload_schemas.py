@@ -0,0 +1,186 @@
+"""Schemas of payloads sent by clients with Socket.IO events.
+
+Schemas are pydantic models, so their validators are built once, when the module
+is imported. Fields use snake_case names and the camelCase aliases used by
+clients. Unknown fields are rejected. Strings and bytes longer than the limit
+named by their field's `limit` are rejected before any field is parsed.
+"""
+import functools
+from dataclasses import dataclass
+from typing import Literal
+
+from pydantic import (
+    BaseModel,
+    ConstrainedBytes,
+    ConstrainedInt,
+    ConstrainedStr,
+    Extra,
+    Field,
+    root_validator,
+)
+
+
+@dataclass
+class PayloadLimits:
+    """Maximum lengths of strings and chunks of attachments in payloads."""
+
+    public_key: int = 4096
+    text: int = 65536
+    media: int = 1000000
+    field: int = 2048
+    chunk: int = 65536
+
+
+# Limits used by all schemas, configured by the server on startup
+LIMITS = PayloadLimits()
+
+
+def configure_payload_limits(limits: PayloadLimits) -> None:
+    """Replace the limits used by all schemas."""
+    global LIMITS
+    LIMITS = limits
+
+
+class NonEmptyStr(ConstrainedStr):
+    strict = True
+    min_length = 1
+
+
+class Fingerprint(ConstrainedStr):
+    """Hex encoded SHA-256 digest of a public key."""
+
+    strict = True
+    regex = r"^[0-9a-fA-F]{64}$"
+
+
+class Version(ConstrainedInt):
+    strict = True
+    ge = 0
+
+
+class Index(ConstrainedInt):
+    strict = True
+    ge = 0
+
+
+class Size(ConstrainedInt):
+    strict = True
+    gt = 0
+
+
+class Chunk(ConstrainedBytes):
+    strict = True
+    min_length = 1
+
+
+@functools.cache
+def _limited_fields(schema: type[BaseModel]) -> tuple[tuple[str, str], ...]:
+    """Aliases of the schema's fields with a size limit and names of the limits."""
+    return tuple(
+        (field.alias, field.field_info.extra["limit"])
+        for field in schema.__fields__.values()
+        if "limit" in field.field_info.extra
+    )
+
+
+class Payload(BaseModel):
+    """Base class of payload schemas."""
+
+    class Config:
+        extra = Extra.forbid
+        allow_mutation = False
+        allow_population_by_field_name = True
+
+    @root_validator(pre=True)
+    def check_sizes(cls, values: dict) -> dict:
+        for alias, limit in _limited_fields(cls):
+            value = values.get(alias, None)
+            if isinstance(value, (str, bytes)) and len(value) > getattr(LIMITS, limit):
+                raise ValueError(f"{alias} is longer than {getattr(LIMITS, limit)}.")
+        return values
+
+    def forwarded(self) -> dict:
+        """Payload in the form sent by the client, to forward it to another one."""
+        return self.dict(by_alias=True, exclude_unset=True)
+
+
+class ConnectPayload(Payload):
+    public_key: NonEmptyStr = Field(alias="publicKey", limit="public_key")
+    # Resumption ticket issued after earlier successful authentication
+    ticket: NonEmptyStr | None = Field(None, limit="field")
+
+
+class RegisterFollowUpPayload(Payload):
+    login: NonEmptyStr = Field(limit="field")
+    public_key: NonEmptyStr = Field(alias="publicKey", limit="public_key")
+    signature: NonEmptyStr = Field(limit="field")
+
+
+class ChatInitPayload(Payload):
+    public_key_from: NonEmptyStr = Field(alias="publicKeyFrom", limit="public_key")
+    public_key_to: NonEmptyStr = Field(alias="publicKeyTo", limit="public_key")
+    session_key_part_encrypted: NonEmptyStr = Field(
+        alias="sessionKeyPartEncrypted", limit="field"
+    )
+
+
+class ChatPayload(Payload):
+    public_key_to: NonEmptyStr = Field(alias="publicKeyTo", limit="public_key")
+    public_key_from: NonEmptyStr = Field(alias="publicKeyFrom", limit="public_key")
+    text: NonEmptyStr = Field(limit="text")
+    created_at: NonEmptyStr = Field(alias="createdAt", limit="field")
+    image: NonEmptyStr | None = Field(None, limit="media")
+    video: NonEmptyStr | None = Field(None, limit="media")
+    audio: NonEmptyStr | None = Field(None, limit="media")
+    # Chosen by the sender and kept when the message is resent, so the server
+    # doesn't deliver a retried message again
+    message_id: NonEmptyStr | None = Field(None, alias="messageId", limit="field")
+
+
+class FanOutRecipient(Payload):
+    public_key_to: NonEmptyStr = Field(alias="publicKeyTo", limit="public_key")
+    # Recipient's part of the message, e.g. key of the body wrapped with the
+    # session key shared with the recipient
+    envelope: NonEmptyStr = Field(limit="field")
+
+
+class ChatFanOutPayload(Payload):
+    public_key_from: NonEmptyStr = Field(alias="publicKeyFrom", limit="public_key")
+    created_at: NonEmptyStr = Field(alias="createdAt", limit="field")
+    # Ciphertext shared by all recipients
+    body: NonEmptyStr = Field(limit="text")
+    image: NonEmptyStr | None = Field(None, limit="media")
+    video: NonEmptyStr | None = Field(None, limit="media")
+    audio: NonEmptyStr | None = Field(None, limit="media")
+    recipients: list[FanOutRecipient]
+
+    def shared(self) -> dict:
+        """Part of the message delivered to every recipient."""
+        return self.dict(by_alias=True, exclude_unset=True, exclude={"recipients"})
+
+
+class SyncDirectoryPayload(Payload):
+    version: Version
+    fingerprints: list[Fingerprint]
+
+
+class UpdatePublicKeyPayload(Payload):
+    login: NonEmptyStr = Field(limit="field")
+    public_key: NonEmptyStr = Field(alias="publicKey", limit="public_key")
+
+
+class AttachmentStartPayload(Payload):
+    public_key_to: NonEmptyStr = Field(alias="publicKeyTo", limit="public_key")
+    kind: Literal["image", "video", "audio"]
+    # Size of the whole encrypted attachment in bytes
+    size: Size
+
+
+class AttachmentChunkPayload(Payload):
+    upload_id: NonEmptyStr = Field(alias="uploadId", limit="field")
+    index: Index
+    data: Chunk = Field(limit="chunk")
+
+
+class AttachmentEndPayload(Payload):
+    upload_id: NonEmptyStr = Field(alias="uploadId", limit="field")
@@ -0,0 +1,325 @@
+"""Registry of connected users shared by Socket.IO handlers.
+
+Handlers only talk to the `PresenceBackend` interface. The in-memory backend keeps
+the state in the worker process. The SQLite backend keeps it in a database file
+shared by all workers on the host, so a worker can find a receiver connected to
+another worker and deliver the message through the Socket.IO client manager.
+"""
+import asyncio
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, TypeVar
+
+import socketio
+
+from sdex_server.connection.sessions import SessionRegistry
+from sdex_server.crypto.fingerprints import fingerprint_public_key
+
+T = TypeVar("T")
+
+
+class PresenceBackend(ABC):
+    """Maps public keys of connected users to their socket ids."""
+
+    @abstractmethod
+    async def bind(self, public_key: str, sid: str) -> None:
+        """Save the public key of a user who connected with the given sid."""
+
+    @abstractmethod
+    async def unbind(self, sid: str) -> None:
+        """Forget everything about a disconnected sid."""
+
+    @abstractmethod
+    async def rebind(self, sid: str, new_public_key: str) -> None:
+        """Change the public key of an already connected sid."""
+
+    @abstractmethod
+    async def get_sid(self, public_key: str) -> str | None:
+        """Get sid of the user with the given public key if they are connected."""
+
+    @abstractmethod
+    async def get_public_key(self, sid: str) -> str | None:
+        """Get public key the user with the given sid connected with."""
+
+    @abstractmethod
+    async def authenticate(self, sid: str) -> None:
+        """Mark the sid as authenticated."""
+
+    @abstractmethod
+    async def is_authenticated(self, sid: str) -> bool:
+        """Check if user with that sid is authenticated on the server."""
+
+    @abstractmethod
+    async def count_sessions(self) -> tuple[int, int]:
+        """Count sids connected to this worker and how many are authenticated."""
+
+    async def is_online(self, public_key: str) -> bool:
+        """Check if the user with given public key is currently connected."""
+        return await self.get_sid(public_key) is not None
+
+    async def are_online(self, public_keys: list[str]) -> list[bool]:
+        """Check which of the users with given public keys are connected."""
+        return [await self.is_online(public_key) for public_key in public_keys]
+
+    def close(self) -> None:
+        """Release resources held by the backend."""
+
+
+class InMemoryPresenceBackend(PresenceBackend):
+    """Presence kept in the memory of a single worker process."""
+
+    def __init__(self) -> None:
+        self.sessions = SessionRegistry()
+
+    async def bind(self, public_key: str, sid: str) -> None:
+        self.sessions.bind(public_key, sid)
+
+    async def unbind(self, sid: str) -> None:
+        self.sessions.unbind(sid)
+
+    async def rebind(self, sid: str, new_public_key: str) -> None:
+        self.sessions.rebind(sid, new_public_key)
+
+    async def get_sid(self, public_key: str) -> str | None:
+        session = self.sessions.get_by_public_key(public_key)
+        return session.sid if session else None
+
+    async def get_public_key(self, sid: str) -> str | None:
+        session = self.sessions.get(sid)
+        return session.public_key if session else None
+
+    async def authenticate(self, sid: str) -> None:
+        self.sessions.authenticate(sid)
+
+    async def is_authenticated(self, sid: str) -> bool:
+        session = self.sessions.get(sid)
+        return session is not None and session.authenticated
+
+    async def count_sessions(self) -> tuple[int, int]:
+        return len(self.sessions), self.sessions.authenticated
+
+
+class SqlitePresenceBackend(PresenceBackend):
+    """Presence kept in a SQLite database shared by all workers on the host.
+
+    Every row remembers the process which owns the connection, so a worker removes
+    its own rows when it shuts down. Rows of workers which died without shutting
+    down are removed when the next worker starts. Queries run on a dedicated
+    thread.
+    """
+
+    def __init__(self, db_path: Path | str) -> None:
+        self.db_path = db_path
+        self.worker_id = os.getpid()
+        self._executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="presence",
+            initializer=self._open_connection,
+        )
+        self._client: sqlite3.Connection
+
+    def _open_connection(self) -> None:
+        self._client = sqlite3.connect(self.db_path, isolation_level=None)
+        self._client.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = OFF;
+            PRAGMA busy_timeout = 5000;
+            CREATE TABLE IF NOT EXISTS sessions
+            (
+                sid                    TEXT    primary key,
+                public_key_fingerprint BLOB    not null unique,
+                public_key             TEXT    not null,
+                authenticated          INTEGER not null default 0,
+                worker_id              INTEGER not null
+            );
+            """
+        )
+        self._forget_dead_workers()
+
+    def _forget_dead_workers(self) -> None:
+        # A previous process with this worker's pid is dead as well
+        dead_workers = [
+            (worker_id,)
+            for (worker_id,) in self._client.execute(
+                "SELECT DISTINCT worker_id FROM sessions;"
+            )
+            if worker_id == self.worker_id or not is_process_running(worker_id)
+        ]
+        self._client.executemany(
+            "DELETE FROM sessions WHERE worker_id = ?;", dead_workers
+        )
+
+    async def _run(self, query: Callable[[sqlite3.Connection], T]) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: query(self._client))
+
+    async def bind(self, public_key: str, sid: str) -> None:
+        def query(client: sqlite3.Connection) -> None:
+            client.execute(
+                """
+                INSERT OR REPLACE INTO sessions
+                    (sid, public_key_fingerprint, public_key, worker_id)
+                VALUES (:sid, :fingerprint, :public_key, :worker_id);
+                """,
+                {
+                    "sid": sid,
+                    "fingerprint": fingerprint_public_key(public_key),
+                    "public_key": public_key,
+                    "worker_id": self.worker_id,
+                },
+            )
+
+        await self._run(query)
+
+    async def unbind(self, sid: str) -> None:
+        await self._run(
+            lambda client: client.execute(
+                "DELETE FROM sessions WHERE sid = :sid;", {"sid": sid}
+            )
+        )
+
+    async def rebind(self, sid: str, new_public_key: str) -> None:
+        def query(client: sqlite3.Connection) -> None:
+            fingerprint = fingerprint_public_key(new_public_key)
+            client.execute("BEGIN;")
+            client.execute(
+                """
+                DELETE FROM sessions
+                WHERE public_key_fingerprint = :fingerprint AND sid != :sid;
+                """,
+                {"fingerprint": fingerprint, "sid": sid},
+            )
+            client.execute(
+                """
+                UPDATE sessions
+                SET public_key_fingerprint = :fingerprint, public_key = :public_key
+                WHERE sid = :sid;
+                """,
+                {"fingerprint": fingerprint, "public_key": new_public_key, "sid": sid},
+            )
+            client.execute("COMMIT;")
+
+        await self._run(query)
+
+    async def get_sid(self, public_key: str) -> str | None:
+        def query(client: sqlite3.Connection) -> str | None:
+            row = client.execute(
+                "SELECT sid FROM sessions WHERE public_key_fingerprint = :fingerprint;",
+                {"fingerprint": fingerprint_public_key(public_key)},
+            ).fetchone()
+            return row[0] if row else None
+
+        return await self._run(query)
+
+    async def are_online(self, public_keys: list[str]) -> list[bool]:
+        fingerprints = [fingerprint_public_key(key) for key in public_keys]
+
+        def query(client: sqlite3.Connection) -> list[bool]:
+            placeholders = ", ".join("?" * len(fingerprints))
+            online = {
+                row[0]
+                for row in client.execute(
+                    "SELECT public_key_fingerprint FROM sessions "
+                    f"WHERE public_key_fingerprint IN ({placeholders});",
+                    fingerprints,
+                )
+            }
+            return [fingerprint in online for fingerprint in fingerprints]
+
+        return await self._run(query)
+
+    async def get_public_key(self, sid: str) -> str | None:
+        def query(client: sqlite3.Connection) -> str | None:
+            row = client.execute(
+                "SELECT public_key FROM sessions WHERE sid = :sid;", {"sid": sid}
+            ).fetchone()
+            return row[0] if row else None
+
+        return await self._run(query)
+
+    async def authenticate(self, sid: str) -> None:
+        await self._run(
+            lambda client: client.execute(
+                "UPDATE sessions SET authenticated = 1 WHERE sid = :sid;", {"sid": sid}
+            )
+        )
+
+    async def is_authenticated(self, sid: str) -> bool:
+        def query(client: sqlite3.Connection) -> bool:
+            row = client.execute(
+                "SELECT authenticated FROM sessions WHERE sid = :sid;", {"sid": sid}
+            ).fetchone()
+            return bool(row and row[0])
+
+        return await self._run(query)
+
+    async def count_sessions(self) -> tuple[int, int]:
+        def query(client: sqlite3.Connection) -> tuple[int, int]:
+            connected, authenticated = client.execute(
+                "SELECT COUNT(*), COALESCE(SUM(authenticated), 0) FROM sessions "
+                "WHERE worker_id = :worker_id;",
+                {"worker_id": self.worker_id},
+            ).fetchone()
+            return connected, authenticated
+
+        return await self._run(query)
+
+    def close(self) -> None:
+        def cleanup() -> None:
+            self._client.execute(
+                "DELETE FROM sessions WHERE worker_id = :worker_id;",
+                {"worker_id": self.worker_id},
+            )
+            self._client.close()
+
+        self._executor.submit(cleanup).result()
+        self._executor.shutdown(wait=True)
+
+
+def is_process_running(pid: int) -> bool:
+    """Check if a process with the pid runs on this host."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # The process exists but belongs to another user
+        return True
+    return True
+
+
+def presence_room(public_key: str) -> str:
+    """Get name of the Socket.IO room with subscribers of the user's presence.
+
+    Rooms are the reverse index from a user to the sids interested in them, which
+    also works across workers when a client manager with a message queue is used.
+    """
+    return f"presence:{fingerprint_public_key(public_key).hex()}"
+
+
+def create_presence_backend(backend: str, db_path: Path | str) -> PresenceBackend:
+    """Create presence backend selected in the settings."""
+    if backend == "memory":
+        return InMemoryPresenceBackend()
+    if backend == "sqlite":
+        return SqlitePresenceBackend(db_path)
+    raise ValueError(f"Unknown presence backend: {backend}.")
+
+
+def create_client_manager(message_queue_url: str | None) -> socketio.AsyncManager:
+    """Create Socket.IO client manager which routes events between workers.
+
+    Without a message queue events can only reach clients connected to the same
+    worker, which is enough when the server runs as a single process.
+    """
+    if not message_queue_url:
+        return socketio.AsyncManager()
+    if message_queue_url.startswith(("redis://", "rediss://", "unix://")):
+        return socketio.AsyncRedisManager(message_queue_url)
+    if message_queue_url.startswith(("amqp://", "amqps://")):
+        return socketio.AsyncAioPikaManager(message_queue_url)
+    raise ValueError(f"Unsupported message queue: {message_queue_url}.")
@@ -0,0 +1,126 @@
+import functools
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, TypeVar
+
+from sdex_server.logger import sampled_logger
+from sdex_server.metrics import THROTTLED_EVENTS
+
+T = TypeVar("T")
+
+
+@dataclass
+class TokenBucket:
+    tokens: float
+    updated: float
+
+
+class RateLimiter:
+    """Limits how often clients may send events, using token buckets.
+
+    Every limited event has a bucket per sid and, once the user authenticated,
+    per public key, so reconnecting doesn't give a client a fresh bucket. A bucket
+    holds up to `burst` tokens and refills with `rate` tokens per second, every
+    event takes one token, or as many as it costs, from each of its buckets. Only
+    the `max_buckets` most recently used buckets are kept, a dropped bucket starts
+    full again.
+    """
+
+    def __init__(self, max_buckets: int) -> None:
+        self.max_buckets = max_buckets
+        self._limits: dict[str, tuple[float, float]] = {}
+        self._buckets: OrderedDict[tuple[str, str], TokenBucket] = OrderedDict()
+        self._public_keys: dict[str, str] = {}
+
+    def limit(self, event: str, rate: float, burst: int) -> None:
+        """Limit the event to `rate` per second with bursts of `burst` events.
+
+        Rate of 0 leaves the event unlimited.
+        """
+        if rate > 0:
+            self._limits[event] = (rate, max(burst, 1))
+        else:
+            self._limits.pop(event, None)
+
+    def bind(self, sid: str, public_key: str) -> None:
+        """Count further events from the sid also against the user's public key."""
+        self._public_keys[sid] = public_key
+
+    def unbind(self, sid: str) -> None:
+        """Forget buckets of the disconnected sid."""
+        self._public_keys.pop(sid, None)
+        for event in self._limits:
+            self._buckets.pop((event, sid), None)
+
+    def allow(self, event: str, sid: str, cost: int = 1) -> bool:
+        """Take `cost` tokens for the event from the sid's buckets if all have them.
+
+        An event costing more than the burst takes the whole burst.
+        """
+        limit = self._limits.get(event, None)
+        if not limit:
+            return True
+        cost = min(cost, limit[1])
+        now = time.monotonic()
+        buckets = [self._refill((event, sid), limit, now)]
+        public_key = self._public_keys.get(sid, None)
+        if public_key:
+            buckets.append(self._refill((event, public_key), limit, now))
+        if any(bucket.tokens < cost for bucket in buckets):
+            return False
+        for bucket in buckets:
+            bucket.tokens -= cost
+        return True
+
+    def _refill(
+        self, key: tuple[str, str], limit: tuple[float, float], now: float
+    ) -> TokenBucket:
+        rate, burst = limit
+        bucket = self._buckets.get(key, None)
+        if not bucket:
+            bucket = self._buckets[key] = TokenBucket(tokens=burst, updated=now)
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+            return bucket
+        bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+        bucket.updated = now
+        self._buckets.move_to_end(key)
+        return bucket
+
+    def limited(
+        self, event: str, rejected: Any, cost: Callable[..., int] | None = None
+    ) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+        """Answer the Socket.IO event with `rejected` when the sid exceeds the limit.
+
+        See `limited` for details.
+        """
+        return limited(lambda: self, event, rejected, cost)
+
+
+def limited(
+    limiter: Callable[[], RateLimiter],
+    event: str,
+    rejected: Any,
+    cost: Callable[..., int] | None = None,
+) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """Answer the Socket.IO event with `rejected` when the sid exceeds the limit.
+
+    `limiter` returns the rate limiter checking the event, it's called on every
+    event, so handlers can be decorated before the limiter is created. The
+    handler isn't called for rejected events. `cost` gets the event's data, which
+    isn't validated yet, and returns how many tokens it takes.
+    """
+
+    def decorator(handler: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        @functools.wraps(handler)
+        async def wrapper(sid: str, *args: Any) -> T:
+            if not limiter().allow(event, sid, cost(*args) if cost else 1):
+                THROTTLED_EVENTS.inc(event)
+                sampled_logger.info('Throttled "{}" event from sid={}.', event, sid)
+                return rejected
+            return await handler(sid, *args)
+
+        return wrapper
+
+    return decorator
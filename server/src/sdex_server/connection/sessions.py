@@ -0,0 +1,100 @@
+import sys
+
+from sdex_server.crypto.fingerprints import fingerprint_public_key
+
+
+class Session:
+    """State of a connected sid."""
+
+    __slots__ = ("sid", "public_key", "fingerprint", "authenticated")
+
+    def __init__(self, sid: str, public_key: str) -> None:
+        self.sid = sid
+        self.public_key = public_key
+        self.fingerprint = fingerprint_public_key(public_key)
+        self.authenticated = False
+
+
+def intern_public_key(public_key: str) -> str:
+    """Get the shared copy of the public key.
+
+    Lookups with the shared copy reuse its cached hash and compare keys by
+    identity instead of comparing hundreds of characters.
+    """
+    return sys.intern(public_key)
+
+
+class SessionRegistry:
+    """Sessions of connected sids indexed by sid and by the user's public key.
+
+    A session record holds everything known about a sid, so checking the sender
+    of a message takes a single lookup. Public keys are interned when a session
+    starts, so all structures keyed by a connected user's key share one copy.
+    Sessions are indexed by the key's fingerprint, so the same key formatted
+    differently finds the same session. The fingerprint is computed once, when
+    the session starts, and lookups with the key text the session was bound with
+    find it without computing the fingerprint again. A public key has at most one
+    session, binding it to another sid drops the previous session.
+    """
+
+    def __init__(self) -> None:
+        self._by_sid: dict[str, Session] = {}
+        self._by_fingerprint: dict[bytes, Session] = {}
+        self._by_public_key: dict[str, Session] = {}
+        self.authenticated = 0
+
+    def __len__(self) -> int:
+        return len(self._by_sid)
+
+    def bind(self, public_key: str, sid: str) -> Session:
+        """Start a session of the user with the public key on the sid."""
+        self.unbind(sid)
+        session = Session(sid, intern_public_key(public_key))
+        previous = self._by_fingerprint.get(session.fingerprint, None)
+        if previous:
+            self._drop(previous)
+        self._by_sid[sid] = session
+        self._by_fingerprint[session.fingerprint] = session
+        self._by_public_key[session.public_key] = session
+        return session
+
+    def unbind(self, sid: str) -> None:
+        """End the session of the sid."""
+        session = self._by_sid.get(sid, None)
+        if session:
+            self._drop(session)
+
+    def rebind(self, sid: str, new_public_key: str) -> None:
+        """Move the sid's session to the user's new public key."""
+        session = self._by_sid.get(sid, None)
+        if not session:
+            return
+        authenticated = session.authenticated
+        self.bind(new_public_key, sid)
+        if authenticated:
+            self.authenticate(sid)
+
+    def authenticate(self, sid: str) -> None:
+        """Mark the sid's session as authenticated."""
+        session = self._by_sid.get(sid, None)
+        if session and not session.authenticated:
+            session.authenticated = True
+            self.authenticated += 1
+
+    def get(self, sid: str) -> Session | None:
+        """Get the session of the sid."""
+        return self._by_sid.get(sid, None)
+
+    def get_by_public_key(self, public_key: str) -> Session | None:
+        """Get the session of the user with the public key."""
+        session = self._by_public_key.get(public_key, None)
+        if session:
+            return session
+        return self._by_fingerprint.get(fingerprint_public_key(public_key), None)
+
+    def _drop(self, session: Session) -> None:
+        del self._by_sid[session.sid]
+        del self._by_fingerprint[session.fingerprint]
+        del self._by_public_key[session.public_key]
+        if session.authenticated:
+            self.authenticated -= 1
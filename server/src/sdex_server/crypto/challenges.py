@@ -0,0 +1,86 @@
+import heapq
+import time
+from dataclasses import dataclass
+
+from loguru import logger
+
+from sdex_server.crypto.randomness import generate_challenge
+
+
+@dataclass
+class PendingChallenge:
+    challenge: str
+    expires_at: float
+
+
+class ChallengeManager:
+    """Challenges sent to clients which haven't answered them yet.
+
+    A challenge expires `ttl_seconds` after being issued and is answered at most
+    once. At most `max_pending` challenges are kept at a time, and a sid gets at
+    most `max_issued_per_sid` challenges during its connection, which limits
+    signature guessing and memory used by half-open handshakes.
+    """
+
+    def __init__(
+        self, ttl_seconds: float, max_pending: int, max_issued_per_sid: int
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_pending = max_pending
+        self.max_issued_per_sid = max_issued_per_sid
+        self._pending: dict[str, PendingChallenge] = {}
+        self._issued_count: dict[str, int] = {}
+        # Expiry times of issued challenges. Entries of challenges which were
+        # answered or replaced are skipped when they reach the top of the heap.
+        self._expiry_heap: list[tuple[float, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def issue(self, sid: str) -> str | None:
+        """Get a challenge for the sid.
+
+        A challenge already pending for the sid is sent again. Returns None if the
+        sid used up its challenges or too many challenges are pending.
+        """
+        now = time.monotonic()
+        self._evict_expired(now)
+        if pending := self._pending.get(sid, None):
+            return pending.challenge
+        if self._issued_count.get(sid, 0) >= self.max_issued_per_sid:
+            logger.info(f"Challenge limit reached for sid={sid}.")
+            return None
+        if len(self._pending) >= self.max_pending:
+            logger.warning("Too many pending challenges. Refusing to issue more.")
+            return None
+        pending = PendingChallenge(generate_challenge(), now + self.ttl_seconds)
+        self._pending[sid] = pending
+        self._issued_count[sid] = self._issued_count.get(sid, 0) + 1
+        heapq.heappush(self._expiry_heap, (pending.expires_at, sid))
+        return pending.challenge
+
+    def consume(self, sid: str) -> str | None:
+        """Remove and return the challenge of the sid if it hasn't expired."""
+        pending = self._pending.pop(sid, None)
+        if not pending or pending.expires_at <= time.monotonic():
+            return None
+        return pending.challenge
+
+    def discard(self, sid: str) -> None:
+        """Forget the challenge and issue count of a disconnected sid."""
+        self._pending.pop(sid, None)
+        self._issued_count.pop(sid, None)
+
+    def _evict_expired(self, now: float) -> None:
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            expires_at, sid = heapq.heappop(self._expiry_heap)
+            pending = self._pending.get(sid, None)
+            if pending and pending.expires_at == expires_at:
+                del self._pending[sid]
+        # Stale entries of answered challenges would otherwise pile up until they
+        # expire, so the heap is rebuilt when they outnumber the pending ones
+        if len(self._expiry_heap) > 2 * len(self._pending) + 1024:
+            self._expiry_heap = [
+                (pending.expires_at, sid) for sid, pending in self._pending.items()
+            ]
+            heapq.heapify(self._expiry_heap)
@@ -0,0 +1,28 @@
+import base64
+import binascii
+import hashlib
+
+FINGERPRINT_SIZE = hashlib.sha256().digest_size
+
+
+def normalize_public_key(public_key: str) -> bytes:
+    """Get DER bytes of a PKCS#1 PEM public key.
+
+    Header, footer, line endings and other whitespace don't affect the result, so
+    the same key formatted differently by clients normalizes to the same bytes.
+    Strings which are not valid PEM are normalized to their stripped text.
+    """
+    body = "".join(
+        line.strip()
+        for line in public_key.strip().splitlines()
+        if not line.startswith("-----")
+    )
+    try:
+        return base64.b64decode(body, validate=True)
+    except binascii.Error:
+        return public_key.strip().encode()
+
+
+def fingerprint_public_key(public_key: str) -> bytes:
+    """Get fixed-size fingerprint (SHA-256 of normalized key) of a public key."""
+    return hashlib.sha256(normalize_public_key(public_key)).digest()
@@ -1,8 +1,25 @@
 import secrets
 import string
 
+CHALLENGE_ALPHABET = string.ascii_letters + string.digits
+CHALLENGE_LENGTH = 512
 
-def generate_challenge() -> str:
+# Random bytes are mapped onto the alphabet with bytes.translate. Only bytes below
+# the largest multiple of the alphabet size are kept, so every character is
+# equally likely, and the rest are deleted.
+_ACCEPTED_BYTES = 256 - 256 % len(CHALLENGE_ALPHABET)
+_TRANSLATION_TABLE = bytes(
+    ord(CHALLENGE_ALPHABET[i % len(CHALLENGE_ALPHABET)]) for i in range(256)
+)
+_REJECTED_BYTES = bytes(range(_ACCEPTED_BYTES, 256))
+
+
+def generate_challenge(length: int = CHALLENGE_LENGTH) -> str:
     """Generate a random challenge for the client to authenticate."""
-    alphabet = string.ascii_letters + string.digits
-    return "".join(secrets.choice(alphabet) for i in range(512))  # type: ignore
+    challenge = b""
+    while len(challenge) < length:
+        # Draw a few more bytes than needed to make a second round unlikely
+        missing = length - len(challenge)
+        random_bytes = secrets.token_bytes(missing + missing // 16 + 8)
+        challenge += random_bytes.translate(_TRANSLATION_TABLE, _REJECTED_BYTES)
+    return challenge[:length].decode()
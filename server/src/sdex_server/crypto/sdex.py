@@ -0,0 +1,338 @@
+"""SDEx cipher compatible with `SdexCrypto.ts` of the mobile app.
+
+Lets the server side produce the same cipher text as the app, e.g. to generate
+realistic load or to test interoperability. Hashes are computed by a minimal
+BLAKE3 implementation, because the app derives them with arbitrary bytes as
+the BLAKE3 key derivation context, which BLAKE3 bindings for Python don't accept.
+Hashes which don't depend on each other are computed in NumPy batches, and so
+is the XOR of message blocks with hashes.
+
+The cipher follows `SdexCrypto.calculateMessage` block for block. The app's
+`splitMessageIntoBlocks` only keeps the first `ceil(length / 1024)` blocks of a
+message, which is a bug not reproduced here. Every block is processed, so cipher
+text of messages longer than one block differs from what the app sends.
+"""
+import struct
+from typing import Iterable, Iterator
+
+import numpy as np
+
+MAX_HASH_LENGTH = 32
+# Inputs hashed with BLAKE3 are limited to a single chunk
+MAX_SESSION_KEY_LENGTH = 1024
+
+_MASK = 0xFFFFFFFF
+_BLOCK_LENGTH = 64
+_IV = (
+    0x6A09E667,
+    0xBB67AE85,
+    0x3C6EF372,
+    0xA54FF53A,
+    0x510E527F,
+    0x9B05688C,
+    0x1F83D9AB,
+    0x5BE0CD19,
+)
+_CHUNK_START = 1 << 0
+_CHUNK_END = 1 << 1
+_ROOT = 1 << 3
+_DERIVE_KEY_CONTEXT = 1 << 5
+_DERIVE_KEY_MATERIAL = 1 << 6
+# Compressing fewer blocks is faster one by one than with NumPy
+_MIN_NUMPY_BATCH = 20
+
+
+def _message_schedule() -> list[tuple[int, ...]]:
+    permutation = (2, 6, 3, 10, 7, 0, 4, 13, 1, 11, 12, 5, 9, 14, 15, 8)
+    schedule = [tuple(range(16))]
+    for _ in range(6):
+        schedule.append(tuple(schedule[-1][i] for i in permutation))
+    return schedule
+
+
+# Order of message words in each of the 7 rounds of the compression function
+_MESSAGE_SCHEDULE = _message_schedule()
+
+
+def _g(a, b, c, d, mx, my):
+    a = (a + b + mx) & _MASK
+    d = d ^ a
+    d = ((d >> 16) | (d << 16)) & _MASK
+    c = (c + d) & _MASK
+    b = b ^ c
+    b = ((b >> 12) | (b << 20)) & _MASK
+    a = (a + b + my) & _MASK
+    d = d ^ a
+    d = ((d >> 8) | (d << 24)) & _MASK
+    c = (c + d) & _MASK
+    b = b ^ c
+    b = ((b >> 7) | (b << 25)) & _MASK
+    return a, b, c, d
+
+
+def _compress(chaining_value, block_words, block_length: int, flags: int) -> list:
+    """BLAKE3 compression function of the first block in a chunk.
+
+    Words are either ints or NumPy uint32 arrays compressing many blocks at once.
+    """
+    v0, v1, v2, v3, v4, v5, v6, v7 = chaining_value
+    v8, v9, v10, v11 = _IV[:4]
+    v12, v13, v14, v15 = 0, 0, block_length, flags
+    for schedule in _MESSAGE_SCHEDULE:
+        m = [block_words[i] for i in schedule]
+        v0, v4, v8, v12 = _g(v0, v4, v8, v12, m[0], m[1])
+        v1, v5, v9, v13 = _g(v1, v5, v9, v13, m[2], m[3])
+        v2, v6, v10, v14 = _g(v2, v6, v10, v14, m[4], m[5])
+        v3, v7, v11, v15 = _g(v3, v7, v11, v15, m[6], m[7])
+        v0, v5, v10, v15 = _g(v0, v5, v10, v15, m[8], m[9])
+        v1, v6, v11, v12 = _g(v1, v6, v11, v12, m[10], m[11])
+        v2, v7, v8, v13 = _g(v2, v7, v8, v13, m[12], m[13])
+        v3, v4, v9, v14 = _g(v3, v4, v9, v14, m[14], m[15])
+    state = (v0, v1, v2, v3, v4, v5, v6, v7, v8, v9, v10, v11, v12, v13, v14, v15)
+    return [state[i] ^ state[i + 8] for i in range(8)] + [
+        state[i + 8] ^ chaining_value[i] for i in range(8)
+    ]
+
+
+def _words(block: bytes) -> tuple[int, ...]:
+    return struct.unpack("<16I", block.ljust(_BLOCK_LENGTH, b"\0"))
+
+
+def blake3_hash(
+    data: bytes,
+    length: int = 32,
+    key_words: tuple[int, ...] = _IV,
+    flags: int = 0,
+) -> bytes:
+    """BLAKE3 hash of at most one chunk (1024 bytes) of data.
+
+    Output is at most 64 bytes long. `key_words` and `flags` select the keyed
+    hash and key derivation modes.
+    """
+    if len(data) > MAX_SESSION_KEY_LENGTH:
+        raise ValueError("Only inputs of up to 1024 bytes can be hashed.")
+    if not 0 < length <= _BLOCK_LENGTH:
+        raise ValueError("Output length must be between 1 and 64 bytes.")
+    chaining_value = key_words
+    blocks = [data[i : i + _BLOCK_LENGTH] for i in range(0, len(data), 64)] or [b""]
+    for index, block in enumerate(blocks):
+        block_flags = flags
+        if index == 0:
+            block_flags |= _CHUNK_START
+        if index == len(blocks) - 1:
+            block_flags |= _CHUNK_END | _ROOT
+        output = _compress(chaining_value, _words(block), len(block), block_flags)
+        chaining_value = tuple(output[:8])
+    return struct.pack("<16I", *output)[:length]
+
+
+def _context_keys(contexts: np.ndarray) -> np.ndarray:
+    """Key derivation context keys of many contexts of up to 64 bytes at once."""
+    if len(contexts) < _MIN_NUMPY_BATCH:
+        return np.array(
+            [
+                struct.unpack(
+                    "<8I", blake3_hash(context.tobytes(), flags=_DERIVE_KEY_CONTEXT)
+                )
+                for context in contexts
+            ],
+            dtype=np.uint32,
+        ).reshape(-1, 8)
+    padded = np.zeros((len(contexts), _BLOCK_LENGTH), dtype=np.uint8)
+    padded[:, : contexts.shape[1]] = contexts
+    block_words = list(padded.view("<u4").astype(np.uint32).T)
+    # Words of the state are arrays from the start, so sums of them wrap around
+    chaining_value = [np.full(len(contexts), word, dtype=np.uint32) for word in _IV]
+    output = _compress(
+        chaining_value,
+        block_words,
+        contexts.shape[1],
+        _CHUNK_START | _CHUNK_END | _ROOT | _DERIVE_KEY_CONTEXT,
+    )
+    return np.stack(output[:8], axis=1)
+
+
+def _derive_key(context_key: tuple[int, ...], material: bytes, length: int) -> bytes:
+    return blake3_hash(material, length, context_key, _DERIVE_KEY_MATERIAL)
+
+
+def _xor(*arrays: bytes) -> bytes:
+    result = 0
+    for array in arrays:
+        result ^= int.from_bytes(array, "little")
+    return result.to_bytes(len(arrays[0]), "little")
+
+
+class SdexCipher:
+    """SDEx cipher with a session key agreed by two users.
+
+    Calculating a message is the same operation for encryption and decryption.
+    Like in the app, only messages of a single block (`hash_length` bytes) are
+    decrypted back to the plain text.
+    """
+
+    def __init__(self, session_key: bytes, hash_length: int = 32) -> None:
+        if not 0 < hash_length <= MAX_HASH_LENGTH:
+            raise ValueError(f"Hash length must be between 1 and {MAX_HASH_LENGTH}.")
+        self.hash_length = hash_length
+        half_length = len(session_key) // 2
+        self.session_key_hash = blake3_hash(session_key, hash_length)
+        # Hashes of the session key parts, S1 and S2 in SDEx
+        self.first_part_hash = blake3_hash(session_key[:half_length], hash_length)
+        self.second_part_hash = blake3_hash(session_key[half_length:], hash_length)
+
+    def calculate_message(self, data: bytes) -> bytes:
+        """Encrypt or decrypt the whole message at once."""
+        return b"".join(self.calculate_stream([data]))
+
+    def calculate_stream(
+        self, chunks: Iterable[bytes], batch_size: int = 4096
+    ) -> Iterator[bytes]:
+        """Encrypt or decrypt a message split into chunks of any size.
+
+        Cipher text is yielded as soon as it can be calculated, at most
+        `batch_size` pairs of blocks at a time, so large media don't have to be
+        kept in memory.
+        """
+        calculation = _Calculation(self)
+        for chunk in chunks:
+            calculation.feed(chunk)
+            yield from calculation.run(batch_size)
+        calculation.end()
+        yield from calculation.run(batch_size)
+
+    def encrypt_message(self, message: str) -> bytes:
+        """Encrypt a text message."""
+        return self.calculate_message(message.encode())
+
+    def decrypt_message(self, cipher_text: bytes) -> str:
+        """Decrypt a text message without the padding of its last block."""
+        return (
+            self.calculate_message(cipher_text).rstrip(b"\0").decode(errors="replace")
+        )
+
+
+class _Calculation:
+    """State of a message calculated with `SdexCipher.calculate_stream`.
+
+    In the k-th iteration, blocks 2k-1 and 2k of the message are hashed into h_k
+    and cipher text blocks 2k+1 and 2k+2 are calculated. The first two iterations
+    calculate blocks 1 and 2 instead. There are n+1 iterations for a message of
+    n > 1 blocks, blocks past the end of the message are zeroed.
+    """
+
+    def __init__(self, cipher: SdexCipher) -> None:
+        self.cipher = cipher
+        self.block_length = cipher.hash_length
+        self.session_key_hash = np.frombuffer(cipher.session_key_hash, np.uint8)
+        self.first_part_hash = np.frombuffer(cipher.first_part_hash, np.uint8)
+        self.second_part_hash = np.frombuffer(cipher.second_part_hash, np.uint8)
+        # Received blocks which are still needed, starting at block `first_block`
+        self.blocks = np.zeros((0, self.block_length), dtype=np.uint8)
+        self.first_block = 1
+        self.received_blocks = 0
+        self.pending = bytearray()
+        self.ended = False
+        # Next iteration and the hashes of the two previous ones
+        self.iteration = 1
+        self.hashes = (b"", b"")
+
+    def feed(self, data: bytes) -> None:
+        self.pending += data
+        complete = len(self.pending) // self.block_length * self.block_length
+        if complete:
+            self._append(bytes(self.pending[:complete]))
+            del self.pending[:complete]
+
+    def end(self) -> None:
+        if self.pending:
+            self._append(bytes(self.pending).ljust(self.block_length, b"\0"))
+            self.pending.clear()
+        self.ended = True
+
+    def _append(self, data: bytes) -> None:
+        new_blocks = np.frombuffer(data, np.uint8).reshape(-1, self.block_length)
+        self.blocks = np.concatenate((self.blocks, new_blocks))
+        self.received_blocks += len(new_blocks)
+
+    def _rows(self, start: int, stop: int) -> np.ndarray:
+        """Blocks from `start` to `stop` - 1, zeroed past the received ones."""
+        rows = np.zeros((stop - start, self.block_length), dtype=np.uint8)
+        available = self.blocks[start - self.first_block : stop - self.first_block]
+        rows[: len(available)] = available
+        return rows
+
+    def _last_iteration(self) -> int:
+        received = self.received_blocks
+        if self.ended:
+            return received + 1 if received > 1 else received
+        if received >= 7:
+            return (received - 1) // 2
+        if received >= 4:
+            return 2
+        return 1 if received >= 2 else 0
+
+    def run(self, batch_size: int) -> Iterator[bytes]:
+        last = self._last_iteration()
+        while self.iteration <= last:
+            if self.iteration == 1:
+                yield self._first_iteration()
+            elif self.iteration == 2:
+                yield self._second_iteration()
+            else:
+                yield self._iterations(min(last, self.iteration + batch_size - 1))
+            needed_from = 2 * self.iteration - 1 if self.iteration > 2 else 2
+            self.blocks = self.blocks[needed_from - self.first_block :]
+            self.first_block = needed_from
+
+    def _context_key(self, first_block: int) -> tuple[int, ...]:
+        context = self._rows(first_block, first_block + 2).reshape(1, -1)
+        return tuple(_context_keys(context)[0].tolist())
+
+    def _first_iteration(self) -> bytes:
+        (block,) = self._rows(1, 2)
+        cipher_text = block ^ self.first_part_hash ^ self.session_key_hash
+        self.iteration = 2
+        # A single block message doesn't need any hash iterations
+        if self.ended and self.received_blocks == 1:
+            return cipher_text.tobytes()
+        h1 = _derive_key(
+            self._context_key(1), self.cipher.session_key_hash, self.block_length
+        )
+        self.hashes = (b"", h1)
+        return cipher_text.tobytes()
+
+    def _second_iteration(self) -> bytes:
+        (block,) = self._rows(2, 3)
+        cipher_text = block ^ self.first_part_hash ^ self.second_part_hash
+        h1 = self.hashes[1]
+        h2 = _derive_key(
+            self._context_key(3),
+            _xor(h1, self.cipher.session_key_hash),
+            self.block_length,
+        )
+        self.hashes = (h1, h2)
+        self.iteration = 3
+        return cipher_text.tobytes()
+
+    def _iterations(self, last: int) -> bytes:
+        first = self.iteration
+        count = last - first + 1
+        contexts = self._rows(2 * first - 1, 2 * last + 1).reshape(count, -1)
+        context_keys = _context_keys(contexts).tolist()
+        hashes = list(self.hashes)
+        for context_key in context_keys:
+            material = _xor(hashes[-1], hashes[-2])
+            hashes.append(_derive_key(tuple(context_key), material, self.block_length))
+        self.hashes = (hashes[-2], hashes[-1])
+        self.iteration = last + 1
+
+        hash_rows = np.frombuffer(b"".join(hashes), np.uint8).reshape(
+            -1, self.block_length
+        )
+        odd_blocks = self._rows(2 * first + 1, 2 * last + 2)[::2]
+        even_blocks = self._rows(2 * first, 2 * last + 1)[::2]
+        cipher_text = np.empty((count, 2, self.block_length), dtype=np.uint8)
+        cipher_text[:, 0] = odd_blocks ^ hash_rows[2:] ^ hash_rows[1:-1]
+        cipher_text[:, 1] = even_blocks ^ self.second_part_hash ^ hash_rows[2:]
+        return cipher_text.tobytes()
@@ -0,0 +1,70 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import time
+
+import rsa
+
+from sdex_server.crypto.fingerprints import FINGERPRINT_SIZE, fingerprint_public_key
+
+_KEY_VERSION_SIZE = 8
+_EXPIRY_SIZE = 8
+_MAC_SIZE = hashlib.sha256().digest_size
+
+
+class TicketManager:
+    """Issues and checks tickets which let authenticated clients resume sessions.
+
+    A ticket holds the fingerprint of the user's public key, the version of the
+    key's registration and an expiry time, authenticated with HMAC-SHA256. The
+    HMAC key is derived from the server's private key, so every worker using the
+    same key file accepts the ticket and checking it needs no RSA operations.
+    A ticket is only accepted with the current version of the key's registration,
+    so changing or removing the key revokes tickets issued for it.
+    """
+
+    def __init__(self, server_private_key: rsa.PrivateKey, ttl_seconds: int) -> None:
+        self.ttl_seconds = ttl_seconds
+        self._key = hashlib.sha256(
+            b"sdex-resumption-ticket" + server_private_key.save_pkcs1("DER")
+        ).digest()
+
+    def _sign(self, payload: bytes) -> bytes:
+        return hmac.new(self._key, payload, hashlib.sha256).digest()
+
+    def issue(self, public_key: str, key_version: int) -> str:
+        """Issue a ticket for the given version of the public key's registration."""
+        expires_at = int(time.time()) + self.ttl_seconds
+        payload = (
+            fingerprint_public_key(public_key)
+            + key_version.to_bytes(_KEY_VERSION_SIZE, "big")
+            + expires_at.to_bytes(_EXPIRY_SIZE, "big")
+        )
+        return base64.urlsafe_b64encode(payload + self._sign(payload)).decode()
+
+    def verify(self, ticket: str, public_key: str, key_version: int) -> bool:
+        """Check if the ticket was issued for the public key and hasn't expired.
+
+        `key_version` is the current version of the key's registration, tickets
+        issued for other versions are revoked.
+        """
+        try:
+            raw_ticket = base64.urlsafe_b64decode(ticket.encode())
+        except (binascii.Error, ValueError):
+            return False
+        if len(raw_ticket) != (
+            FINGERPRINT_SIZE + _KEY_VERSION_SIZE + _EXPIRY_SIZE + _MAC_SIZE
+        ):
+            return False
+        payload, mac = raw_ticket[:-_MAC_SIZE], raw_ticket[-_MAC_SIZE:]
+        if not hmac.compare_digest(mac, self._sign(payload)):
+            return False
+        fingerprint = payload[:FINGERPRINT_SIZE]
+        if not hmac.compare_digest(fingerprint, fingerprint_public_key(public_key)):
+            return False
+        version = payload[FINGERPRINT_SIZE : FINGERPRINT_SIZE + _KEY_VERSION_SIZE]
+        if int.from_bytes(version, "big") != key_version:
+            return False
+        expires_at = payload[FINGERPRINT_SIZE + _KEY_VERSION_SIZE :]
+        return int.from_bytes(expires_at, "big") > time.time()
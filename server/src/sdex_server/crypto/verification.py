@@ -0,0 +1,85 @@
+import asyncio
+import base64
+import binascii
+import functools
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor
+
+import rsa
+from pyasn1.error import PyAsn1Error
+
+
+def _parse_public_key(public_key: str) -> rsa.PublicKey:
+    return rsa.PublicKey.load_pkcs1(public_key.encode())  # type: ignore
+
+
+# Parsed public keys of recently authenticated users, configured per process
+load_public_key = functools.lru_cache(maxsize=4096)(_parse_public_key)
+
+
+def configure_key_cache(size: int) -> None:
+    """Replace the cache of parsed public keys with one of the given size."""
+    global load_public_key
+    load_public_key = functools.lru_cache(maxsize=size)(_parse_public_key)
+
+
+def verify_signature(message: str, signature: str, public_key: str) -> bool:
+    """Check base64 encoded RSA signature of the message made with the public key."""
+    try:
+        rsa.verify(
+            message=message.encode(),
+            signature=base64.b64decode(signature),
+            pub_key=load_public_key(public_key),
+        )
+        return True
+    # PEM framed keys with a malformed body fail to decode with PyAsn1Error
+    except (rsa.VerificationError, binascii.Error, ValueError, PyAsn1Error):
+        return False
+
+
+def _ready() -> None:
+    """Task which only makes sure a worker process is running."""
+
+
+class SignatureVerifier:
+    """Verifies signatures of authentication challenges off the event loop.
+
+    With `workers` > 0 verification runs in a pool of processes, so it's spread
+    across cores and doesn't hold the GIL of the process serving connections.
+    With 0 workers signatures are verified directly on the event loop.
+    """
+
+    def __init__(self, workers: int, key_cache_size: int) -> None:
+        configure_key_cache(key_cache_size)
+        self.workers = workers
+        self._executor: Executor | None = None
+        if workers > 0:
+            self._executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=configure_key_cache,
+                initargs=(key_cache_size,),
+            )
+
+    async def start(self) -> None:
+        """Spawn the worker processes ahead of the first verification."""
+        if not self._executor:
+            return
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *(loop.run_in_executor(self._executor, _ready) for _ in range(self.workers))
+        )
+
+    async def verify(self, message: str, signature: str, public_key: str) -> bool:
+        """Check base64 encoded RSA signature of the message made with the key."""
+        if not self._executor:
+            return verify_signature(message, signature, public_key)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, verify_signature, message, signature, public_key
+        )
+
+    def close(self) -> None:
+        """Stop the worker processes."""
+        if self._executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
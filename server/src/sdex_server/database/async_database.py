@@ -0,0 +1,253 @@
+import asyncio
+import contextlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, TypeVar
+
+from sdex_server.database.database import DatabaseManager
+from sdex_server.database.message_queue import MessageQueue
+from sdex_server.database.models import DirectoryChanges, QueuedMessage, User
+from sdex_server.metrics import DB_BATCHED_WRITES, DB_QUERY_LATENCY
+
+T = TypeVar("T")
+
+
+class AsyncDatabaseManager:
+    """Non-blocking facade over DatabaseManager and MessageQueue.
+
+    Queries run on worker threads so a slow query or a commit never stalls the
+    event loop. Reads are spread over a pool of reader connections and all writes
+    go through a single writer connection, so writers never compete for SQLite's
+    write lock. Writes made at the same time are committed together in batches of
+    up to `write_batch_size`, see `_commit_writes`. Every worker thread holds its
+    own connections, opened by `open` or on first use and closed by `close`.
+    """
+
+    def __init__(
+        self,
+        db_path: Path | str,
+        readers: int,
+        max_messages_per_recipient: int,
+        ttl_seconds: int,
+        write_batch_size: int,
+        write_batch_window: float,
+    ) -> None:
+        self.db_path = db_path
+        self.max_messages_per_recipient = max_messages_per_recipient
+        self.ttl_seconds = ttl_seconds
+        self.readers = readers
+        self._local = threading.local()
+        self._readers = ThreadPoolExecutor(
+            max_workers=readers, thread_name_prefix="db-reader"
+        )
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self.write_batch_size = write_batch_size
+        self.write_batch_window = write_batch_window
+        # Writes waiting for the next batch and the task committing them
+        self._pending_writes: list[
+            tuple[Callable[[DatabaseManager], Any], asyncio.Future[Any]]
+        ] = []
+        self._batch_full = asyncio.Event()
+        self._committer: asyncio.Task[None] | None = None
+
+    def _db_manager(self) -> DatabaseManager:
+        if not hasattr(self._local, "db_manager"):
+            self._local.db_manager = DatabaseManager(self.db_path)
+        return self._local.db_manager
+
+    def _message_queue(self) -> MessageQueue:
+        if not hasattr(self._local, "message_queue"):
+            self._local.message_queue = MessageQueue(
+                self.db_path,
+                max_messages_per_recipient=self.max_messages_per_recipient,
+                ttl_seconds=self.ttl_seconds,
+            )
+        return self._local.message_queue
+
+    @staticmethod
+    def _timed(operation: str, query: Callable[[], T]) -> T:
+        started = time.perf_counter()
+        try:
+            return query()
+        finally:
+            DB_QUERY_LATENCY.observe(time.perf_counter() - started, operation)
+
+    async def _read(self, query: Callable[[DatabaseManager], T]) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._readers,
+            lambda: self._timed("read", lambda: query(self._db_manager())),
+        )
+
+    async def _write(self, query: Callable[[DatabaseManager], T]) -> T:
+        future: asyncio.Future[T] = asyncio.get_running_loop().create_future()
+        self._pending_writes.append((query, future))
+        if len(self._pending_writes) >= self.write_batch_size:
+            self._batch_full.set()
+        if not self._committer:
+            self._committer = asyncio.create_task(self._commit_writes())
+        return await future
+
+    async def _commit_writes(self) -> None:
+        """Commit pending writes in batches until none are left.
+
+        Writes made while a batch is being committed join the next one, so under
+        load the cost of a commit is shared by many writes. When there are fewer
+        than `write_batch_size` writes, the batch waits up to `write_batch_window`
+        seconds for more. Every write runs in its own savepoint and its caller
+        gets its own result.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            while self._pending_writes:
+                if (
+                    self.write_batch_window > 0
+                    and len(self._pending_writes) < self.write_batch_size
+                ):
+                    self._batch_full.clear()
+                    with contextlib.suppress(asyncio.TimeoutError):
+                        await asyncio.wait_for(
+                            self._batch_full.wait(), self.write_batch_window
+                        )
+                batch = self._pending_writes[: self.write_batch_size]
+                del self._pending_writes[: self.write_batch_size]
+                DB_BATCHED_WRITES.observe(len(batch))
+                queries = [query for query, _ in batch]
+                try:
+                    results = await loop.run_in_executor(
+                        self._writer, self._write_batch, queries
+                    )
+                except Exception as e:
+                    results = [e] * len(batch)
+                for (_, future), result in zip(batch, results):
+                    if future.done():
+                        continue
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+        finally:
+            self._committer = None
+
+    def _write_batch(
+        self, queries: list[Callable[[DatabaseManager], Any]]
+    ) -> list[Any]:
+        return self._timed("write", lambda: self._db_manager().write_batch(queries))
+
+    async def _queue(self, operation: Callable[[MessageQueue], T]) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._writer,
+            lambda: self._timed("queue", lambda: operation(self._message_queue())),
+        )
+
+    async def get_user_by_login(self, login: str) -> User | None:
+        """Get user data from the database by login."""
+        return await self._read(lambda db: db.get_user_by_login(login))
+
+    async def check_public_key(self, public_key: str) -> bool:
+        """Check if public key exists in the database."""
+        return await self._read(lambda db: db.check_public_key(public_key))
+
+    async def get_key_version(self, public_key: str) -> int | None:
+        """Get version of the public key's registration, None if not registered."""
+        return await self._read(lambda db: db.get_key_version(public_key))
+
+    async def get_directory_changes(
+        self, since_version: int, fingerprints: list[bytes]
+    ) -> DirectoryChanges:
+        """Get changes of the given public keys since the version known by client."""
+        return await self._read(
+            lambda db: db.get_directory_changes(since_version, fingerprints)
+        )
+
+    async def update_user(self, login: str, new_public_key: str) -> bool:
+        """Update user data in the database."""
+        return await self._write(lambda db: db.update_user(login, new_public_key))
+
+    async def add_user(self, user: User) -> bool:
+        """Add new user to the database."""
+        return await self._write(lambda db: db.add_user(user))
+
+    async def remove_user(self, login: str) -> bool:
+        """Remove user from the database."""
+        return await self._write(lambda db: db.remove_user(login))
+
+    async def enqueue_messages(
+        self, public_key_to: str, payloads: list[dict[str, Any]], event: str = "chat"
+    ) -> list[bool]:
+        """Store messages delivered with the event until their receiver comes online."""
+        return await self._queue(
+            lambda queue: queue.enqueue_many(public_key_to, payloads, event)
+        )
+
+    async def peek_queued_messages(
+        self, public_key_to: str, batch_size: int
+    ) -> list[QueuedMessage]:
+        """Get the oldest messages waiting for the receiver without removing them."""
+        return await self._queue(
+            lambda queue: queue.peek_batch(public_key_to, batch_size)
+        )
+
+    async def remove_queued_messages(self, message_ids: list[int]) -> int:
+        """Remove delivered messages from the queue."""
+        return await self._queue(lambda queue: queue.remove(message_ids))
+
+    def _open_reader_connection(self) -> None:
+        self._db_manager()
+
+    def _open_writer_connections(self) -> None:
+        self._db_manager()
+        self._message_queue()
+
+    def _close_connections(self) -> None:
+        for name in ("db_manager", "message_queue"):
+            connection = getattr(self._local, name, None)
+            if connection:
+                connection.client.close()
+                delattr(self._local, name)
+
+    @staticmethod
+    def _on_every_thread(
+        executor: ThreadPoolExecutor, threads: int, task: Callable[[], None]
+    ) -> None:
+        # Every task waits for the others, so each one takes a different thread
+        barrier = threading.Barrier(threads)
+
+        def run() -> None:
+            try:
+                task()
+            finally:
+                barrier.wait()
+
+        for future in [executor.submit(run) for _ in range(threads)]:
+            future.result()
+
+    async def open(self) -> None:
+        """Open connections of all worker threads ahead of the first query.
+
+        The writer connects first, so pending migrations are applied once.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._writer, self._open_writer_connections)
+        await loop.run_in_executor(
+            None,
+            self._on_every_thread,
+            self._readers,
+            self.readers,
+            self._open_reader_connection,
+        )
+
+    async def flush(self) -> None:
+        """Wait until pending writes are committed."""
+        if self._committer:
+            await self._committer
+
+    def close(self) -> None:
+        """Wait for pending queries, close connections and stop the worker threads."""
+        self._on_every_thread(self._writer, 1, self._close_connections)
+        self._on_every_thread(self._readers, self.readers, self._close_connections)
+        self._readers.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
@@ -1,18 +1,91 @@
 import sqlite3
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Callable, Iterator, Sequence, TypeVar
 
 from loguru import logger
 
-from sdex_server.database.models import User
+from sdex_server.crypto.fingerprints import fingerprint_public_key
+from sdex_server.database.migrations import migrate
+from sdex_server.database.models import DirectoryChanges, User
 from sdex_server.exceptions import DBConnectionError
 
+T = TypeVar("T")
+
+
+def connect(db_path: Path | str) -> sqlite3.Connection:
+    """Open a connection to the database tuned for concurrent access.
+
+    WAL mode lets readers work while a write is in progress and with
+    `synchronous=NORMAL` commits don't wait for fsync of the main database file.
+    Pending schema migrations are applied before the connection is returned.
+    """
+    client = sqlite3.connect(db_path)
+    client.executescript(
+        """
+        PRAGMA journal_mode = WAL;
+        PRAGMA synchronous = NORMAL;
+        PRAGMA busy_timeout = 5000;
+        PRAGMA cache_size = -16000;
+        PRAGMA temp_store = MEMORY;
+        """
+    )
+    migrate(client)
+    return client
+
 
 class DatabaseManager:
     def __init__(self, db_path: Path | str) -> None:
         try:
-            self.client: sqlite3.Connection = sqlite3.connect(db_path)
+            self.client: sqlite3.Connection = connect(db_path)
+        except Exception as e:
+            raise DBConnectionError(e)
+        self._in_batch = False
+
+    @contextmanager
+    def _write(self) -> Iterator[None]:
+        """Run the write in its own transaction or its savepoint in a batch.
+
+        If the write fails, everything it changed is rolled back.
+        """
+        if not self._in_batch:
+            with self.client:
+                yield
+            return
+        self.client.execute("SAVEPOINT write;")
+        try:
+            yield
+        except BaseException:
+            self.client.execute("ROLLBACK TO write;")
+            raise
+        finally:
+            self.client.execute("RELEASE write;")
+
+    def write_batch(
+        self, writes: Sequence[Callable[["DatabaseManager"], T]]
+    ) -> list[T | Exception]:
+        """Run the writes in a single transaction with one commit.
+
+        Writes are applied in order and a failed write doesn't affect the others.
+        Each write's result or the exception it raised is returned in its place.
+        """
+        results: list[T | Exception] = []
+        try:
+            self.client.execute("BEGIN;")
+            self._in_batch = True
+            for write in writes:
+                try:
+                    results.append(write(self))
+                except Exception as e:
+                    results.append(e)
+            self.client.commit()
         except Exception as e:
+            if self.client.in_transaction:
+                self.client.rollback()
             raise DBConnectionError(e)
+        finally:
+            self._in_batch = False
+        return results
 
     def get_user_by_login(self, login: str) -> User | None:
         """Get user data from the database by login."""
@@ -48,13 +121,13 @@ class DatabaseManager:
             cursor: sqlite3.Cursor = self.client.execute(
                 """
                 SELECT
-                    *
+                    id
                 FROM
                     users
                 WHERE
-                    public_key = :key;
+                    public_key_fingerprint = :fingerprint;
                 """,
-                {"key": public_key},
+                {"fingerprint": fingerprint_public_key(public_key)},
             )
             output = cursor.fetchone()
             log_msg = "Public key exists." if output else "Public key does not exist."
@@ -63,56 +136,200 @@ class DatabaseManager:
         except Exception as e:
             raise DBConnectionError(e)
 
-    def update_user(self, login: str, new_public_key: str) -> bool:
-        """Update user data in the database."""
+    def get_key_version(self, public_key: str) -> int | None:
+        """Get version of the public key's registration, None if not registered.
+
+        The version is the one of the directory change which gave the key to its
+        user, so it changes when a removed user registers again or a user gets
+        back a key they changed before. Keys registered before the directory
+        change log existed have version 0.
+        """
         try:
-            self.client.execute(
+            cursor: sqlite3.Cursor = self.client.execute(
                 """
-                UPDATE
+                SELECT
+                    COALESCE(MAX(directory_changes.version), 0)
+                FROM
                     users
-                SET
-                    public_key = :new_public_key
+                    LEFT JOIN directory_changes
+                        ON directory_changes.new_fingerprint
+                            = users.public_key_fingerprint
                 WHERE
-                    login = :login;
+                    users.public_key_fingerprint = :fingerprint
+                GROUP BY
+                    users.id;
                 """,
-                {
-                    "new_public_key": new_public_key,
-                    "login": login,
-                },
+                {"fingerprint": fingerprint_public_key(public_key)},
             )
-            self.client.commit()
-            return self.client.total_changes > 0
+            output = cursor.fetchone()
+            return output[0] if output else None
+        except Exception as e:
+            raise DBConnectionError(e)
+
+    def update_user(self, login: str, new_public_key: str) -> bool:
+        """Update user data in the database."""
+        try:
+            with self._write():
+                cursor: sqlite3.Cursor = self.client.execute(
+                    """
+                    UPDATE
+                        users
+                    SET
+                        public_key = :new_public_key,
+                        public_key_fingerprint = :new_fingerprint
+                    WHERE
+                        login = :login;
+                    """,
+                    {
+                        "new_public_key": new_public_key,
+                        "new_fingerprint": fingerprint_public_key(new_public_key),
+                        "login": login,
+                    },
+                )
+            return cursor.rowcount > 0
+        except sqlite3.IntegrityError:
+            logger.info("Public key is already used by another user.")
+            return False
         except Exception as e:
             raise DBConnectionError(e)
 
     def add_user(self, user: User) -> bool:
         """Add new user to the database."""
         try:
-            self.client.execute(
-                """
-                INSERT INTO users (login, public_key)
-                VALUES (:login, :public_rsa);
-                """,
-                {"login": user.login, "public_rsa": user.public_key},
-            )
-            self.client.commit()
-            return self.client.total_changes > 0
+            with self._write():
+                cursor: sqlite3.Cursor = self.client.execute(
+                    """
+                    INSERT INTO users (login, public_key, public_key_fingerprint)
+                    VALUES (:login, :public_rsa, :fingerprint);
+                    """,
+                    {
+                        "login": user.login,
+                        "public_rsa": user.public_key,
+                        "fingerprint": fingerprint_public_key(user.public_key),
+                    },
+                )
+            return cursor.rowcount > 0
+        except sqlite3.IntegrityError:
+            logger.info("Login or public key is already used by another user.")
+            return False
         except Exception as e:
             raise DBConnectionError(e)
 
     def remove_user(self, login: str) -> bool:
         """Remove user from the database."""
         try:
-            self.client.execute(
+            with self._write():
+                cursor: sqlite3.Cursor = self.client.execute(
+                    """
+                    DELETE FROM
+                        users
+                    WHERE
+                        login = :login;
+                    """,
+                    {"login": login},
+                )
+            return cursor.rowcount > 0
+        except Exception as e:
+            raise DBConnectionError(e)
+
+    def get_directory_changes(
+        self, since_version: int, fingerprints: list[bytes]
+    ) -> DirectoryChanges:
+        """Get changes of the given public keys since the version known by client.
+
+        A client which never synced (version 0) or knows a version newer than the
+        latest one gets the current state, i.e. which of the keys are not
+        registered. Otherwise the change log is searched for the keys, following
+        chains of key updates, and every key with changes gets the current key of
+        its owner, or None if the owner is no longer registered. The change log
+        keeps every change, so any version can be synced from.
+        """
+        try:
+            cursor: sqlite3.Cursor = self.client.execute(
+                """
+                SELECT
+                    COALESCE(MAX(version), 0)
+                FROM
+                    directory_changes;
                 """
-                DELETE FROM
-                    users
-                WHERE
-                    login = :login;
-                """,
-                {"login": login},
             )
-            self.client.commit()
-            return self.client.total_changes > 0
+            (latest_version,) = cursor.fetchone()
+            if not 0 < since_version <= latest_version:
+                return DirectoryChanges(
+                    version=latest_version,
+                    changes=self._get_unregistered(fingerprints),
+                )
+
+            # Current fingerprint of a user mapped to the fingerprint client knows
+            owners = {fingerprint: fingerprint for fingerprint in fingerprints}
+            # Fingerprints client knows mapped to the last fingerprint of the user,
+            # for those with changes
+            changed: dict[bytes, bytes] = {}
+            # Fingerprints to look for in the change log after the given version
+            watched = {fingerprint: since_version for fingerprint in fingerprints}
+            while watched:
+                placeholders = ", ".join("?" * len(watched))
+                cursor = self.client.execute(
+                    f"""
+                    SELECT
+                        version, old_fingerprint, new_fingerprint
+                    FROM
+                        directory_changes
+                    WHERE
+                        version > ?
+                        AND (
+                            old_fingerprint IN ({placeholders})
+                            OR new_fingerprint IN ({placeholders})
+                        )
+                    ORDER BY
+                        version;
+                    """,
+                    [min(watched.values()), *watched, *watched],
+                )
+                watched = {}
+                for version, old_fingerprint, new_fingerprint in cursor:
+                    if old_fingerprint in owners and new_fingerprint is not None:
+                        # Key changed
+                        known_fingerprint = owners.pop(old_fingerprint)
+                        owners[new_fingerprint] = known_fingerprint
+                        changed[known_fingerprint] = new_fingerprint
+                        watched[new_fingerprint] = version
+                    elif old_fingerprint in owners:
+                        # User removed, they may register again with the same key
+                        changed[owners[old_fingerprint]] = old_fingerprint
+                    elif new_fingerprint in owners:
+                        # User registered with the key
+                        changed[owners[new_fingerprint]] = new_fingerprint
+            public_keys = self._get_public_keys(list(set(changed.values())))
+            return DirectoryChanges(
+                version=latest_version,
+                changes={
+                    known_fingerprint: public_keys.get(fingerprint, None)
+                    for known_fingerprint, fingerprint in changed.items()
+                },
+            )
         except Exception as e:
             raise DBConnectionError(e)
+
+    def _get_public_keys(self, fingerprints: list[bytes]) -> dict[bytes, str]:
+        placeholders = ", ".join("?" * len(fingerprints))
+        cursor: sqlite3.Cursor = self.client.execute(
+            f"""
+            SELECT
+                public_key_fingerprint, public_key
+            FROM
+                users
+            WHERE
+                public_key_fingerprint IN ({placeholders});
+            """,
+            fingerprints,
+        )
+        return dict(cursor.fetchall())
+
+    def _get_unregistered(self, fingerprints: list[bytes]) -> dict[bytes, str | None]:
+        registered = self._get_public_keys(fingerprints)
+        return {
+            fingerprint: None
+            for fingerprint in fingerprints
+            if fingerprint not in registered
+        }
@@ -0,0 +1,156 @@
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any
+
+from loguru import logger
+
+from sdex_server.database.database import connect
+from sdex_server.database.models import QueuedMessage
+from sdex_server.exceptions import DBConnectionError
+
+
+class MessageQueue:
+    """Persistent store-and-forward queue for messages to offline receivers.
+
+    Messages are kept in the same SQLite database as users. Each receiver can have
+    at most `max_messages_per_recipient` messages waiting and messages older than
+    `ttl_seconds` are discarded instead of being delivered.
+    """
+
+    def __init__(
+        self,
+        db_path: Path | str,
+        max_messages_per_recipient: int,
+        ttl_seconds: int,
+    ) -> None:
+        self.max_messages_per_recipient = max_messages_per_recipient
+        self.ttl_seconds = ttl_seconds
+        try:
+            self.client: sqlite3.Connection = connect(db_path)
+        except Exception as e:
+            raise DBConnectionError(e)
+
+    def enqueue(
+        self, public_key_to: str, payload: dict[str, Any], event: str = "chat"
+    ) -> bool:
+        """Store a message until its receiver comes online.
+
+        Returns False if the receiver's queue is already full.
+        """
+        return self.enqueue_many(public_key_to, [payload], event)[0]
+
+    def enqueue_many(
+        self, public_key_to: str, payloads: list[dict[str, Any]], event: str = "chat"
+    ) -> list[bool]:
+        """Store messages for one receiver in a single transaction.
+
+        The messages are delivered with the given event. Returns whether each
+        message was queued. Messages which don't fit in the receiver's queue are
+        rejected.
+        """
+        try:
+            self.purge_expired()
+            cursor: sqlite3.Cursor = self.client.execute(
+                """
+                SELECT
+                    COUNT(*)
+                FROM
+                    queued_messages
+                WHERE
+                    public_key_to = :public_key_to;
+                """,
+                {"public_key_to": public_key_to},
+            )
+            (queued_count,) = cursor.fetchone()
+            free_slots = max(self.max_messages_per_recipient - queued_count, 0)
+            if free_slots < len(payloads):
+                logger.info("Receiver's message queue is full.")
+            enqueued_at = time.time()
+            self.client.executemany(
+                """
+                INSERT INTO queued_messages
+                    (public_key_to, payload, enqueued_at, event)
+                VALUES (?, ?, ?, ?);
+                """,
+                [
+                    (public_key_to, json.dumps(payload), enqueued_at, event)
+                    for payload in payloads[:free_slots]
+                ],
+            )
+            self.client.commit()
+            return [i < free_slots for i in range(len(payloads))]
+        except Exception as e:
+            raise DBConnectionError(e)
+
+    def peek_batch(self, public_key_to: str, batch_size: int) -> list[QueuedMessage]:
+        """Get the oldest messages waiting for the receiver without removing them."""
+        try:
+            cursor: sqlite3.Cursor = self.client.execute(
+                """
+                SELECT
+                    id, public_key_to, payload, enqueued_at, event
+                FROM
+                    queued_messages
+                WHERE
+                    public_key_to = :public_key_to
+                    AND enqueued_at >= :oldest_allowed
+                ORDER BY
+                    id
+                LIMIT :batch_size;
+                """,
+                {
+                    "public_key_to": public_key_to,
+                    "oldest_allowed": time.time() - self.ttl_seconds,
+                    "batch_size": batch_size,
+                },
+            )
+            return [
+                QueuedMessage(
+                    id=row[0],
+                    public_key_to=row[1],
+                    payload=json.loads(row[2]),
+                    enqueued_at=row[3],
+                    event=row[4],
+                )
+                for row in cursor.fetchall()
+            ]
+        except Exception as e:
+            raise DBConnectionError(e)
+
+    def remove(self, message_ids: list[int]) -> int:
+        """Remove delivered messages from the queue."""
+        try:
+            cursor: sqlite3.Cursor = self.client.executemany(
+                """
+                DELETE FROM
+                    queued_messages
+                WHERE
+                    id = ?;
+                """,
+                [(message_id,) for message_id in message_ids],
+            )
+            self.client.commit()
+            return cursor.rowcount
+        except Exception as e:
+            raise DBConnectionError(e)
+
+    def purge_expired(self) -> int:
+        """Remove messages which waited for delivery longer than the TTL."""
+        try:
+            cursor: sqlite3.Cursor = self.client.execute(
+                """
+                DELETE FROM
+                    queued_messages
+                WHERE
+                    enqueued_at < :oldest_allowed;
+                """,
+                {"oldest_allowed": time.time() - self.ttl_seconds},
+            )
+            self.client.commit()
+            if cursor.rowcount:
+                logger.info(f"Discarded {cursor.rowcount} expired queued messages.")
+            return cursor.rowcount
+        except Exception as e:
+            raise DBConnectionError(e)
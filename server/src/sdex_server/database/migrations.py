@@ -0,0 +1,130 @@
+"""Schema migrations applied when a connection to the database is opened.
+
+Applied migrations are tracked with SQLite's `user_version` pragma. Migrations are
+only ever appended to the list, never changed.
+"""
+import sqlite3
+
+from loguru import logger
+
+from sdex_server.crypto.fingerprints import fingerprint_public_key
+
+MIGRATIONS: list[list[str]] = [
+    # 1: base schema
+    [
+        """
+        CREATE TABLE IF NOT EXISTS users
+        (
+            id         INTEGER primary key,
+            login      TEXT    not null unique,
+            public_key TEXT    not null
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS queued_messages
+        (
+            id            INTEGER primary key,
+            public_key_to TEXT    not null,
+            payload       TEXT    not null,
+            enqueued_at   REAL    not null
+        );
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS queued_messages_public_key_to_idx
+            ON queued_messages (public_key_to, id);
+        """,
+    ],
+    # 2: indexed public key fingerprints
+    [
+        """
+        ALTER TABLE users ADD COLUMN public_key_fingerprint BLOB;
+        """,
+        """
+        UPDATE users SET public_key_fingerprint = fingerprint(public_key);
+        """,
+        # Only the first user registered with a key is found by it, the others
+        # keep their key but need to change it before they can be found
+        """
+        UPDATE users SET public_key_fingerprint = NULL
+        WHERE id NOT IN (
+            SELECT MIN(id) FROM users GROUP BY public_key_fingerprint
+        );
+        """,
+        """
+        CREATE UNIQUE INDEX users_public_key_fingerprint_idx
+            ON users (public_key_fingerprint);
+        """,
+    ],
+    # 3: change log of registered public keys for incremental directory sync
+    [
+        """
+        CREATE TABLE directory_changes
+        (
+            version         INTEGER primary key autoincrement,
+            old_fingerprint BLOB,
+            new_fingerprint BLOB,
+            new_public_key  TEXT
+        );
+        """,
+        """
+        CREATE INDEX directory_changes_old_fingerprint_idx
+            ON directory_changes (old_fingerprint);
+        """,
+        """
+        CREATE INDEX directory_changes_new_fingerprint_idx
+            ON directory_changes (new_fingerprint);
+        """,
+        """
+        CREATE TRIGGER users_directory_insert AFTER INSERT ON users
+        BEGIN
+            INSERT INTO directory_changes (new_fingerprint, new_public_key)
+            VALUES (NEW.public_key_fingerprint, NEW.public_key);
+        END;
+        """,
+        """
+        CREATE TRIGGER users_directory_update AFTER UPDATE OF public_key ON users
+        WHEN OLD.public_key_fingerprint IS NOT NEW.public_key_fingerprint
+        BEGIN
+            INSERT INTO directory_changes
+                (old_fingerprint, new_fingerprint, new_public_key)
+            VALUES
+                (OLD.public_key_fingerprint, NEW.public_key_fingerprint,
+                 NEW.public_key);
+        END;
+        """,
+        """
+        CREATE TRIGGER users_directory_delete AFTER DELETE ON users
+        BEGIN
+            INSERT INTO directory_changes (old_fingerprint)
+            VALUES (OLD.public_key_fingerprint);
+        END;
+        """,
+    ],
+    # 4: event queued messages are delivered with
+    [
+        """
+        ALTER TABLE queued_messages ADD COLUMN event TEXT not null default 'chat';
+        """,
+    ],
+]
+
+
+def migrate(client: sqlite3.Connection) -> None:
+    """Bring the database schema up to date."""
+    client.create_function("fingerprint", 1, fingerprint_public_key, deterministic=True)
+    (version,) = client.execute("PRAGMA user_version;").fetchone()
+    if version >= len(MIGRATIONS):
+        return
+    # Lock the database so concurrent connections don't apply the same migration
+    client.execute("BEGIN IMMEDIATE;")
+    try:
+        (version,) = client.execute("PRAGMA user_version;").fetchone()
+        for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            logger.info(f"Applying database migration {number}.")
+            for statement in statements:
+                client.execute(statement)
+            client.execute(f"PRAGMA user_version = {number};")
+        client.commit()
+    except Exception:
+        client.rollback()
+        raise
@@ -1,3 +1,5 @@
+from typing import Any
+
 from pydantic import BaseModel
 
 
@@ -5,3 +7,19 @@ class User(BaseModel):
     login: str
     public_key: str
     id: int | None = None
+
+
+class QueuedMessage(BaseModel):
+    id: int
+    public_key_to: str
+    payload: dict[str, Any]
+    enqueued_at: float
+    # Event the message is delivered with, "chat" or "chatFanOut"
+    event: str = "chat"
+
+
+class DirectoryChanges(BaseModel):
+    version: int
+    # Fingerprints known by the client mapped to current public key of their owner,
+    # None if the owner is no longer registered
+    changes: dict[bytes, str | None]
@@ -1,7 +1,9 @@
 """Configure handlers and formats for application loggers."""
 import logging
 import sys
+from collections import Counter
 from pprint import pformat
+from typing import Any
 
 from loguru import logger
 from loguru._defaults import LOGURU_FORMAT
@@ -32,6 +34,66 @@ class InterceptHandler(logging.Handler):
         )
 
 
+class EventSampler:
+    """Sampling policy passing only every n-th record of each sampled log call.
+
+    Records are counted separately for every place they are logged from.
+    Warnings and more severe records are always passed.
+    """
+
+    def __init__(self, every: int) -> None:
+        self.every = every
+        self._counts: Counter[tuple[str, int]] = Counter()
+
+    def sample(self, call_site: tuple[str, int], level: int) -> bool:
+        if self.every <= 1 or level >= logging.WARNING:
+            return True
+        count = self._counts[call_site]
+        self._counts[call_site] = count + 1
+        return count % self.every == 0
+
+
+class SampledLogger:
+    """Logger for high-frequency events, e.g. every chat message.
+
+    Its records below WARNING level are sampled, see `EventSampler`. The sample is
+    taken before the record is passed to loguru, which formats the message before
+    running handlers' filters, so skipped records don't pay for formatting.
+    """
+
+    def __init__(self, sampler: EventSampler) -> None:
+        self.sampler = sampler
+
+    def debug(self, message: str, *args: Any, **kwargs: Any) -> None:
+        self._log("DEBUG", logging.DEBUG, message, args, kwargs)
+
+    def info(self, message: str, *args: Any, **kwargs: Any) -> None:
+        self._log("INFO", logging.INFO, message, args, kwargs)
+
+    def warning(self, message: str, *args: Any, **kwargs: Any) -> None:
+        self._log("WARNING", logging.WARNING, message, args, kwargs)
+
+    def error(self, message: str, *args: Any, **kwargs: Any) -> None:
+        self._log("ERROR", logging.ERROR, message, args, kwargs)
+
+    def _log(
+        self,
+        level: str,
+        level_no: int,
+        message: str,
+        args: tuple[Any, ...],
+        kwargs: dict[str, Any],
+    ) -> None:
+        # The frame of the function calling one of the logging methods
+        frame = sys._getframe(2)
+        call_site = (frame.f_globals.get("__name__", ""), frame.f_lineno)
+        if self.sampler.sample(call_site, level_no):
+            logger.opt(depth=2).log(level, message, *args, **kwargs)
+
+
+sampled_logger = SampledLogger(EventSampler(every=1))
+
+
 def format_record(record: dict) -> str:
     """
     Custom format for loguru loggers.
@@ -49,10 +111,14 @@ def format_record(record: dict) -> str:
     return format_string  # type: ignore
 
 
-def init_logging():
+def init_logging(level: str = "DEBUG", enqueue: bool = False, sample_every: int = 1):
     """
     Replaces logging handlers with a handler for using the custom handler.
 
+    With `enqueue` records are written to stdout by a background thread, so slow
+    output doesn't block the event loop. Only every `sample_every`-th record of
+    `sampled_logger` is logged.
+
     WARNING!
     if you call the init_logging in startup event function,
     then the first logs before the application start will be in the old format
@@ -69,7 +135,15 @@ def init_logging():
     intercept_handler = InterceptHandler()
     logging.getLogger("uvicorn").handlers = [intercept_handler]
 
+    sampled_logger.sampler = EventSampler(sample_every)
     # set logs output, level and format
     logger.configure(
-        handlers=[{"sink": sys.stdout, "level": logging.DEBUG, "format": format_record}]
+        handlers=[
+            {
+                "sink": sys.stdout,
+                "level": level,
+                "format": format_record,
+                "enqueue": enqueue,
+            }
+        ]
     )
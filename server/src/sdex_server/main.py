@@ -1,120 +1,582 @@
-import base64
+import asyncio
+from collections import defaultdict
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Any
+from typing import Any, AsyncIterator, Awaitable, Callable, TypeVar
 
-import rsa
-from bidict import bidict
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi_socketio import SocketManager
 from loguru import logger
-from socketio.exceptions import TimeoutError
+from socketio.exceptions import ConnectionRefusedError, TimeoutError
 
+from sdex_server.connection import rate_limiting
+from sdex_server.connection.admission import ConnectionAdmission
+from sdex_server.connection.attachments import AttachmentRelay
+from sdex_server.connection.deduplication import DeliveryDeduplicator
+from sdex_server.connection.deliveries import PendingDeliveries
+from sdex_server.connection.outbound import OutboundQueues
 from sdex_server.connection.payload_sanitizers import (
+    validate_attachment_chunk_payload,
+    validate_attachment_end_payload,
+    validate_attachment_start_payload,
+    validate_chat_batch_payload,
+    validate_chat_fan_out_payload,
     validate_chat_init_payload,
     validate_chat_payload,
     validate_check_key_payload,
     validate_check_online_payload,
     validate_connect_payload,
+    validate_public_keys_list_payload,
     validate_register_follow_up_payload,
+    validate_sync_directory_payload,
     validate_update_public_key_payload,
 )
-from sdex_server.crypto.randomness import generate_challenge
-from sdex_server.database.database import DatabaseManager
-from sdex_server.database.models import User
-from sdex_server.logger import init_logging
-from sdex_server.settings import HOST_ADDRESS, HOST_PORT, SQLITE_DB_PATH
-from sdex_server.type_definitions import PublicKeysSidsMappingType, ResponseStatusType
+from sdex_server.connection.payload_schemas import (
+    ChatPayload,
+    PayloadLimits,
+    configure_payload_limits,
+)
+from sdex_server.connection.presence import (
+    PresenceBackend,
+    create_client_manager,
+    create_presence_backend,
+    presence_room,
+)
+from sdex_server.connection.rate_limiting import RateLimiter
+from sdex_server.connection.sessions import intern_public_key
+from sdex_server.crypto.challenges import ChallengeManager
+from sdex_server.crypto.tickets import TicketManager
+from sdex_server.crypto.verification import SignatureVerifier
+from sdex_server.database.async_database import AsyncDatabaseManager
+from sdex_server.database.models import QueuedMessage, User
+from sdex_server.logger import init_logging, sampled_logger
+from sdex_server.messages import MISSING_PUBLIC_KEY_DROP_CONNECTION_MESSAGE
+from sdex_server.metrics import (
+    ATTACHMENT_TRANSFERS,
+    AUTHENTICATED_USERS,
+    CONNECTED_SIDS,
+    EVENT_TIMEOUTS,
+    OUTBOUND_OVERFLOWS,
+    OUTBOUND_QUEUED,
+    PENDING_CHALLENGES,
+    PENDING_DELIVERIES,
+    REAPED_CONNECTIONS,
+    REFUSED_CONNECTIONS,
+    instrumented,
+    render,
+)
+from sdex_server.settings import (
+    ATTACHMENT_MAX_CHUNK_SIZE,
+    ATTACHMENT_MAX_SIZE,
+    ATTACHMENT_MAX_TRANSFERS,
+    ATTACHMENT_TIMEOUT_SECONDS,
+    ATTACHMENT_WINDOW,
+    AUTH_VERIFICATION_WORKERS,
+    AUTHENTICATION_DEADLINE_SECONDS,
+    CHALLENGE_MAX_PENDING,
+    CHALLENGE_MAX_PER_SID,
+    CHALLENGE_TTL_SECONDS,
+    CHAT_BATCH_MAX_SIZE,
+    DB_READER_CONNECTIONS,
+    DB_WRITE_BATCH_SIZE,
+    DB_WRITE_BATCH_WINDOW_SECONDS,
+    DEDUPLICATION_MAX_MESSAGES,
+    DEDUPLICATION_TTL_SECONDS,
+    DELIVERY_MAX_PENDING,
+    DELIVERY_MAX_RETRIES,
+    DELIVERY_MODE,
+    DELIVERY_TIMEOUT_SECONDS,
+    DIRECTORY_SYNC_MAX_SIZE,
+    FANOUT_MAX_RECIPIENTS,
+    HOST_ADDRESS,
+    HOST_PORT,
+    LOG_ENQUEUE,
+    LOG_LEVEL,
+    LOG_SAMPLE_EVERY,
+    MAX_CONNECTIONS,
+    OFFLINE_QUEUE_FLUSH_BATCH_SIZE,
+    OFFLINE_QUEUE_MAX_MESSAGES_PER_RECIPIENT,
+    OFFLINE_QUEUE_TTL_SECONDS,
+    OUTBOUND_MAX_IN_FLIGHT,
+    OUTBOUND_OVERFLOW_POLICY,
+    OUTBOUND_QUEUE_SIZE,
+    PAYLOAD_MAX_FIELD_LENGTH,
+    PAYLOAD_MAX_FRAME_SIZE,
+    PAYLOAD_MAX_MEDIA_LENGTH,
+    PAYLOAD_MAX_PUBLIC_KEY_LENGTH,
+    PAYLOAD_MAX_TEXT_LENGTH,
+    PRESENCE_BACKEND,
+    PRESENCE_BULK_MAX_SIZE,
+    PRESENCE_DB_PATH,
+    PRESENCE_MAX_SUBSCRIPTIONS,
+    PUBLIC_KEY_CACHE_SIZE,
+    RATE_LIMIT_AUTH_BURST,
+    RATE_LIMIT_AUTH_PER_SECOND,
+    RATE_LIMIT_CHAT_BURST,
+    RATE_LIMIT_CHAT_PER_SECOND,
+    RATE_LIMIT_MAX_BUCKETS,
+    RATE_LIMIT_QUERY_BURST,
+    RATE_LIMIT_QUERY_PER_SECOND,
+    REAPER_INTERVAL_SECONDS,
+    RESUMPTION_TICKET_TTL_SECONDS,
+    SOCKETIO_MESSAGE_QUEUE_URL,
+    SQLITE_DB_PATH,
+    server_private_key,
+)
+from sdex_server.type_definitions import (
+    AttachmentAcceptedResponseType,
+    ChatAcceptedResponseType,
+    ResponseStatusType,
+)
+
+Handler = TypeVar("Handler", bound=Callable[..., Awaitable[Any]])
+
+# Resources of the running app, one set per worker process. create_app makes the
+# components keeping track of sockets, its lifespan opens connections and starts
+# threads and processes.
+# Public keys and authentication state of connected users, shared between workers
+presence: PresenceBackend
+# Challenges sent to users for authentication. A socket always talks to the same
+# worker, so challenges don't need to be shared.
+challenges: ChallengeManager
+db_manager: AsyncDatabaseManager
+socket_manager: SocketManager
+# Messages forwarded in "pipelined" delivery mode and waiting for receiver's ack
+deliveries: PendingDeliveries
+# Messages waiting for delivery to each connected receiver
+outbound: OutboundQueues
+# Attachments relayed from senders to receivers in binary chunks
+attachments: AttachmentRelay
+# Sockets connected to this worker and deadlines of unauthenticated ones
+admission: ConnectionAdmission
+# Outcomes of delivered messages, returned to senders retrying them
+deduplicator: DeliveryDeduplicator
+# Presence rooms each socket of this worker is subscribed to
+presence_subscriptions: dict[str, set[str]]
+# Verifies signed challenges in worker processes
+signature_verifier: SignatureVerifier
+# Issues tickets letting clients skip the challenge on reconnect
+tickets: TicketManager
+
+# Limits how often clients may send events which cost a query, RSA operation
+# or forwarded call
+rate_limiter: RateLimiter
+
+# Socket.IO event handlers, registered on the socket manager of every app
+event_handlers: dict[str, Callable[..., Awaitable[Any]]] = {}
+
+
+def on(event: str) -> Callable[[Handler], Handler]:
+    """Register the function as the handler of the Socket.IO event."""
+
+    def register(handler: Handler) -> Handler:
+        event_handlers[event] = handler
+        return handler
+
+    return register
+
+
+def limited(
+    event: str, rejected: Any, cost: Callable[..., int] | None = None
+) -> Callable[[Handler], Handler]:
+    """Throttle the handler with the rate limiter of the running app."""
+    return rate_limiting.limited(  # type: ignore
+        lambda: rate_limiter, event, rejected, cost
+    )
+
+
+def create_rate_limiter() -> RateLimiter:
+    """Create rate limiter with the limits of events set in the settings."""
+    limiter = RateLimiter(max_buckets=RATE_LIMIT_MAX_BUCKETS)
+    for event in ("registerInit", "registerFollowUp"):
+        limiter.limit(event, RATE_LIMIT_AUTH_PER_SECOND, RATE_LIMIT_AUTH_BURST)
+    for event in (
+        "checkKey",
+        "checkOnline",
+        "checkOnlineBulk",
+        "subscribePresence",
+        "unsubscribePresence",
+        "syncDirectory",
+        "updatePublicKey",
+    ):
+        limiter.limit(event, RATE_LIMIT_QUERY_PER_SECOND, RATE_LIMIT_QUERY_BURST)
+    for event in ("chatInit", "chat", "chatBatch", "chatFanOut", "attachmentStart"):
+        limiter.limit(event, RATE_LIMIT_CHAT_PER_SECOND, RATE_LIMIT_CHAT_BURST)
+    return limiter
+
+
+def create_app() -> FastAPI:
+    """Create the app with its Socket.IO server, one per worker process.
+
+    Creating the app is cheap. Database connections, worker threads and processes
+    are started by the app's lifespan and key files are read when it starts, so
+    nothing is shared with workers forked from the process which imported the app.
+    """
+    global challenges, socket_manager, deliveries, outbound, attachments
+    global admission, deduplicator, presence_subscriptions, rate_limiter
+
+    app = FastAPI(title="SDEx communicator server", debug=True, lifespan=lifespan)
+    app.add_api_route("/metrics", metrics, response_class=PlainTextResponse)
+
+    configure_payload_limits(
+        PayloadLimits(
+            public_key=PAYLOAD_MAX_PUBLIC_KEY_LENGTH,
+            text=PAYLOAD_MAX_TEXT_LENGTH,
+            media=PAYLOAD_MAX_MEDIA_LENGTH,
+            field=PAYLOAD_MAX_FIELD_LENGTH,
+            chunk=ATTACHMENT_MAX_CHUNK_SIZE,
+        )
+    )
+    socket_manager = SocketManager(
+        app=app,
+        client_manager=create_client_manager(SOCKETIO_MESSAGE_QUEUE_URL),
+        max_http_buffer_size=PAYLOAD_MAX_FRAME_SIZE,
+    )
+    for event, handler in event_handlers.items():
+        socket_manager.on(event, handler=handler)  # type: ignore
+
+    challenges = ChallengeManager(
+        ttl_seconds=CHALLENGE_TTL_SECONDS,
+        max_pending=CHALLENGE_MAX_PENDING,
+        max_issued_per_sid=CHALLENGE_MAX_PER_SID,
+    )
+    deliveries = PendingDeliveries(
+        socket_manager,
+        max_pending=DELIVERY_MAX_PENDING,
+        timeout=DELIVERY_TIMEOUT_SECONDS,
+        max_retries=DELIVERY_MAX_RETRIES,
+    )
+    outbound = OutboundQueues(
+        socket_manager,
+        max_queued=OUTBOUND_QUEUE_SIZE,
+        max_in_flight=OUTBOUND_MAX_IN_FLIGHT,
+    )
+    attachments = AttachmentRelay(
+        socket_manager,
+        max_transfers=ATTACHMENT_MAX_TRANSFERS,
+        max_size=ATTACHMENT_MAX_SIZE,
+        window=ATTACHMENT_WINDOW,
+        timeout=ATTACHMENT_TIMEOUT_SECONDS,
+    )
+    admission = ConnectionAdmission(
+        max_connections=MAX_CONNECTIONS,
+        deadline_seconds=AUTHENTICATION_DEADLINE_SECONDS,
+    )
+    # Failed deliveries aren't remembered, so their retries are delivered again
+    deduplicator = DeliveryDeduplicator(
+        max_entries=DEDUPLICATION_MAX_MESSAGES,
+        ttl_seconds=DEDUPLICATION_TTL_SECONDS,
+        retryable=("error", "busy"),
+    )
+    presence_subscriptions = {}
+    rate_limiter = create_rate_limiter()
+    return app
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Start resources of the worker serving the app and release them on shutdown.
 
-# Keeps a mapping of public keys to socket ids in bidirectional dictionary, where:
-#   keys are: public RSA keys
-#   values are: socket ids
-PUBLIC_KEYS_SIDS_MAPPING: PublicKeysSidsMappingType = bidict()
-# Set of authenticated users' sids
-AUTHENTICATED_USERS: set[str] = set()
-# Maps sids to challenges sent to users for authentication
-SID_TO_CHALLENGE_MAPPING: dict[str, str] = {}
+    Database connections and verification processes are warmed up before the
+    first connection is accepted.
+    """
+    global presence, db_manager, signature_verifier, tickets
+
+    init_logging(LOG_LEVEL, enqueue=LOG_ENQUEUE, sample_every=LOG_SAMPLE_EVERY)
+    tickets = TicketManager(
+        server_private_key(), ttl_seconds=RESUMPTION_TICKET_TTL_SECONDS
+    )
+    presence = create_presence_backend(PRESENCE_BACKEND, PRESENCE_DB_PATH)
+    db_manager = AsyncDatabaseManager(
+        SQLITE_DB_PATH,
+        readers=DB_READER_CONNECTIONS,
+        max_messages_per_recipient=OFFLINE_QUEUE_MAX_MESSAGES_PER_RECIPIENT,
+        ttl_seconds=OFFLINE_QUEUE_TTL_SECONDS,
+        write_batch_size=DB_WRITE_BATCH_SIZE,
+        write_batch_window=DB_WRITE_BATCH_WINDOW_SECONDS,
+    )
+    signature_verifier = SignatureVerifier(
+        workers=AUTH_VERIFICATION_WORKERS, key_cache_size=PUBLIC_KEY_CACHE_SIZE
+    )
+    await asyncio.gather(db_manager.open(), signature_verifier.start())
+    reaper = socket_manager.start_background_task(reap_unauthenticated)
+    try:
+        yield
+    finally:
+        reaper.cancel()
+        await db_manager.flush()
+        presence.close()
+        db_manager.close()
+        signature_verifier.close()
 
 
-def is_authenticated(sid: str) -> bool:
-    """Check if user with that sid is authenticated on the server."""
-    return sid in AUTHENTICATED_USERS
+async def metrics() -> str:
+    """Serve server metrics in the Prometheus text format."""
+    _, authenticated = await presence.count_sessions()
+    CONNECTED_SIDS.set(len(admission))
+    AUTHENTICATED_USERS.set(authenticated)
+    PENDING_CHALLENGES.set(len(challenges))
+    PENDING_DELIVERIES.set(len(deliveries))
+    OUTBOUND_QUEUED.set(len(outbound))
+    ATTACHMENT_TRANSFERS.set(len(attachments))
+    return render()
 
 
-db_manager = DatabaseManager(SQLITE_DB_PATH)
+async def reap_unauthenticated() -> None:
+    """Periodically disconnect sockets which didn't authenticate in time."""
+    while True:
+        await socket_manager.sleep(REAPER_INTERVAL_SECONDS)
+        for sid in admission.expired():
+            logger.info(f"Sid={sid} didn't authenticate in time. Disconnecting.")
+            REAPED_CONNECTIONS.inc()
+            await socket_manager.disconnect(sid)
 
-app = FastAPI(title="SDEx communicator server", debug=True)
-init_logging()
 
-socket_manager = SocketManager(app=app)
+async def flush_offline_messages(sid: str, public_key: str) -> None:
+    """Deliver messages queued while the user was offline.
+
+    Every message is sent with the event it was queued for, chat messages with
+    the "chat" event every client handles, and is acknowledged on its own. Up to
+    the receiver's in-flight limit of messages are sent at a time through their
+    outbound queue, so a backlog takes a round-trip per window of messages rather
+    than per message. Acknowledged messages are removed from the queue. Once a
+    message isn't acknowledged, the flush stops and the rest stays queued until
+    the next authentication.
+    """
+
+    async def deliver(message: QueuedMessage) -> bool:
+        try:
+            delivered = await outbound.send(
+                sid, message.event, message.payload, flushing=True
+            )
+        except TimeoutError:
+            logger.error("TimeoutError while flushing a queued message.")
+            EVENT_TIMEOUTS.inc("offlineFlush")
+            return False
+        if delivered is None:
+            logger.info("Receiver's outbound queue is full. Keeping messages queued.")
+        elif not delivered:
+            logger.info("Receiver rejected a queued message. Keeping it queued.")
+        return bool(delivered)
+
+    while queued := await db_manager.peek_queued_messages(
+        public_key, OFFLINE_QUEUE_FLUSH_BATCH_SIZE
+    ):
+        logger.info(f"Flushing {len(queued)} queued messages to sid={sid}.")
+        for start in range(0, len(queued), outbound.max_in_flight):
+            window = queued[start : start + outbound.max_in_flight]
+            delivered = await asyncio.gather(*(deliver(message) for message in window))
+            await db_manager.remove_queued_messages(
+                [message.id for message, ok in zip(window, delivered) if ok]
+            )
+            if not all(delivered):
+                return
+    logger.info("No more queued messages for the user.")
 
 
-@socket_manager.on("connect")  # type: ignore
+async def complete_authentication(
+    sid: str, public_key: str, issue_ticket: bool = True
+) -> None:
+    """Start the session of the user and deliver messages queued for them.
+
+    The user's public key is verified by now. A user has one session, so their
+    previous socket, if any, is disconnected. Unless the session was resumed with
+    a ticket, the client gets a new resumption ticket in a "ticket" event.
+    """
+    # Structures keyed by the user's public key share one copy of it
+    public_key = intern_public_key(public_key)
+    previous_sid = await presence.get_sid(public_key)
+    await presence.bind(public_key, sid)
+    await presence.authenticate(sid)
+    admission.authenticated(sid)
+    rate_limiter.bind(sid, public_key)
+    if previous_sid and previous_sid != sid:
+        logger.info(f"User authenticated again. Disconnecting sid={previous_sid}.")
+        await socket_manager.disconnect(previous_sid)
+    else:
+        await publish_presence(public_key, online=True)
+    if issue_ticket:
+        await send_ticket(sid, public_key)
+    socket_manager.start_background_task(flush_offline_messages, sid, public_key)
+
+
+async def send_ticket(sid: str, public_key: str) -> None:
+    """Send the client a resumption ticket for their public key.
+
+    The ticket is bound to the current registration of the key, so it's revoked
+    once the user changes the key or is removed.
+    """
+    if RESUMPTION_TICKET_TTL_SECONDS <= 0:
+        return
+    key_version = await db_manager.get_key_version(public_key)
+    if key_version is None:
+        logger.info("Public key is not registered. Not issuing a ticket.")
+        return
+    await socket_manager.emit(
+        "ticket",
+        {
+            "ticket": tickets.issue(public_key, key_version),
+            "expiresIn": RESUMPTION_TICKET_TTL_SECONDS,
+        },
+        to=sid,
+    )
+
+
+async def publish_presence(public_key: str, online: bool) -> None:
+    """Push user's online status to the sids subscribed to their presence."""
+    await socket_manager.emit(
+        "presence",
+        {"publicKey": public_key, "online": online},
+        to=presence_room(public_key),
+    )
+
+
+async def queue_for_offline_receiver(
+    public_key_to: str, messages: list[dict[str, Any]], event: str = "chat"
+) -> list[ResponseStatusType]:
+    """Queue messages for a receiver who is offline or not authenticated yet.
+
+    The messages are delivered with the given event once the receiver is back.
+    Queued messages are answered with "success", like delivered ones, as clients
+    treat any other status as a failed send and would send the message again.
+    """
+    if not await db_manager.check_public_key(public_key_to):
+        logger.info("Message receiver is not registered. Dropping the message.")
+        return ["error"] * len(messages)
+    queued = await db_manager.enqueue_messages(public_key_to, messages, event)
+    sampled_logger.info(
+        "{} of {} messages queued for delivery.", sum(queued), len(queued)
+    )
+    return ["success" if is_queued else "error" for is_queued in queued]
+
+
+async def handle_outbound_overflow(
+    receiver_sid: str,
+    public_key_to: str,
+    messages: list[dict[str, Any]],
+    event: str = "chat",
+) -> list[ResponseStatusType]:
+    """Apply the overflow policy to messages which didn't fit in receiver's queue.
+
+    Spilled messages are moved to the offline queue, which is flushed to the
+    receiver once their outbound queue drains. Until the flush finishes, further
+    messages for the receiver are spilled too, so they don't overtake the
+    earlier ones.
+    """
+    OUTBOUND_OVERFLOWS.inc(OUTBOUND_OVERFLOW_POLICY)
+    if OUTBOUND_OVERFLOW_POLICY == "reject":
+        return ["error"] * len(messages)
+    if OUTBOUND_OVERFLOW_POLICY == "slow_down":
+        return ["busy"] * len(messages)
+    statuses = await queue_for_offline_receiver(public_key_to, messages, event)
+    outbound.spill(
+        receiver_sid, lambda: flush_offline_messages(receiver_sid, public_key_to)
+    )
+    return statuses
+
+
+@on("connect")
+@instrumented("connect")
 async def handle_connect(sid, environ: Any, auth: Any) -> None:
+    """Admit the connecting user or refuse the connection.
+
+    Refused clients get the reason in the "connect_error" event. The public key
+    sent on connect only counts once the user authenticates with it, with a
+    challenge or a resumption ticket.
+    """
     logger.info(f"User connected sid={sid}.")
-    if not validate_connect_payload(auth):
-        logger.info("Bad payload. Dropping connection.")
-        logger.debug(f"{auth=}")
-    else:
-        PUBLIC_KEYS_SIDS_MAPPING[auth["publicKey"]] = sid
-        logger.info("User connected. User's public key and sid saved.")
+    payload = validate_connect_payload(auth)
+    if not payload:
+        logger.info("Bad payload. Refusing connection.")
+        logger.debug("auth={}", auth)
+        REFUSED_CONNECTIONS.inc("payload")
+        raise ConnectionRefusedError(MISSING_PUBLIC_KEY_DROP_CONNECTION_MESSAGE)
+    refusal = admission.admit(sid)
+    if refusal:
+        logger.info(refusal)
+        REFUSED_CONNECTIONS.inc("limit")
+        raise ConnectionRefusedError(refusal)
+    logger.info("User connected. Waiting for authentication.")
+    if payload.ticket and RESUMPTION_TICKET_TTL_SECONDS > 0:
+        # Tickets of keys which were changed or removed since are revoked
+        key_version = await db_manager.get_key_version(payload.public_key)
+        if key_version is not None and tickets.verify(
+            payload.ticket, payload.public_key, key_version
+        ):
+            logger.info("Valid resumption ticket. User authenticated.")
+            await complete_authentication(sid, payload.public_key, issue_ticket=False)
+        else:
+            logger.info("Invalid, expired or revoked resumption ticket.")
 
 
-@socket_manager.on("disconnect")  # type: ignore
+@on("disconnect")
+@instrumented("disconnect")
 async def handle_disconnect(sid) -> None:
     logger.info(f"User disconnected sid={sid}.")
-    PUBLIC_KEYS_SIDS_MAPPING.inverse.pop(sid, None)
-    SID_TO_CHALLENGE_MAPPING.pop(sid, None)
-    try:
-        AUTHENTICATED_USERS.remove(sid)
-    except KeyError:
-        logger.info("User wasn't in AUTHENTICATED_USERS.")
-        logger.debug(f"AUTHENTICATED_USERS={AUTHENTICATED_USERS}")
+    public_key = await presence.get_public_key(sid)
+    await presence.unbind(sid)
+    challenges.discard(sid)
+    await deliveries.drop(sid)
+    await attachments.drop(sid)
+    rate_limiter.unbind(sid)
+    admission.release(sid)
+    presence_subscriptions.pop(sid, None)
     logger.info("Client's sid and public key removed from mapping.")
+    # Only sessions of authenticated users are bound to a public key. A session
+    # replaced by a newer one of the same user isn't bound anymore either.
+    if public_key:
+        await publish_presence(public_key, online=False)
+
 
+@on("registerInit")
+@instrumented("registerInit")
+@limited("registerInit", rejected=None)
+async def handle_register_init(sid: str) -> str | None:
+    """Request for challenge to authenticate or register a user.
 
-@socket_manager.on("registerInit")  # type: ignore
-async def handle_register_init(sid: str) -> str:
-    """Request for challenge to authenticate or register a user."""
+    Answers with the challenge to sign, or "already authenticated". Answers with
+    None when no challenge can be issued, because the sid used up its challenges,
+    too many are pending or the sid is throttled, so the client never signs an
+    answer which isn't a challenge.
+    """
     logger.info(f'Received "registerInit" event from sid={sid}.')
-    if is_authenticated(sid):
+    if await presence.is_authenticated(sid):
         logger.info("User already authenticated. Ignoring request.")
         return "already authenticated"
-    if existing_challenge := SID_TO_CHALLENGE_MAPPING.get(sid, None):
-        logger.info("Re-sending the same challenge.")
-        return existing_challenge
-    challenge = generate_challenge()
-    SID_TO_CHALLENGE_MAPPING[sid] = challenge
+    challenge = challenges.issue(sid)
+    if not challenge:
+        logger.info("Challenge refused. Returning no challenge.")
     return challenge
 
 
-@socket_manager.on("registerFollowUp")  # type: ignore
+@on("registerFollowUp")
+@instrumented("registerFollowUp")
+@limited("registerFollowUp", rejected="error")
 async def handle_register_follow_up(sid: str, data: Any) -> ResponseStatusType:
     logger.info(f'Received "registerFollowUp" event from sid={sid}.')
-    logger.debug(f"Received data={data}")
-    if not validate_register_follow_up_payload(data):
+    logger.debug("Received data={}", data)
+    payload = validate_register_follow_up_payload(data)
+    if not payload:
         logger.info("Bad payload. Returning status: error.")
         return "error"
     # Verify challenge
-    challenge = SID_TO_CHALLENGE_MAPPING.get(sid, None)
+    challenge = challenges.consume(sid)
     if not challenge:
-        logger.info("Challenge not found. Authentication unsuccessful.")
+        logger.info("Challenge not found or expired. Authentication unsuccessful.")
         return "error"
-    logger.debug(f"challenge={challenge}")
-    try:
-        rsa.verify(
-            message=challenge.encode(),
-            signature=base64.b64decode(data["signature"]),
-            pub_key=rsa.PublicKey.load_pkcs1(data["publicKey"]),
-        )
-        logger.info("Challenge verification successful.")
-    except rsa.VerificationError:
+    logger.debug("challenge={}", challenge)
+    if not await signature_verifier.verify(
+        challenge, payload.signature, payload.public_key
+    ):
         logger.info("Challenge verification failed. Authentication unsuccessful.")
         return "error"
+    logger.info("Challenge verification successful.")
 
     logger.info(
         "Verifying if user with that public key already exists in the database."
     )
-    user = db_manager.get_user_by_login(data["login"])
+    user = await db_manager.get_user_by_login(payload.login)
 
     if user:
         logger.info(
@@ -123,30 +585,32 @@ async def handle_register_follow_up(sid: str, data: Any) -> ResponseStatusType:
                 "Verifying if public key and login match."
             )
         )
-        if user.public_key != data["publicKey"] or user.login != data["login"]:
+        if user.public_key != payload.public_key or user.login != payload.login:
             logger.info("Public key doesn't match. Authentication unsuccessful.")
             return "error"
         else:
-            AUTHENTICATED_USERS.add(sid)
+            await complete_authentication(sid, payload.public_key)
             logger.info("Authentication of existing user successful.")
             return "success"
     else:
         logger.info("User with that public key doesn't exist. Registering...")
         user = User(
-            login=data["login"],
-            public_key=data["publicKey"],
+            login=payload.login,
+            public_key=payload.public_key,
         )
-        insert_successful = db_manager.add_user(user)
+        insert_successful = await db_manager.add_user(user)
         if insert_successful:
             logger.info("User registered successfully.")
-            AUTHENTICATED_USERS.add(sid)
+            await complete_authentication(sid, payload.public_key)
             return "success"
         else:
             logger.error("Failed to register user due to database write error.")
             return "error"
 
 
-@socket_manager.on("chatInit")  # type: ignore
+@on("chatInit")
+@instrumented("chatInit")
+@limited("chatInit", rejected=None)
 async def handle_chat_init(sender_sid: str, data: Any) -> str | None:
     """Exchanges chatInit messages between users.
 
@@ -155,149 +619,492 @@ async def handle_chat_init(sender_sid: str, data: Any) -> str | None:
     and receives the second part of the session key from the other user.
     """
     logger.info(f'Received "chatInit" event from sid={sender_sid}.')
-    logger.debug(f"Received data={data}.")
-    if not validate_chat_init_payload(data):
+    logger.debug("Received data={}.", data)
+    payload = validate_chat_init_payload(data)
+    if not payload:
         logger.info("Bad payload. Ignoring request.")
         return None
-    receiver_sid = PUBLIC_KEYS_SIDS_MAPPING.get(data["publicKeyTo"], None)
+    receiver_sid = await presence.get_sid(payload.public_key_to)
     if not receiver_sid:
         logger.info("Receiver not connected. Ignoring request.")
         return None
-    if not is_authenticated(sender_sid) or not is_authenticated(receiver_sid):
+    sender_authenticated = await presence.is_authenticated(sender_sid)
+    if not sender_authenticated or not await presence.is_authenticated(receiver_sid):
         logger.info("User not authenticated. Ignoring request.")
         return None
-    logger.debug(f"sender_sid={sender_sid}, receiver_sid={receiver_sid}")
+    logger.debug("sender_sid={}, receiver_sid={}", sender_sid, receiver_sid)
     logger.info("Forwarding chatInit request to the second client.")
     try:
         response: str | None = await socket_manager.call(
-            "chatInit", data=data, to=receiver_sid
+            "chatInit", data=payload.forwarded(), to=receiver_sid
         )
-        logger.debug(f"response={response}")
+        logger.debug("response={}", response)
         logger.info("Returning response to the first client.")
         return response
     except TimeoutError:
         logger.error("TimeoutError while waiting for response from second client.")
+        EVENT_TIMEOUTS.inc("chatInit")
         return None
 
 
-@socket_manager.on("chat")  # type: ignore
-async def handle_chat(sender_sid: str, data: Any) -> ResponseStatusType:
-    """Forwards messages between clients."""
-    logger.info(f'Received "chat" event from sid={sender_sid}.')
-    logger.debug(f"Received data={data}.")
-    if not validate_chat_payload(data):
-        logger.info("Bad payload. Returning status: error.")
-        return "error"
-    logger.debug(f"PUBLIC_KEYS_SIDS_MAPPING={PUBLIC_KEYS_SIDS_MAPPING}")
-    logger.debug(f"AUTHENTICATED_USERS={AUTHENTICATED_USERS}")
-    # Check if both parties are online
-    sender_key = PUBLIC_KEYS_SIDS_MAPPING.inverse.get(sender_sid, None)
-    receiver_sid = PUBLIC_KEYS_SIDS_MAPPING.get(data["publicKeyTo"], None)
-    logger.debug(f"sender_key={sender_key}, receiver_sid={receiver_sid}")
-    if not sender_key or not receiver_sid:
-        logger.info(
-            (
-                "One of the users is not logged in to the server. "
-                "Message may not reach the receiver."
-            )
-        )
-        return "error"
-
-    # Check if both parties are authenticated
-    if not is_authenticated(sender_sid):
-        logger.info("Message sender is not authenticated. Ignoring the message.")
-        return "error"
-    if not is_authenticated(receiver_sid):
-        logger.info("Message receiver is not authenticated. Withholding the message.")
-        return "error"
+async def forward_chat(
+    sender_sid: str, payload: ChatPayload
+) -> ResponseStatusType | ChatAcceptedResponseType:
+    """Deliver the message to its receiver or queue it if they are offline."""
+    # Queue the message if the receiver is offline or not authenticated yet
+    message = payload.forwarded()
+    receiver_sid = await presence.get_sid(payload.public_key_to)
+    logger.debug("receiver_sid={}", receiver_sid)
+    if not receiver_sid or not await presence.is_authenticated(receiver_sid):
+        sampled_logger.info("Message receiver is not online. Queueing the message.")
+        (status,) = await queue_for_offline_receiver(payload.public_key_to, [message])
+        return status
 
     # All conditions met, forwarding the message
+    if DELIVERY_MODE == "pipelined":
+        delivery_id = await deliveries.start(sender_sid, receiver_sid, message)
+        if not delivery_id:
+            return "error"
+        sampled_logger.info("Message accepted for delivery.")
+        return {"status": "accepted", "deliveryId": delivery_id}
     try:
-        receiver_response: bool = await socket_manager.call(
-            "chat",
-            data,
-            to=receiver_sid,
-        )  # type: ignore
-        logger.info("Message forwarded successfully.")
-        logger.debug(f"Message forwarded to receiver: {data['publicKeyTo']}")
+        receiver_response = await outbound.send(receiver_sid, "chat", message)
+        if receiver_response is None:
+            sampled_logger.info("Receiver's outbound queue is full.")
+            (status,) = await handle_outbound_overflow(
+                receiver_sid, payload.public_key_to, [message]
+            )
+            return status
+        sampled_logger.info("Message forwarded successfully.")
+        logger.debug("Message forwarded to receiver: {}", payload.public_key_to)
         if receiver_response:
-            logger.info("Receiver responded with success.")
+            sampled_logger.info("Receiver responded with success.")
             return "success"
         else:
             return "error"
     except TimeoutError:
         logger.error("TimeoutError while waiting for response from second client.")
+        EVENT_TIMEOUTS.inc("chat")
         return "error"
 
 
-@socket_manager.on("checkKey")  # type: ignore
+@on("chat")
+@instrumented("chat")
+@limited("chat", rejected="busy")
+async def handle_chat(
+    sender_sid: str, data: Any
+) -> ResponseStatusType | ChatAcceptedResponseType:
+    """Forwards messages between clients.
+
+    In "call" delivery mode the sender's ack waits for the receiver's ack. In
+    "pipelined" mode the message is accepted right away and the receiver's ack
+    comes back to the sender later as a "delivered" event with the delivery id.
+    A message with a "messageId" is delivered once, retries get the outcome of
+    the first delivery.
+    """
+    sampled_logger.info('Received "chat" event from sid={}.', sender_sid)
+    logger.debug("Received data={}.", data)
+    payload = validate_chat_payload(data)
+    if not payload:
+        logger.info("Bad payload. Returning status: error.")
+        return "error"
+    # Check if the sender is logged in and authenticated
+    sender_key = await presence.get_public_key(sender_sid)
+    logger.debug("sender_key={}", sender_key)
+    if not sender_key:
+        logger.info("Message sender is not logged in to the server.")
+        return "error"
+    if not await presence.is_authenticated(sender_sid):
+        logger.info("Message sender is not authenticated. Ignoring the message.")
+        return "error"
+
+    if payload.message_id:
+        return await deduplicator.deliver_once(
+            (sender_key, payload.message_id),
+            lambda: forward_chat(sender_sid, payload),
+        )
+    return await forward_chat(sender_sid, payload)
+
+
+@on("chatBatch")
+@instrumented("chatBatch")
+@limited("chatBatch", rejected="busy")
+async def handle_chat_batch(
+    sender_sid: str, data: Any
+) -> list[ResponseStatusType] | ResponseStatusType:
+    """Forwards a batch of messages with one round-trip per receiver.
+
+    Returns statuses of the messages in the order they were sent. Messages with a
+    "messageId" are delivered once, like single "chat" messages.
+    """
+    sampled_logger.info('Received "chatBatch" event from sid={}.', sender_sid)
+    batch = validate_chat_batch_payload(data, CHAT_BATCH_MAX_SIZE)
+    if not batch:
+        logger.info("Bad payload. Returning status: error.")
+        return "error"
+    sender_key = await presence.get_public_key(sender_sid)
+    if not sender_key:
+        logger.info("Message sender is not logged in to the server.")
+        return "error"
+    if not await presence.is_authenticated(sender_sid):
+        logger.info("Message sender is not authenticated. Ignoring the messages.")
+        return "error"
+
+    async def deliver(
+        public_key_to: str, indexes: list[int], statuses: dict[int, ResponseStatusType]
+    ) -> None:
+        messages = [batch[index].forwarded() for index in indexes]  # type: ignore
+        results: list[ResponseStatusType]
+        receiver_sid = await presence.get_sid(public_key_to)
+        if not receiver_sid or not await presence.is_authenticated(receiver_sid):
+            results = await queue_for_offline_receiver(public_key_to, messages)
+        else:
+            try:
+                response = await outbound.send(receiver_sid, "chatBatch", messages)
+            except TimeoutError:
+                logger.error("TimeoutError while waiting for response from receiver.")
+                EVENT_TIMEOUTS.inc("chatBatch")
+                response = False
+            if response is None:
+                results = await handle_outbound_overflow(
+                    receiver_sid, public_key_to, messages
+                )
+            else:
+                results = ["success" if response else "error"] * len(indexes)
+        for index, status in zip(indexes, results):
+            statuses[index] = status
+
+    async def forward(indexes: list[int]) -> list[ResponseStatusType]:
+        statuses: dict[int, ResponseStatusType] = dict.fromkeys(indexes, "error")
+        receivers: defaultdict[str, list[int]] = defaultdict(list)
+        for index in indexes:
+            payload = batch[index]  # type: ignore
+            if payload:
+                receivers[payload.public_key_to].append(index)
+        sampled_logger.info(
+            "Forwarding {} messages to {} receivers.", len(indexes), len(receivers)
+        )
+        await asyncio.gather(
+            *(
+                deliver(public_key_to, receiver_indexes, statuses)
+                for public_key_to, receiver_indexes in receivers.items()
+            )
+        )
+        return [statuses[index] for index in indexes]
+
+    return await deduplicator.deliver_each_once(
+        [
+            (sender_key, payload.message_id) if payload and payload.message_id else None
+            for payload in batch
+        ],
+        forward,
+    )
+
+
+def fan_out_cost(data: Any = None) -> int:
+    """Count recipients of a fan-out message, each of them takes a chat token."""
+    recipients = data.get("recipients", None) if isinstance(data, dict) else None
+    return len(recipients) if isinstance(recipients, list) and recipients else 1
+
+
+@on("chatFanOut")
+@instrumented("chatFanOut")
+@limited("chatFanOut", rejected="busy", cost=fan_out_cost)
+async def handle_chat_fan_out(
+    sender_sid: str, data: Any
+) -> list[ResponseStatusType] | ResponseStatusType:
+    """Forwards a message with a shared body to many recipients.
+
+    The body is uploaded once and every recipient gets it with their own
+    envelope in a "chatFanOut" event, offline recipients once they are back.
+    Recipients are served concurrently and each of them counts against the
+    sender's chat rate limit. Returns statuses of the recipients in the order
+    they were listed.
+    """
+    sampled_logger.info('Received "chatFanOut" event from sid={}.', sender_sid)
+    payload = validate_chat_fan_out_payload(data, FANOUT_MAX_RECIPIENTS)
+    if not payload:
+        logger.info("Bad payload. Returning status: error.")
+        return "error"
+    if not await presence.get_public_key(sender_sid):
+        logger.info("Message sender is not logged in to the server.")
+        return "error"
+    if not await presence.is_authenticated(sender_sid):
+        logger.info("Message sender is not authenticated. Ignoring the message.")
+        return "error"
+
+    async def deliver(
+        public_key_to: str, message: dict[str, Any]
+    ) -> ResponseStatusType:
+        receiver_sid = await presence.get_sid(public_key_to)
+        if not receiver_sid or not await presence.is_authenticated(receiver_sid):
+            (status,) = await queue_for_offline_receiver(
+                public_key_to, [message], "chatFanOut"
+            )
+            return status
+        try:
+            response = await outbound.send(receiver_sid, "chatFanOut", message)
+        except TimeoutError:
+            logger.error("TimeoutError while waiting for response from receiver.")
+            EVENT_TIMEOUTS.inc("chatFanOut")
+            return "error"
+        if response is None:
+            (status,) = await handle_outbound_overflow(
+                receiver_sid, public_key_to, [message], "chatFanOut"
+            )
+            return status
+        return "success" if response else "error"
+
+    sampled_logger.info("Forwarding message to {} recipients.", len(payload.recipients))
+    # Messages of all recipients refer to the same body
+    shared = payload.shared()
+    return list(
+        await asyncio.gather(
+            *(
+                deliver(recipient.public_key_to, {**shared, **recipient.forwarded()})
+                for recipient in payload.recipients
+            )
+        )
+    )
+
+
+@on("attachmentStart")
+@instrumented("attachmentStart")
+@limited("attachmentStart", rejected="error")
+async def handle_attachment_start(
+    sender_sid: str, data: Any
+) -> AttachmentAcceptedResponseType | ResponseStatusType:
+    """Start relaying an encrypted attachment to an online receiver.
+
+    The attachment is then sent in binary "attachmentChunk" events with the
+    returned upload id and closed with an "attachmentEnd" event.
+    """
+    logger.info(f'Received "attachmentStart" event from sid={sender_sid}.')
+    payload = validate_attachment_start_payload(data)
+    if not payload:
+        logger.info("Bad payload. Returning status: error.")
+        return "error"
+    sender_key = await presence.get_public_key(sender_sid)
+    if not sender_key or not await presence.is_authenticated(sender_sid):
+        logger.info("Attachment sender is not authenticated. Ignoring the request.")
+        return "error"
+    receiver_sid = await presence.get_sid(payload.public_key_to)
+    if not receiver_sid or not await presence.is_authenticated(receiver_sid):
+        logger.info("Attachment receiver is not online. Returning status: error.")
+        return "error"
+    upload_id = await attachments.start(
+        sender_sid,
+        receiver_sid,
+        payload.size,
+        {"publicKeyFrom": sender_key, "kind": payload.kind},
+    )
+    if not upload_id:
+        return "error"
+    return {"status": "accepted", "uploadId": upload_id}
+
+
+@on("attachmentChunk")
+@instrumented("attachmentChunk")
+async def handle_attachment_chunk(sender_sid: str, data: Any) -> ResponseStatusType:
+    """Forward a binary chunk of an attachment to its receiver."""
+    payload = validate_attachment_chunk_payload(data)
+    if not payload:
+        logger.info("Bad payload. Returning status: error.")
+        return "error"
+    return await attachments.relay(
+        sender_sid, payload.upload_id, payload.index, payload.data
+    )
+
+
+@on("attachmentEnd")
+@instrumented("attachmentEnd")
+async def handle_attachment_end(sender_sid: str, data: Any) -> ResponseStatusType:
+    """Finish relaying an attachment after all its chunks were delivered."""
+    logger.info(f'Received "attachmentEnd" event from sid={sender_sid}.')
+    payload = validate_attachment_end_payload(data)
+    if not payload:
+        logger.info("Bad payload. Returning status: error.")
+        return "error"
+    return await attachments.finish(sender_sid, payload.upload_id)
+
+
+@on("checkKey")
+@instrumented("checkKey")
+@limited("checkKey", rejected=False)
 async def handle_check_public_key_exists(sid: str, data: Any) -> bool:
     """Check if the public_key exists on server."""
-    logger.info('Received "checkKey" event.')
-    logger.debug(f"data={data}.")
+    sampled_logger.info('Received "checkKey" event.')
+    logger.debug("data={}.", data)
     if not validate_check_key_payload(data):
         logger.info("Bad payload. Returning False.")
         return False
-    elif not is_authenticated(sid):
+    elif not await presence.is_authenticated(sid):
         logger.info("User not authenticated. Returning False.")
         return False
     else:
-        result = db_manager.check_public_key(data)
-        logger.debug(
-            f'User with public key={data} exists: {result}'
-        )
+        result = await db_manager.check_public_key(data)
+        logger.debug("User with public key={} exists: {}", data, result)
         return result
 
 
-@socket_manager.on("checkOnline")  # type: ignore
+@on("syncDirectory")
+@instrumented("syncDirectory")
+@limited("syncDirectory", rejected=False)
+async def handle_sync_directory(sid: str, data: Any) -> dict[str, Any] | bool:
+    """Get changes of contacts' public keys since the last sync.
+
+    Client sends the last directory version it saw and fingerprints of its
+    contacts' keys. Response has the current version and, for each fingerprint
+    whose owner changed their key or is no longer registered, the new public key
+    or None.
+    """
+    logger.info(f'Received "syncDirectory" event from sid={sid}.')
+    payload = validate_sync_directory_payload(data, DIRECTORY_SYNC_MAX_SIZE)
+    if not payload:
+        logger.info("Bad payload. Returning False.")
+        return False
+    if not await presence.is_authenticated(sid):
+        logger.info("User not authenticated. Returning False.")
+        return False
+    directory_changes = await db_manager.get_directory_changes(
+        payload.version,
+        [bytes.fromhex(fingerprint) for fingerprint in payload.fingerprints],
+    )
+    logger.info(f"Found {len(directory_changes.changes)} changed contacts.")
+    return {
+        "version": directory_changes.version,
+        "changes": [
+            {"fingerprint": fingerprint.hex(), "publicKey": public_key}
+            for fingerprint, public_key in directory_changes.changes.items()
+        ],
+    }
+
+
+@on("checkOnline")
+@instrumented("checkOnline")
+@limited("checkOnline", rejected=False)
 async def handle_check_online_status(sid: str, data: Any) -> bool:
     """Check if the user with given public key is currently connected."""
-    logger.info('Received "checkOnline" event.')
-    logger.debug(f"data={data}.")
-    logger.debug(f"PUBLIC_KEYS_SIDS_MAPPING={PUBLIC_KEYS_SIDS_MAPPING}")
-    logger.debug(f"AUTHENTICATED_USERS={AUTHENTICATED_USERS}")
+    sampled_logger.info('Received "checkOnline" event.')
+    logger.debug("data={}.", data)
     if not validate_check_online_payload(data):
         logger.info("Bad payload. Returning False.")
         return False
-    elif not is_authenticated(sid):
+    elif not await presence.is_authenticated(sid):
         logger.info("User not authenticated. Returning False.")
         return False
     else:
-        result = data in PUBLIC_KEYS_SIDS_MAPPING.keys()
-        logger.debug(f"User is online: {result}")
+        result = await presence.is_online(data)
+        logger.debug("User is online: {}", result)
         return result
 
 
-@socket_manager.on("updatePublicKey")  # type: ignore
+@on("checkOnlineBulk")
+@instrumented("checkOnlineBulk")
+@limited("checkOnlineBulk", rejected=False)
+async def handle_check_online_status_bulk(sid: str, data: Any) -> list[bool] | bool:
+    """Check which of the users with given public keys are currently connected."""
+    sampled_logger.info('Received "checkOnlineBulk" event.')
+    if not validate_public_keys_list_payload(data, PRESENCE_BULK_MAX_SIZE):
+        logger.info("Bad payload. Returning False.")
+        return False
+    if not await presence.is_authenticated(sid):
+        logger.info("User not authenticated. Returning False.")
+        return False
+    return await presence.are_online(data)
+
+
+@on("subscribePresence")
+@instrumented("subscribePresence")
+@limited("subscribePresence", rejected=False)
+async def handle_subscribe_presence(sid: str, data: Any) -> list[bool] | bool:
+    """Subscribe to online status changes of users with given public keys.
+
+    Changes are pushed as "presence" events. Returns current online statuses of
+    the users, so the client doesn't have to poll for the initial state. A socket
+    may be subscribed to at most `PRESENCE_MAX_SUBSCRIPTIONS` users, requests
+    which would exceed the limit are rejected as a whole.
+    """
+    logger.info(f'Received "subscribePresence" event from sid={sid}.')
+    if not validate_public_keys_list_payload(data, PRESENCE_BULK_MAX_SIZE):
+        logger.info("Bad payload. Returning False.")
+        return False
+    if not await presence.is_authenticated(sid):
+        logger.info("User not authenticated. Returning False.")
+        return False
+    rooms = {presence_room(public_key) for public_key in data}
+    subscribed = presence_subscriptions.setdefault(sid, set())
+    if len(subscribed | rooms) > PRESENCE_MAX_SUBSCRIPTIONS:
+        logger.info("Too many presence subscriptions. Returning False.")
+        return False
+    for room in rooms - subscribed:
+        await socket_manager.enter_room(sid, room)
+    subscribed |= rooms
+    logger.info(f"Subscribed to presence of {len(data)} users.")
+    return await presence.are_online(data)
+
+
+@on("unsubscribePresence")
+@instrumented("unsubscribePresence")
+@limited("unsubscribePresence", rejected=False)
+async def handle_unsubscribe_presence(sid: str, data: Any) -> bool:
+    """Stop receiving online status changes of users with given public keys."""
+    logger.info(f'Received "unsubscribePresence" event from sid={sid}.')
+    if not validate_public_keys_list_payload(data, PRESENCE_BULK_MAX_SIZE):
+        logger.info("Bad payload. Returning False.")
+        return False
+    subscribed = presence_subscriptions.get(sid, set())
+    for public_key in data:
+        room = presence_room(public_key)
+        await socket_manager.leave_room(sid, room)
+        subscribed.discard(room)
+    return True
+
+
+@on("updatePublicKey")
+@instrumented("updatePublicKey")
+@limited("updatePublicKey", rejected=False)
 async def handle_update_public_key(sid: str, data: Any) -> bool:
     """Handle user login update."""
     logger.info('Received "updatePublicKey" event.')
-    logger.debug(f"data={data}.")
-    if not validate_update_public_key_payload(data):
+    logger.debug("data={}.", data)
+    payload = validate_update_public_key_payload(data)
+    if not payload:
         logger.info("Bad payload. Returning False.")
         return False
-    if not is_authenticated(sid):
+    if not await presence.is_authenticated(sid):
         logger.info("User not authenticated. Returning False.")
         return False
-    user = db_manager.get_user_by_login(data["login"])
-    if user and user.public_key != PUBLIC_KEYS_SIDS_MAPPING.inverse.get(sid, None):
+    user = await db_manager.get_user_by_login(payload.login)
+    current_public_key = await presence.get_public_key(sid)
+    if user and user.public_key != current_public_key:
         logger.info(
             "Provided login doesn't belong to requesting user. Returning False."
         )
         return False
     logger.info("Login and public key match. Updating user's public key.")
-    update_successful = db_manager.update_user(
-        login=data["login"], new_public_key=data["publicKey"]
+    update_successful = await db_manager.update_user(
+        login=payload.login, new_public_key=payload.public_key
     )
     if update_successful:
         logger.info("User's public key changed successfully.")
         logger.debug(
-            f"User's public key changed from: "
-            f"{PUBLIC_KEYS_SIDS_MAPPING.inverse.get(sid)} to: {data['publicKey']}"
+            "User's public key changed from: {} to: {}",
+            current_public_key,
+            payload.public_key,
         )
-        PUBLIC_KEYS_SIDS_MAPPING.inverse[sid] = data["publicKey"]
-        logger.info("User's public key updated in PUBLIC_KEYS_SIDS_MAPPING.")
-        logger.debug(f"{PUBLIC_KEYS_SIDS_MAPPING=}")
+        # The session with the new key, if any, is replaced by this one
+        previous_sid = await presence.get_sid(payload.public_key)
+        await presence.rebind(sid, payload.public_key)
+        rate_limiter.bind(sid, payload.public_key)
+        logger.info("User's public key updated in presence registry.")
+        if previous_sid and previous_sid != sid:
+            await socket_manager.disconnect(previous_sid)
+        if current_public_key:
+            await publish_presence(current_public_key, online=False)
+        await publish_presence(payload.public_key, online=True)
+        # Tickets for the previous key are revoked, the client gets a new one
+        await send_ticket(sid, payload.public_key)
         return True
     else:
         logger.error("Failed to update user's public key due to database write error.")
@@ -308,8 +1115,9 @@ if __name__ == "__main__":
     import uvicorn
 
     uvicorn.run(
-        f"{Path(__file__).stem}:app",
+        f"{Path(__file__).stem}:create_app",
         host=HOST_ADDRESS,
         port=HOST_PORT,
         reload=True,
+        factory=True,
     )
@@ -1,3 +1,6 @@
 MISSING_PUBLIC_KEY_DROP_CONNECTION_MESSAGE = (
     "Public key not provided. Rejecting connection."
 )
+TOO_MANY_CONNECTIONS_DROP_CONNECTION_MESSAGE = (
+    "Too many connections to the server. Rejecting connection."
+)
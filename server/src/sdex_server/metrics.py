@@ -0,0 +1,280 @@
+"""Minimal in-process metrics exposed in the Prometheus text format.
+
+Metrics have at most one label. Updating a metric is a dictionary lookup and an
+addition under a lock, so handlers and database threads can record them on every
+call.
+"""
+import bisect
+import functools
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+# Upper bounds of latency histogram buckets in seconds
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+class Metric(ABC):
+    """Base class of metrics with an optional label.
+
+    Metrics add themselves to the given registry, by default to the one rendered
+    on the metrics endpoint.
+    """
+
+    type = ""
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        label: str = "",
+        registry: list["Metric"] | None = None,
+    ) -> None:
+        self.name = name
+        self.description = description
+        self.label = label
+        self._lock = threading.Lock()
+        (REGISTRY if registry is None else registry).append(self)
+
+    def _series_name(self, label_value: str, suffix: str = "", extra: str = "") -> str:
+        labels = [f'{self.label}="{label_value}"'] if self.label else []
+        if extra:
+            labels.append(extra)
+        return f"{self.name}{suffix}{{{','.join(labels)}}}" if labels else self.name
+
+    @abstractmethod
+    def samples(self) -> list[str]:
+        """Get lines with the current values of all series of the metric."""
+
+    def render(self) -> str:
+        header = (
+            f"# HELP {self.name} {self.description}\n# TYPE {self.name} {self.type}"
+        )
+        return "\n".join([header, *self.samples()])
+
+
+class Counter(Metric):
+    """Value which only goes up."""
+
+    type = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        label: str = "",
+        registry: list[Metric] | None = None,
+    ) -> None:
+        super().__init__(name, description, label, registry)
+        self._values: dict[str, float] = {}
+
+    def inc(self, label_value: str = "", amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def value(self, label_value: str = "") -> float:
+        return self._values.get(label_value, 0)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self._series_name(label)} {value}" for label, value in values]
+
+
+class Gauge(Metric):
+    """Value which is set to the current state, e.g. number of connections."""
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        label: str = "",
+        registry: list[Metric] | None = None,
+    ) -> None:
+        super().__init__(name, description, label, registry)
+        self._values: dict[str, float] = {}
+
+    def set(self, value: float, label_value: str = "") -> None:
+        with self._lock:
+            self._values[label_value] = value
+
+    def value(self, label_value: str = "") -> float:
+        return self._values.get(label_value, 0)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self._series_name(label)} {value}" for label, value in values]
+
+
+class Histogram(Metric):
+    """Distribution of observed values counted in cumulative buckets."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        label: str = "",
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+        registry: list[Metric] | None = None,
+    ) -> None:
+        super().__init__(name, description, label, registry)
+        self.buckets = buckets
+        # Per label value: counts of values falling into each bucket (the last one
+        # for values above all bounds), their sum and count
+        self._counts: dict[str, list[int]] = {}
+        self._sums: dict[str, float] = {}
+
+    def observe(self, value: float, label_value: str = "") -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(label_value, None)
+            if counts is None:
+                counts = self._counts[label_value] = [0] * (len(self.buckets) + 1)
+                self._sums[label_value] = 0.0
+            counts[index] += 1
+            self._sums[label_value] += value
+
+    def count(self, label_value: str = "") -> int:
+        return sum(self._counts.get(label_value, []))
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            series = [
+                (label, list(counts), self._sums[label])
+                for label, counts in self._counts.items()
+            ]
+        lines = []
+        for label, counts, total in series:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                bucket = self._series_name(label, "_bucket", f'le="{bound}"')
+                lines.append(f"{bucket} {cumulative}")
+            lines.append(f"{self._series_name(label, '_sum')} {total}")
+            lines.append(f"{self._series_name(label, '_count')} {cumulative}")
+        return lines
+
+
+REGISTRY: list[Metric] = []
+
+EVENTS = Counter("sdex_events_total", "Handled Socket.IO events.", "event")
+EVENT_ERRORS = Counter(
+    "sdex_event_errors_total",
+    'Events which failed or returned an "error" status.',
+    "event",
+)
+EVENT_TIMEOUTS = Counter(
+    "sdex_event_timeouts_total",
+    "Events which timed out waiting for another client's response.",
+    "event",
+)
+REFUSED_CONNECTIONS = Counter(
+    "sdex_refused_connections_total", "Connections refused on connect.", "reason"
+)
+REAPED_CONNECTIONS = Counter(
+    "sdex_reaped_connections_total",
+    "Connections dropped for not authenticating in time.",
+)
+THROTTLED_EVENTS = Counter(
+    "sdex_throttled_events_total", "Events rejected by the rate limiter.", "event"
+)
+DEDUPLICATED_MESSAGES = Counter(
+    "sdex_deduplicated_messages_total",
+    "Retried messages answered with the outcome of their first delivery.",
+)
+EVENT_LATENCY = Histogram(
+    "sdex_event_duration_seconds", "Time spent handling Socket.IO events.", "event"
+)
+DB_QUERY_LATENCY = Histogram(
+    "sdex_db_query_duration_seconds",
+    "Time spent running database queries on worker threads.",
+    "operation",
+)
+DB_BATCHED_WRITES = Histogram(
+    "sdex_db_batched_writes",
+    "Writes committed together in one database transaction.",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200),
+)
+CONNECTED_SIDS = Gauge("sdex_connected_sids", "Sids connected to this worker.")
+AUTHENTICATED_USERS = Gauge(
+    "sdex_authenticated_users", "Authenticated users connected to this worker."
+)
+PENDING_CHALLENGES = Gauge(
+    "sdex_pending_challenges", "Authentication challenges waiting for an answer."
+)
+PENDING_DELIVERIES = Gauge(
+    "sdex_pending_deliveries", "Pipelined deliveries waiting for receiver's ack."
+)
+OUTBOUND_QUEUED = Gauge(
+    "sdex_outbound_queued", "Messages queued or in flight to connected receivers."
+)
+OUTBOUND_OVERFLOWS = Counter(
+    "sdex_outbound_overflows_total",
+    "Messages which didn't fit in their receiver's outbound queue.",
+    "policy",
+)
+ATTACHMENT_TRANSFERS = Gauge(
+    "sdex_attachment_transfers", "Attachments being relayed in chunks."
+)
+
+
+def is_error_response(response: Any) -> bool:
+    """Check if a handler's response tells the client the request failed."""
+    if isinstance(response, dict):
+        response = response.get("status", None)
+    return response is False or response == "error"
+
+
+def instrumented(
+    event: str,
+) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """Count calls and errors of a Socket.IO event handler and time them."""
+
+    def decorator(handler: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        @functools.wraps(handler)
+        async def wrapper(*args: Any) -> T:
+            EVENTS.inc(event)
+            started = time.perf_counter()
+            try:
+                response = await handler(*args)
+            except Exception:
+                EVENT_ERRORS.inc(event)
+                raise
+            finally:
+                EVENT_LATENCY.observe(time.perf_counter() - started, event)
+            if is_error_response(response):
+                EVENT_ERRORS.inc(event)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def render(registry: list[Metric] | None = None) -> str:
+    """Render all metrics of the registry in the Prometheus text format."""
+    metrics = REGISTRY if registry is None else registry
+    return "\n".join(metric.render() for metric in metrics) + "\n"
@@ -1,3 +1,4 @@
+import functools
 import os
 from pathlib import Path
 
@@ -6,6 +7,13 @@ from dotenv import load_dotenv
 
 load_dotenv(dotenv_path=Path(__file__).parent.parent.parent / ".env")
 
+# Minimum level of logged records
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Write logs from a background thread instead of the event loop
+LOG_ENQUEUE = os.getenv("LOG_ENQUEUE", "true").lower() in ("1", "true", "yes")
+# Log only every n-th record of high-frequency events like forwarded messages
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "100"))
+
 _env_path = os.getenv("SQLITE_DB_PATH")
 if not _env_path:
     raise EnvironmentError("SQLITE_DB_PATH environment variable is not set.")
@@ -21,31 +29,169 @@ if not _host_port:
     raise EnvironmentError("HOST_ADDRESS environment variable is not set.")
 HOST_PORT = int(_host_port)
 
-_server_public_key_file_path = os.getenv("SERVER_PUBLIC_KEY_PATH")
-if not _server_public_key_file_path:
+_server_public_key_path = os.getenv("SERVER_PUBLIC_KEY_PATH")
+if not _server_public_key_path:
     raise EnvironmentError("SERVER_PUBLIC_KEY_PATH environment variable is not set.")
-with open(_server_public_key_file_path) as f:
+SERVER_PUBLIC_KEY_PATH = Path(_server_public_key_path)
+
+_server_private_key_path = os.getenv("SERVER_PRIVATE_KEY_PATH")
+if not _server_private_key_path:
+    raise EnvironmentError("SERVER_PRIVATE_KEY_PATH environment variable is not set.")
+SERVER_PRIVATE_KEY_PATH = Path(_server_private_key_path)
+
+
+@functools.cache
+def server_public_key_clear_text() -> str:
+    """Read the server's public key file, once per process."""
+    return SERVER_PUBLIC_KEY_PATH.read_text()
+
+
+@functools.cache
+def server_public_key() -> rsa.PublicKey:
+    """Parse the server's public key on first use."""
     try:
-        SERVER_PUBLIC_KEY = rsa.PublicKey.load_pkcs1(f.read())  # type: ignore
+        return rsa.PublicKey.load_pkcs1(server_public_key_clear_text())  # type: ignore
     except Exception as e:
         raise EnvironmentError(
             "Unable to set SERVER_PUBLIC_KEY. Key in the file is not valid."
         ) from e
-if not SERVER_PUBLIC_KEY:
-    raise EnvironmentError("SERVER_PUBLIC_KEY environment variable is not set.")
 
-with open(_server_public_key_file_path, "r") as f:
-    SERVER_PUBLIC_KEY_CLEAR_TEXT: str = f.read()
 
-_server_private_key_file = os.getenv("SERVER_PRIVATE_KEY_PATH")
-if not _server_private_key_file:
-    raise EnvironmentError("SERVER_PRIVATE_KEY_PATH environment variable is not set.")
-with open(_server_private_key_file) as f:
+@functools.cache
+def server_private_key() -> rsa.PrivateKey:
+    """Read and parse the server's private key on first use."""
     try:
-        SERVER_PRIVATE_KEY = rsa.PrivateKey.load_pkcs1(f.read())  # type: ignore
+        return rsa.PrivateKey.load_pkcs1(  # type: ignore
+            SERVER_PRIVATE_KEY_PATH.read_text()
+        )
     except Exception as e:
         raise EnvironmentError(
             "Unable to set SERVER_PRIVATE_KEY. Key in the file is not valid."
         ) from e
-if not SERVER_PRIVATE_KEY:
-    raise EnvironmentError("SERVER_PRIVATE_KEY environment variable is not set.")
+
+
+# Store-and-forward queue for messages sent to offline users
+OFFLINE_QUEUE_MAX_MESSAGES_PER_RECIPIENT = int(
+    os.getenv("OFFLINE_QUEUE_MAX_MESSAGES_PER_RECIPIENT", "1000")
+)
+OFFLINE_QUEUE_TTL_SECONDS = int(
+    os.getenv("OFFLINE_QUEUE_TTL_SECONDS", str(7 * 24 * 60 * 60))
+)
+OFFLINE_QUEUE_FLUSH_BATCH_SIZE = int(os.getenv("OFFLINE_QUEUE_FLUSH_BATCH_SIZE", "500"))
+
+# Number of reader connections used by the database layer (writes use one)
+DB_READER_CONNECTIONS = int(os.getenv("DB_READER_CONNECTIONS", "4"))
+# Registrations and key updates made at the same time are committed together, at
+# most this many in one transaction
+DB_WRITE_BATCH_SIZE = int(os.getenv("DB_WRITE_BATCH_SIZE", "64"))
+# How long a batch with room left waits for more writes before it's committed.
+# Without a window writes arriving during a commit still join the next batch;
+# a window only pays off when commits are slow, e.g. on network storage.
+DB_WRITE_BATCH_WINDOW_SECONDS = float(os.getenv("DB_WRITE_BATCH_WINDOW_SECONDS", "0"))
+
+# Where presence of connected users is kept: "memory" for a single worker or
+# "sqlite" for a database file shared by all workers on the host
+PRESENCE_BACKEND = os.getenv("PRESENCE_BACKEND", "memory")
+PRESENCE_DB_PATH = Path(os.getenv("PRESENCE_DB_PATH", "presence.db"))
+# Message queue used by Socket.IO to pass events between workers,
+# e.g. redis://localhost:6379/0. Required when running more than one worker.
+SOCKETIO_MESSAGE_QUEUE_URL = os.getenv("SOCKETIO_MESSAGE_QUEUE_URL") or None
+
+# Maximum number of messages accepted in a single "chatBatch" event
+CHAT_BATCH_MAX_SIZE = int(os.getenv("CHAT_BATCH_MAX_SIZE", "100"))
+
+# Maximum number of recipients of a single "chatFanOut" message
+FANOUT_MAX_RECIPIENTS = int(os.getenv("FANOUT_MAX_RECIPIENTS", "100"))
+
+# "call" waits for the receiver's ack before answering the sender, "pipelined"
+# accepts the message immediately and sends a "delivered" receipt later
+DELIVERY_MODE = os.getenv("DELIVERY_MODE", "call")
+if DELIVERY_MODE not in ("call", "pipelined"):
+    raise EnvironmentError("DELIVERY_MODE must be either 'call' or 'pipelined'.")
+DELIVERY_MAX_PENDING = int(os.getenv("DELIVERY_MAX_PENDING", "10000"))
+DELIVERY_TIMEOUT_SECONDS = float(os.getenv("DELIVERY_TIMEOUT_SECONDS", "10"))
+DELIVERY_MAX_RETRIES = int(os.getenv("DELIVERY_MAX_RETRIES", "2"))
+
+# Outcomes of deliveries of "chat" messages with a "messageId", returned to
+# retries of the same message instead of delivering it again
+DEDUPLICATION_MAX_MESSAGES = int(os.getenv("DEDUPLICATION_MAX_MESSAGES", "100000"))
+DEDUPLICATION_TTL_SECONDS = float(os.getenv("DEDUPLICATION_TTL_SECONDS", "300"))
+
+# Messages delivered to a single receiver at a time and waiting for delivery.
+# When the receiver's queue is full the sender's message is rejected with
+# "reject", the sender gets the "busy" status with "slow_down" or the message
+# is moved to the offline queue with "spill".
+OUTBOUND_MAX_IN_FLIGHT = int(os.getenv("OUTBOUND_MAX_IN_FLIGHT", "8"))
+OUTBOUND_QUEUE_SIZE = int(os.getenv("OUTBOUND_QUEUE_SIZE", "100"))
+OUTBOUND_OVERFLOW_POLICY = os.getenv("OUTBOUND_OVERFLOW_POLICY", "spill")
+if OUTBOUND_OVERFLOW_POLICY not in ("reject", "slow_down", "spill"):
+    raise EnvironmentError(
+        "OUTBOUND_OVERFLOW_POLICY must be one of 'reject', 'slow_down' or 'spill'."
+    )
+
+# Maximum number of public keys in a single bulk presence request or subscription
+PRESENCE_BULK_MAX_SIZE = int(os.getenv("PRESENCE_BULK_MAX_SIZE", "1000"))
+# Maximum number of users whose presence a single socket may be subscribed to
+PRESENCE_MAX_SUBSCRIPTIONS = int(os.getenv("PRESENCE_MAX_SUBSCRIPTIONS", "5000"))
+
+# Maximum number of contacts' fingerprints in a single "syncDirectory" request
+DIRECTORY_SYNC_MAX_SIZE = int(os.getenv("DIRECTORY_SYNC_MAX_SIZE", "5000"))
+
+# Maximum size in bytes of a single Socket.IO frame, larger frames are dropped
+# before they are decoded
+PAYLOAD_MAX_FRAME_SIZE = int(os.getenv("PAYLOAD_MAX_FRAME_SIZE", "1000000"))
+# Maximum lengths of strings in event payloads
+PAYLOAD_MAX_PUBLIC_KEY_LENGTH = int(os.getenv("PAYLOAD_MAX_PUBLIC_KEY_LENGTH", "4096"))
+PAYLOAD_MAX_TEXT_LENGTH = int(os.getenv("PAYLOAD_MAX_TEXT_LENGTH", "65536"))
+PAYLOAD_MAX_MEDIA_LENGTH = int(os.getenv("PAYLOAD_MAX_MEDIA_LENGTH", "1000000"))
+PAYLOAD_MAX_FIELD_LENGTH = int(os.getenv("PAYLOAD_MAX_FIELD_LENGTH", "2048"))
+
+# Attachments relayed in binary chunks: maximum size of an attachment and of
+# a chunk in bytes, number of chunks of a transfer waiting for the receiver's
+# ack, number of concurrent transfers and how long a transfer may be idle
+ATTACHMENT_MAX_SIZE = int(os.getenv("ATTACHMENT_MAX_SIZE", str(100 * 1024 * 1024)))
+ATTACHMENT_MAX_CHUNK_SIZE = int(os.getenv("ATTACHMENT_MAX_CHUNK_SIZE", "65536"))
+ATTACHMENT_WINDOW = int(os.getenv("ATTACHMENT_WINDOW", "4"))
+ATTACHMENT_MAX_TRANSFERS = int(os.getenv("ATTACHMENT_MAX_TRANSFERS", "1000"))
+ATTACHMENT_TIMEOUT_SECONDS = float(os.getenv("ATTACHMENT_TIMEOUT_SECONDS", "30"))
+
+# Maximum number of sockets connected to a worker. A user has one authenticated
+# socket, authenticating again disconnects the previous one. Sockets which don't
+# authenticate within the deadline are disconnected by a reaper running every
+# REAPER_INTERVAL_SECONDS.
+MAX_CONNECTIONS = int(os.getenv("MAX_CONNECTIONS", "10000"))
+AUTHENTICATION_DEADLINE_SECONDS = float(
+    os.getenv("AUTHENTICATION_DEADLINE_SECONDS", "30")
+)
+REAPER_INTERVAL_SECONDS = float(os.getenv("REAPER_INTERVAL_SECONDS", "5"))
+
+# Rate limits of events per sid and per user, as events per second and size of
+# bursts, for authentication, queries (key checks, presence, directory sync) and
+# messages. 0 events per second disables the limit.
+RATE_LIMIT_AUTH_PER_SECOND = float(os.getenv("RATE_LIMIT_AUTH_PER_SECOND", "1"))
+RATE_LIMIT_AUTH_BURST = int(os.getenv("RATE_LIMIT_AUTH_BURST", "10"))
+RATE_LIMIT_QUERY_PER_SECOND = float(os.getenv("RATE_LIMIT_QUERY_PER_SECOND", "20"))
+RATE_LIMIT_QUERY_BURST = int(os.getenv("RATE_LIMIT_QUERY_BURST", "100"))
+RATE_LIMIT_CHAT_PER_SECOND = float(os.getenv("RATE_LIMIT_CHAT_PER_SECOND", "100"))
+RATE_LIMIT_CHAT_BURST = int(os.getenv("RATE_LIMIT_CHAT_BURST", "200"))
+# Number of token buckets kept in memory, least recently used ones are dropped
+RATE_LIMIT_MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "100000"))
+
+# Number of processes verifying signed authentication challenges,
+# 0 verifies them in the server process
+AUTH_VERIFICATION_WORKERS = int(
+    os.getenv("AUTH_VERIFICATION_WORKERS", str(min(4, os.cpu_count() or 1)))
+)
+# Number of parsed public keys kept in memory by each verification process
+PUBLIC_KEY_CACHE_SIZE = int(os.getenv("PUBLIC_KEY_CACHE_SIZE", "4096"))
+
+# How long a resumption ticket lets a reconnecting client skip the challenge,
+# 0 disables tickets
+RESUMPTION_TICKET_TTL_SECONDS = int(os.getenv("RESUMPTION_TICKET_TTL_SECONDS", "3600"))
+
+# How long a client has to answer an authentication challenge
+CHALLENGE_TTL_SECONDS = float(os.getenv("CHALLENGE_TTL_SECONDS", "60"))
+# Maximum number of unanswered challenges kept by a worker
+CHALLENGE_MAX_PENDING = int(os.getenv("CHALLENGE_MAX_PENDING", "100000"))
+# Maximum number of challenges issued to a single connection
+CHALLENGE_MAX_PER_SID = int(os.getenv("CHALLENGE_MAX_PER_SID", "5"))
@@ -1,7 +1,13 @@
-from typing import Literal, TypeAlias
+from typing import Literal, TypedDict
 
-from bidict import bidict
+ResponseStatusType = Literal["success", "error", "accepted", "busy"]
 
-PublicKeysSidsMappingType: TypeAlias = bidict[str, str]
 
-ResponseStatusType = Literal["success", "error"]
+class ChatAcceptedResponseType(TypedDict):
+    status: ResponseStatusType
+    deliveryId: str
+
+
+class AttachmentAcceptedResponseType(TypedDict):
+    status: ResponseStatusType
+    uploadId: str
@@ -1,6 +1,18 @@
+import os
 import sys
+import tempfile
 
 sys.path.append("src")
 
+# Settings the server requires, so tests can import it. Tests which start the app
+# point it to their own database.
+os.environ.setdefault(
+    "SQLITE_DB_PATH", os.path.join(tempfile.gettempdir(), "sdex-tests.db")
+)
+os.environ.setdefault("HOST_ADDRESS", "127.0.0.1")
+os.environ.setdefault("HOST_PORT", "8000")
+os.environ.setdefault("SERVER_PUBLIC_KEY_PATH", "id_rsa.pub")
+os.environ.setdefault("SERVER_PRIVATE_KEY_PATH", "id_rsa")
+
 
 pytest_plugins = ("pytest_asyncio",)
@@ -4,6 +4,65 @@ from typing import Any, Callable
 import pytest
 
 
+class FakeClock:
+    """Stands in for the `time` module of code measuring time with monotonic."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+class FakeSocketManager:
+    """Records events sent to clients, which ack calls with `response`.
+
+    Once `acks` is set to an event, calls wait for it before they are acked.
+    """
+
+    def __init__(self) -> None:
+        self.emitted: list[tuple[str, Any, str]] = []
+        self.called: list[tuple[str, Any, str]] = []
+        self.callbacks: list[Any] = []
+        self.response: Any = True
+        self.acks: asyncio.Event | None = None
+        self.handlers: dict[str, Any] = {}
+        self.rooms: dict[str, set[str]] = {}
+        self.disconnected: list[str] = []
+        self.tasks: set[asyncio.Task] = set()
+
+    def on(self, event: str, handler: Any) -> None:
+        self.handlers[event] = handler
+
+    async def disconnect(self, sid: str) -> None:
+        self.disconnected.append(sid)
+        if "disconnect" in self.handlers:
+            await self.handlers["disconnect"](sid)
+
+    async def enter_room(self, sid: str, room: str) -> None:
+        self.rooms.setdefault(room, set()).add(sid)
+
+    async def leave_room(self, sid: str, room: str) -> None:
+        self.rooms.get(room, set()).discard(sid)
+
+    def start_background_task(self, target: Any, *args: Any) -> asyncio.Task:
+        task = asyncio.create_task(target(*args))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def emit(self, event: str, data: Any, to: str, callback: Any = None):
+        self.emitted.append((event, data, to))
+        if callback:
+            self.callbacks.append(callback)
+
+    async def call(self, event: str, data: Any, to: str, timeout: Any = None):
+        self.called.append((event, data, to))
+        if self.acks:
+            await self.acks.wait()
+        return self.response
+
+
 @pytest.fixture(scope="module")
 def awaited_return() -> Callable[[Any], asyncio.Future]:
     """Helper function to return awaited value for async functions."""
@@ -14,3 +73,16 @@ def awaited_return() -> Callable[[Any], asyncio.Future]:
         return f
 
     return inner
+
+
+@pytest.fixture
+def clock(request, monkeypatch) -> FakeClock:
+    """Fake clock of the module named by `clocked_module` of the test module."""
+    clock = FakeClock()
+    monkeypatch.setattr(request.module.clocked_module, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def socket_manager() -> FakeSocketManager:
+    return FakeSocketManager()
@@ -0,0 +1,38 @@
+import pytest
+
+from sdex_server.connection import admission as admission_module
+from sdex_server.connection.admission import ConnectionAdmission
+from sdex_server.messages import TOO_MANY_CONNECTIONS_DROP_CONNECTION_MESSAGE
+
+clocked_module = admission_module
+
+
+@pytest.fixture
+def admission() -> ConnectionAdmission:
+    return ConnectionAdmission(max_connections=3, deadline_seconds=10)
+
+
+def test_connections_are_capped(admission, clock):
+    assert admission.admit("sid-1") is None
+    assert admission.admit("sid-2") is None
+    assert admission.admit("sid-3") is None
+    assert admission.admit("sid-4") == TOO_MANY_CONNECTIONS_DROP_CONNECTION_MESSAGE
+
+    admission.release("sid-1")
+    assert len(admission) == 2
+    assert admission.admit("sid-4") is None
+
+
+def test_unauthenticated_sids_expire(admission, clock):
+    admission.admit("sid-1")
+    clock.now = 5
+    admission.admit("sid-2")
+    admission.admit("sid-3")
+    admission.authenticated("sid-3")
+
+    assert admission.expired() == []
+    clock.now = 12
+    assert admission.expired() == ["sid-1"]
+    assert admission.expired() == []
+    clock.now = 20
+    assert admission.expired() == ["sid-2"]
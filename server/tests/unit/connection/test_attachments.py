@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from sdex_server.connection.attachments import AttachmentRelay
+
+
+@pytest.fixture
+def relay(socket_manager) -> AttachmentRelay:
+    return AttachmentRelay(
+        socket_manager,  # type: ignore
+        max_transfers=1,
+        max_size=8,
+        window=1,
+        timeout=0.05,
+    )
+
+
+@pytest.mark.asyncio
+async def test_chunks_are_relayed_in_order(relay, socket_manager):
+    upload_id = await relay.start("sender", "receiver", 4, {"kind": "image"})
+
+    assert upload_id
+    assert await relay.relay("sender", upload_id, 0, b"ab") == "success"
+    assert await relay.relay("sender", upload_id, 2, b"cd") == "error"
+    assert await relay.relay("sender", upload_id, 1, b"cd") == "success"
+    assert await relay.finish("sender", upload_id) == "success"
+    assert [event for event, _, _ in socket_manager.called] == [
+        "attachmentStart",
+        "attachmentChunk",
+        "attachmentChunk",
+        "attachmentEnd",
+    ]
+    assert socket_manager.called[2][1]["data"] == b"cd"
+    assert len(relay) == 0
+
+
+@pytest.mark.asyncio
+async def test_transfers_are_limited(relay, socket_manager):
+    assert not await relay.start("sender", "receiver", 9, {})
+    assert await relay.start("sender", "receiver", 8, {})
+    assert not await relay.start("sender", "receiver", 8, {})
+
+
+@pytest.mark.asyncio
+async def test_chunks_beyond_window_are_refused(relay, socket_manager):
+    upload_id = await relay.start("sender", "receiver", 4, {})
+    socket_manager.acks = asyncio.Event()
+
+    first = asyncio.create_task(relay.relay("sender", upload_id, 0, b"ab"))
+    await asyncio.sleep(0)
+    assert await relay.relay("sender", upload_id, 1, b"cd") == "busy"
+    socket_manager.acks.set()
+    assert await first == "success"
+    assert await relay.relay("sender", upload_id, 1, b"cd") == "success"
+
+
+@pytest.mark.asyncio
+async def test_unfinished_transfer_is_not_ended(relay):
+    upload_id = await relay.start("sender", "receiver", 4, {})
+
+    assert await relay.relay("sender", upload_id, 0, b"abcde") == "error"
+    assert await relay.relay("intruder", upload_id, 0, b"ab") == "error"
+    assert await relay.finish("sender", upload_id) == "error"
+
+
+@pytest.mark.asyncio
+async def test_idle_and_dropped_transfers_are_aborted(relay, socket_manager):
+    upload_id = await relay.start("sender", "receiver", 4, {})
+    await asyncio.sleep(0.1)
+
+    assert len(relay) == 0
+    assert socket_manager.emitted == [
+        ("attachmentAbort", {"uploadId": upload_id}, "sender"),
+        ("attachmentAbort", {"uploadId": upload_id}, "receiver"),
+    ]
+
+    await relay.start("sender", "receiver", 4, {})
+    await relay.drop("receiver")
+    assert len(relay) == 0
@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+
+from sdex_server.connection import deduplication as deduplication_module
+from sdex_server.connection.deduplication import DeliveryDeduplicator
+
+clocked_module = deduplication_module
+
+
+class Receiver:
+    def __init__(self, outcome: str = "success") -> None:
+        self.outcome = outcome
+        self.messages: list[str] = []
+        self.ack = asyncio.Event()
+        self.ack.set()
+
+    async def deliver(self, message: str) -> str:
+        self.messages.append(message)
+        await self.ack.wait()
+        return self.outcome
+
+
+@pytest.fixture
+def deduplicator() -> DeliveryDeduplicator:
+    return DeliveryDeduplicator(
+        max_entries=2, ttl_seconds=60, retryable=("error", "busy")
+    )
+
+
+@pytest.mark.asyncio
+async def test_retries_wait_for_delivery_in_progress(deduplicator, clock):
+    receiver = Receiver()
+    receiver.ack.clear()
+
+    first = asyncio.create_task(
+        deduplicator.deliver_once(("key", "id"), lambda: receiver.deliver("m"))
+    )
+    retry = asyncio.create_task(
+        deduplicator.deliver_once(("key", "id"), lambda: receiver.deliver("m"))
+    )
+    await asyncio.sleep(0)
+    receiver.ack.set()
+
+    assert await asyncio.gather(first, retry) == ["success", "success"]
+    assert receiver.messages == ["m"]
+
+
+@pytest.mark.asyncio
+async def test_outcome_is_remembered_until_it_expires(deduplicator, clock):
+    receiver = Receiver()
+
+    for _ in range(2):
+        await deduplicator.deliver_once(("key", "id"), lambda: receiver.deliver("m"))
+    assert receiver.messages == ["m"]
+
+    await deduplicator.deliver_once(("other-key", "id"), lambda: receiver.deliver("o"))
+    clock.now = 61
+    await deduplicator.deliver_once(("key", "id"), lambda: receiver.deliver("m"))
+    assert receiver.messages == ["m", "o", "m"]
+
+
+@pytest.mark.asyncio
+async def test_failed_deliveries_are_delivered_again(deduplicator, clock):
+    receiver = Receiver(outcome="busy")
+
+    async def failing_delivery() -> str:
+        raise TimeoutError
+
+    with pytest.raises(TimeoutError):
+        await deduplicator.deliver_once(("key", "id"), failing_delivery)
+    for _ in range(2):
+        await deduplicator.deliver_once(("key", "id"), lambda: receiver.deliver("m"))
+
+    assert receiver.messages == ["m", "m"]
+    assert len(deduplicator) == 0
+
+
+@pytest.mark.asyncio
+async def test_oldest_outcomes_are_forgotten(deduplicator, clock):
+    receiver = Receiver()
+
+    for message in ("a", "b", "c", "a"):
+        await deduplicator.deliver_once(
+            ("key", message), lambda m=message: receiver.deliver(m)
+        )
+
+    assert receiver.messages == ["a", "b", "c", "a"]
+    assert len(deduplicator) == 2
+
+
+@pytest.mark.asyncio
+async def test_retries_deliver_again_when_first_delivery_is_cancelled(
+    deduplicator, clock
+):
+    receiver = Receiver()
+    receiver.ack.clear()
+
+    first = asyncio.create_task(
+        deduplicator.deliver_once(("key", "id"), lambda: receiver.deliver("m"))
+    )
+    retry = asyncio.create_task(
+        deduplicator.deliver_once(("key", "id"), lambda: receiver.deliver("m"))
+    )
+    await asyncio.sleep(0)
+    first.cancel()
+    await asyncio.sleep(0)
+    receiver.ack.set()
+
+    assert await retry == "success"
+    assert first.cancelled()
+    assert receiver.messages == ["m", "m"]
+
+
+@pytest.mark.asyncio
+async def test_batch_delivers_only_messages_not_delivered_yet(deduplicator, clock):
+    receiver = Receiver()
+    await deduplicator.deliver_once(("key", "a"), lambda: receiver.deliver("a"))
+    delivered = []
+
+    async def deliver(indexes: list[int]) -> list[str]:
+        delivered.append(indexes)
+        return ["success"] * len(indexes)
+
+    outcomes = await deduplicator.deliver_each_once(
+        [("key", "a"), ("key", "b"), None, ("key", "b")], deliver
+    )
+
+    assert outcomes == ["success"] * 4
+    assert delivered == [[1, 2]]
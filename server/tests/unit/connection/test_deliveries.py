@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from sdex_server.connection.deliveries import PendingDeliveries
+
+
+@pytest.fixture
+def deliveries(socket_manager) -> PendingDeliveries:
+    return PendingDeliveries(
+        socket_manager,  # type: ignore
+        max_pending=1,
+        timeout=0.01,
+        max_retries=1,
+    )
+
+
+@pytest.mark.asyncio
+async def test_acknowledged_delivery_sends_receipt_to_sender(
+    deliveries: PendingDeliveries, socket_manager
+) -> None:
+    delivery_id = await deliveries.start("sender", "receiver", {"text": "hi"})
+
+    await socket_manager.callbacks[0](True)
+
+    assert socket_manager.emitted[-1] == (
+        "delivered",
+        {"deliveryId": delivery_id, "status": "success"},
+        "sender",
+    )
+    assert len(deliveries) == 0
+
+
+@pytest.mark.asyncio
+async def test_start_rejects_message_when_too_many_deliveries_pending(
+    deliveries: PendingDeliveries,
+) -> None:
+    assert await deliveries.start("sender", "receiver", {"text": "1"})
+    assert await deliveries.start("sender", "receiver", {"text": "2"}) is None
+
+
+@pytest.mark.asyncio
+async def test_unacknowledged_delivery_is_retried_then_fails(
+    deliveries: PendingDeliveries, socket_manager
+) -> None:
+    delivery_id = await deliveries.start("sender", "receiver", {"text": "hi"})
+
+    await asyncio.sleep(0.05)
+
+    assert [event for event, _, _ in socket_manager.emitted] == [
+        "chat",
+        "chat",
+        "delivered",
+    ]
+    assert socket_manager.emitted[-1][1] == {
+        "deliveryId": delivery_id,
+        "status": "error",
+    }
+
+
+@pytest.mark.asyncio
+async def test_drop_fails_deliveries_to_disconnected_receiver(
+    socket_manager,
+) -> None:
+    deliveries = PendingDeliveries(
+        socket_manager,  # type: ignore
+        max_pending=2,
+        timeout=0.01,
+        max_retries=1,
+    )
+    to_receiver = await deliveries.start("sender", "receiver", {"text": "1"})
+    await deliveries.start("receiver", "sender", {"text": "2"})
+
+    await deliveries.drop("receiver")
+    await asyncio.sleep(0.05)
+
+    assert len(deliveries) == 0
+    assert [event for event, _, _ in socket_manager.emitted] == [
+        "chat",
+        "chat",
+        "delivered",
+    ]
+    assert socket_manager.emitted[-1] == (
+        "delivered",
+        {"deliveryId": to_receiver, "status": "error"},
+        "sender",
+    )
+
+
+@pytest.mark.asyncio
+async def test_retries_carry_the_delivery_id(
+    deliveries: PendingDeliveries, socket_manager
+) -> None:
+    delivery_id = await deliveries.start("sender", "receiver", {"text": "hi"})
+
+    await asyncio.sleep(0.05)
+
+    sent = [data for event, data, _ in socket_manager.emitted if event == "chat"]
+    assert sent == [{"text": "hi", "deliveryId": delivery_id}] * 2
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from sdex_server.connection.outbound import OutboundQueues
+
+
+@pytest.fixture
+def outbound(socket_manager) -> OutboundQueues:
+    socket_manager.acks = asyncio.Event()
+    return OutboundQueues(
+        socket_manager,  # type: ignore
+        max_queued=1,
+        max_in_flight=1,
+    )
+
+
+@pytest.mark.asyncio
+async def test_full_queue_refuses_events(outbound, socket_manager):
+    first = asyncio.create_task(outbound.send("receiver", "chat", 1))
+    second = asyncio.create_task(outbound.send("receiver", "chat", 2))
+    other = asyncio.create_task(outbound.send("other", "chat", 3))
+    await asyncio.sleep(0)
+
+    assert await outbound.send("receiver", "chat", 4) is None
+    assert [data for _, data, _ in socket_manager.called] == [1, 3]
+    assert len(outbound) == 3
+
+    socket_manager.acks.set()
+    assert await asyncio.gather(first, second, other) == [True, True, True]
+    assert [data for _, data, _ in socket_manager.called] == [1, 3, 2]
+    assert len(outbound) == 0
+
+
+@pytest.mark.asyncio
+async def test_callback_runs_once_queue_drains(outbound, socket_manager):
+    drained = asyncio.Event()
+
+    async def callback() -> None:
+        drained.set()
+
+    sending = asyncio.create_task(outbound.send("receiver", "chat", 1))
+    await asyncio.sleep(0)
+    assert outbound.after_drained("receiver", callback)
+    assert not outbound.after_drained("receiver", callback)
+    await asyncio.sleep(0)
+    assert not drained.is_set()
+
+    socket_manager.acks.set()
+    await sending
+    await asyncio.wait_for(drained.wait(), 1)
+
+
+@pytest.mark.asyncio
+async def test_events_are_refused_until_spilled_ones_are_flushed(
+    outbound, socket_manager
+):
+    flushes = []
+    flushing = asyncio.Event()
+
+    async def flush() -> None:
+        flushes.append(await outbound.send("receiver", "chatBatch", 2, flushing=True))
+        await flushing.wait()
+
+    sending = asyncio.create_task(outbound.send("receiver", "chat", 1))
+    await asyncio.sleep(0)
+    outbound.spill("receiver", flush)
+    socket_manager.acks.set()
+    await sending
+    await asyncio.sleep(0)
+
+    assert await outbound.send("receiver", "chat", 3) is None
+    outbound.spill("receiver", flush)
+    flushing.set()
+    await asyncio.sleep(0.01)
+
+    assert flushes == [True, True]
+    assert await outbound.send("receiver", "chat", 3) is True
@@ -0,0 +1,154 @@
+from collections.abc import Iterator
+
+import pytest
+
+from sdex_server.connection import payload_schemas
+from sdex_server.connection.payload_sanitizers import (
+    validate_attachment_chunk_payload,
+    validate_chat_batch_payload,
+    validate_chat_fan_out_payload,
+    validate_chat_payload,
+    validate_connect_payload,
+    validate_public_keys_list_payload,
+    validate_sync_directory_payload,
+)
+from sdex_server.connection.payload_schemas import PayloadLimits
+
+
+@pytest.fixture(autouse=True)
+def limits() -> Iterator[PayloadLimits]:
+    limits = PayloadLimits(public_key=16, text=32, media=64, field=8, chunk=4)
+    payload_schemas.configure_payload_limits(limits)
+    yield limits
+    payload_schemas.configure_payload_limits(PayloadLimits())
+
+
+def chat_message(**fields: str) -> dict[str, str]:
+    return {
+        "publicKeyTo": "receiver",
+        "publicKeyFrom": "sender",
+        "text": "hello",
+        "createdAt": "now",
+        **fields,
+    }
+
+
+def test_chat_payload_is_parsed():
+    message = validate_chat_payload(chat_message(image="jpeg"))
+
+    assert message
+    assert message.public_key_to == "receiver"
+    assert message.forwarded() == chat_message(image="jpeg")
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        None,
+        "message",
+        chat_message(text=""),
+        chat_message(text=1),  # type: ignore
+        chat_message(unknown="field"),
+        chat_message(messageId=""),
+        chat_message(messageId=7),  # type: ignore
+        {"publicKeyTo": "receiver", "text": "hello"},
+    ],
+)
+def test_invalid_chat_payload_is_rejected(data):
+    assert validate_chat_payload(data) is None
+
+
+@pytest.mark.parametrize(
+    "field, length",
+    [
+        ("publicKeyTo", 16),
+        ("text", 32),
+        ("image", 64),
+        ("createdAt", 8),
+        ("messageId", 8),
+    ],
+)
+def test_strings_are_limited_by_field(field, length):
+    assert validate_chat_payload(chat_message(**{field: "a" * length}))
+    assert validate_chat_payload(chat_message(**{field: "a" * (length + 1)})) is None
+
+
+def test_connect_payload_with_optional_ticket():
+    payload = validate_connect_payload({"publicKey": "key"})
+
+    assert payload and payload.ticket is None
+    assert validate_connect_payload({"publicKey": "key", "ticket": ""}) is None
+
+
+def test_bad_messages_in_batch_dont_reject_it():
+    batch = validate_chat_batch_payload([chat_message(), {"text": "hello"}], 2)
+
+    assert batch and batch[0] and batch[1] is None
+    assert validate_chat_batch_payload([chat_message()] * 3, 2) is None
+
+
+def test_public_keys_list_payload():
+    assert validate_public_keys_list_payload(["first", "second"], 2) == [
+        "first",
+        "second",
+    ]
+    for data in (
+        "first",
+        [],
+        ["first", "second", "third"],
+        ["first", ""],
+        ["first", 1],
+        ["k" * 17],
+    ):
+        assert validate_public_keys_list_payload(data, 2) is None
+
+
+def test_sync_directory_payload():
+    fingerprint = "ab" * 32
+
+    payload = validate_sync_directory_payload(
+        {"version": 3, "fingerprints": [fingerprint]}, 1
+    )
+
+    assert payload and payload.version == 3 and payload.fingerprints == [fingerprint]
+    for data in (
+        {"version": -1, "fingerprints": [fingerprint]},
+        {"version": "3", "fingerprints": [fingerprint]},
+        {"version": 3, "fingerprints": ["ab"]},
+        {"version": 3, "fingerprints": [fingerprint] * 2},
+    ):
+        assert validate_sync_directory_payload(data, 1) is None
+
+
+def test_attachment_chunk_is_binary_and_limited():
+    chunk = {"uploadId": "upload", "index": 0, "data": b"abcd"}
+
+    assert validate_attachment_chunk_payload(chunk)
+    for data in ("abcd", b"", b"abcde"):
+        assert validate_attachment_chunk_payload({**chunk, "data": data}) is None
+
+
+def test_fan_out_payload_shares_the_body():
+    recipients = [
+        {"publicKeyTo": "first", "envelope": "key-1"},
+        {"publicKeyTo": "second", "envelope": "key-2"},
+    ]
+    data = {
+        "publicKeyFrom": "sender",
+        "createdAt": "now",
+        "body": "ciphertext",
+        "recipients": recipients,
+    }
+
+    payload = validate_chat_fan_out_payload(data, 2)
+
+    assert payload
+    assert payload.shared() == {
+        "publicKeyFrom": "sender",
+        "createdAt": "now",
+        "body": "ciphertext",
+    }
+    assert [recipient.forwarded() for recipient in payload.recipients] == recipients
+    assert validate_chat_fan_out_payload(data, 1) is None
+    duplicated = {**data, "recipients": [recipients[0], recipients[0]]}
+    assert validate_chat_fan_out_payload(duplicated, 2) is None
@@ -0,0 +1,135 @@
+import os
+import pathlib
+import sqlite3
+import subprocess
+import sys
+from collections.abc import Iterator
+
+import pytest
+
+from sdex_server.connection.presence import (
+    InMemoryPresenceBackend,
+    PresenceBackend,
+    SqlitePresenceBackend,
+)
+from sdex_server.crypto.fingerprints import fingerprint_public_key
+
+PEM_KEY = (
+    "-----BEGIN RSA PUBLIC KEY-----\n"
+    "MEgCQQCo9+BpMRYQ/dL3DS2CyJxRF+j6ctbT3/Qp84+KeFhnii7NT7fELilKUSnx\n"
+    "S30WAvQCCo2yU1orfgqr41mM70MBAgMBAAE=\n"
+    "-----END RSA PUBLIC KEY-----\n"
+)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def presence(request, tmp_path: pathlib.Path) -> Iterator[PresenceBackend]:
+    backend: PresenceBackend
+    if request.param == "memory":
+        backend = InMemoryPresenceBackend()
+    else:
+        backend = SqlitePresenceBackend(tmp_path / "presence.db")
+    yield backend
+    backend.close()
+
+
+@pytest.mark.asyncio
+async def test_are_online_keeps_order_of_keys(presence):
+    await presence.bind("first", "sid-1")
+    await presence.bind("third", "sid-3")
+
+    assert await presence.are_online(["third", "second", "first", "third"]) == [
+        True,
+        False,
+        True,
+        True,
+    ]
+
+
+@pytest.mark.asyncio
+async def test_bind_and_unbind(presence):
+    await presence.bind("key", "sid")
+
+    assert await presence.get_sid("key") == "sid"
+    assert await presence.get_public_key("sid") == "key"
+
+    await presence.unbind("sid")
+
+    assert await presence.get_sid("key") is None
+    assert await presence.get_public_key("sid") is None
+
+
+@pytest.mark.asyncio
+async def test_sessions_are_found_by_key_formatted_differently(presence):
+    await presence.bind(PEM_KEY, "sid")
+
+    assert await presence.get_sid(PEM_KEY.replace("\n", "\r\n")) == "sid"
+    assert await presence.are_online([f"  {PEM_KEY}  "]) == [True]
+
+
+@pytest.mark.asyncio
+async def test_binding_key_to_another_sid_drops_previous_session(presence):
+    await presence.bind(PEM_KEY, "old-sid")
+    await presence.authenticate("old-sid")
+
+    await presence.bind(PEM_KEY.replace("\n", "\r\n"), "new-sid")
+
+    assert await presence.get_sid(PEM_KEY) == "new-sid"
+    assert await presence.get_public_key("old-sid") is None
+    assert await presence.count_sessions() == (1, 0)
+
+
+@pytest.mark.asyncio
+async def test_rebind_moves_session_to_new_key(presence):
+    await presence.bind("key", "sid")
+    await presence.authenticate("sid")
+    await presence.bind("new-key", "other-sid")
+
+    await presence.rebind("sid", "new-key")
+
+    assert await presence.get_sid("key") is None
+    assert await presence.get_sid("new-key") == "sid"
+    assert await presence.get_public_key("other-sid") is None
+    assert await presence.is_authenticated("sid")
+
+
+@pytest.mark.asyncio
+async def test_authenticate_and_count_sessions(presence):
+    await presence.bind("key", "sid")
+    await presence.bind("other-key", "other-sid")
+
+    await presence.authenticate("sid")
+
+    assert await presence.is_authenticated("sid")
+    assert not await presence.is_authenticated("other-sid")
+    assert not await presence.is_authenticated("unknown-sid")
+    assert await presence.count_sessions() == (2, 1)
+
+
+def insert_session(db_path: pathlib.Path, sid: str, worker_id: int) -> None:
+    client = sqlite3.connect(db_path, isolation_level=None)
+    client.execute(
+        "INSERT INTO sessions (sid, public_key_fingerprint, public_key, worker_id) "
+        "VALUES (?, ?, ?, ?);",
+        (sid, fingerprint_public_key(sid), sid, worker_id),
+    )
+    client.close()
+
+
+@pytest.mark.asyncio
+async def test_sessions_of_dead_workers_are_removed_on_startup(
+    tmp_path: pathlib.Path,
+) -> None:
+    db_path = tmp_path / "presence.db"
+    SqlitePresenceBackend(db_path).close()
+    dead_worker = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead_worker.wait()
+    insert_session(db_path, "dead-sid", dead_worker.pid)
+    insert_session(db_path, "live-sid", os.getppid())
+
+    presence = SqlitePresenceBackend(db_path)
+    try:
+        assert await presence.get_sid("dead-sid") is None
+        assert await presence.get_sid("live-sid") == "live-sid"
+    finally:
+        presence.close()
@@ -0,0 +1,73 @@
+import pytest
+
+from sdex_server.connection import rate_limiting
+from sdex_server.connection.rate_limiting import RateLimiter
+
+clocked_module = rate_limiting
+
+
+@pytest.fixture
+def limiter() -> RateLimiter:
+    limiter = RateLimiter(max_buckets=100)
+    limiter.limit("chat", rate=2, burst=3)
+    return limiter
+
+
+def test_bucket_allows_bursts_and_refills(limiter, clock):
+    assert [limiter.allow("chat", "sid") for _ in range(4)] == [True] * 3 + [False]
+    assert limiter.allow("checkKey", "sid")
+
+    clock.now = 0.5
+    assert limiter.allow("chat", "sid")
+    assert not limiter.allow("chat", "sid")
+    assert limiter.allow("chat", "other-sid")
+
+
+def test_public_key_bucket_is_shared_between_sids(limiter, clock):
+    limiter.bind("sid", "public-key")
+    limiter.bind("new-sid", "public-key")
+    for _ in range(3):
+        assert limiter.allow("chat", "sid")
+
+    assert not limiter.allow("chat", "new-sid")
+    limiter.unbind("new-sid")
+    assert limiter.allow("chat", "new-sid")
+
+
+def test_least_recently_used_buckets_are_dropped(clock):
+    limiter = RateLimiter(max_buckets=1)
+    limiter.limit("chat", rate=1, burst=1)
+
+    assert limiter.allow("chat", "sid")
+    assert limiter.allow("chat", "other-sid")
+    assert limiter.allow("chat", "sid")
+
+
+@pytest.mark.asyncio
+async def test_throttled_events_skip_the_handler(limiter, clock):
+    calls = []
+
+    @limiter.limited("chat", rejected="busy")
+    async def handler(sid: str, data: str) -> str:
+        calls.append(data)
+        return "success"
+
+    responses = [await handler("sid", str(number)) for number in range(4)]
+
+    assert responses == ["success"] * 3 + ["busy"]
+    assert calls == ["0", "1", "2"]
+
+
+@pytest.mark.asyncio
+async def test_events_take_as_many_tokens_as_they_cost(limiter, clock):
+    @limiter.limited("chat", rejected="busy", cost=len)
+    async def handler(sid: str, recipients: list[str]) -> str:
+        return "success"
+
+    assert await handler("sid", ["first", "second"]) == "success"
+    assert await handler("sid", ["first", "second"]) == "busy"
+    assert await handler("sid", ["first"]) == "success"
+
+    clock.now = 10
+    assert limiter.allow("chat", "sid", cost=100)
+    assert not limiter.allow("chat", "sid")
@@ -0,0 +1,59 @@
+import pytest
+
+from sdex_server.connection.sessions import SessionRegistry
+
+
+@pytest.fixture
+def sessions() -> SessionRegistry:
+    return SessionRegistry()
+
+
+def test_sessions_are_indexed_both_ways(sessions):
+    session = sessions.bind("key", "sid")
+
+    assert sessions.get("sid") is session
+    assert sessions.get_by_public_key("key") is session
+    assert session.public_key == "key" and not session.authenticated
+
+
+def test_binding_key_to_another_sid_drops_previous_session(sessions):
+    sessions.bind("key", "old-sid")
+    sessions.authenticate("old-sid")
+
+    sessions.bind("key", "new-sid")
+
+    assert sessions.get("old-sid") is None
+    assert sessions.get_by_public_key("key").sid == "new-sid"  # type: ignore
+    assert (len(sessions), sessions.authenticated) == (1, 0)
+
+
+def test_rebind_keeps_authentication(sessions):
+    sessions.bind("key", "sid")
+    sessions.authenticate("sid")
+
+    sessions.rebind("sid", "new-key")
+
+    assert sessions.get_by_public_key("key") is None
+    session = sessions.get_by_public_key("new-key")
+    assert session and session.sid == "sid" and session.authenticated
+    assert sessions.authenticated == 1
+
+
+def test_public_keys_are_interned(sessions):
+    public_key = "".join(["public-", "key"])
+
+    session = sessions.bind(public_key, "sid")
+
+    assert session.public_key is sessions.bind("public-key", "other-sid").public_key
+    assert (len(sessions), sessions.authenticated) == (1, 0)
+
+
+def test_sessions_are_found_by_key_formatted_differently(sessions):
+    public_key = "-----BEGIN RSA PUBLIC KEY-----\nQUJD\n-----END RSA PUBLIC KEY-----\n"
+    session = sessions.bind(public_key, "sid")
+
+    assert sessions.get_by_public_key(public_key.replace("\n", "\r\n")) is session
+
+    sessions.bind(public_key.replace("\n", "\r\n"), "new-sid")
+    assert sessions.get_by_public_key(public_key).sid == "new-sid"  # type: ignore
+    assert len(sessions) == 1
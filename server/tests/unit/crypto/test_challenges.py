@@ -0,0 +1,68 @@
+import pytest
+from freezegun import freeze_time
+
+from sdex_server.crypto.challenges import ChallengeManager
+from sdex_server.crypto.randomness import (
+    CHALLENGE_ALPHABET,
+    CHALLENGE_LENGTH,
+    generate_challenge,
+)
+
+
+@pytest.fixture
+def challenge_manager() -> ChallengeManager:
+    return ChallengeManager(ttl_seconds=60, max_pending=3, max_issued_per_sid=2)
+
+
+def test_generate_challenge_uses_only_alphabet_characters() -> None:
+    challenge = generate_challenge()
+
+    assert len(challenge) == CHALLENGE_LENGTH
+    assert set(challenge) <= set(CHALLENGE_ALPHABET)
+    assert generate_challenge() != challenge
+
+
+def test_issue_resends_pending_challenge(challenge_manager: ChallengeManager) -> None:
+    assert challenge_manager.issue("sid") == challenge_manager.issue("sid")
+
+
+def test_consume_returns_challenge_only_once(
+    challenge_manager: ChallengeManager,
+) -> None:
+    challenge = challenge_manager.issue("sid")
+
+    assert challenge_manager.consume("sid") == challenge
+    assert challenge_manager.consume("sid") is None
+
+
+def test_consume_doesnt_return_expired_challenge(
+    challenge_manager: ChallengeManager,
+) -> None:
+    with freeze_time("2023-01-01 00:00:00"):
+        challenge_manager.issue("sid")
+    with freeze_time("2023-01-01 00:02:00"):
+        assert challenge_manager.consume("sid") is None
+
+
+def test_issue_refuses_challenges_over_sid_limit(
+    challenge_manager: ChallengeManager,
+) -> None:
+    for _ in range(2):
+        challenge_manager.issue("sid")
+        challenge_manager.consume("sid")
+
+    assert challenge_manager.issue("sid") is None
+    challenge_manager.discard("sid")
+    assert challenge_manager.issue("sid") is not None
+
+
+def test_issue_refuses_challenges_over_pending_limit_until_they_expire(
+    challenge_manager: ChallengeManager,
+) -> None:
+    with freeze_time("2023-01-01 00:00:00"):
+        for i in range(3):
+            challenge_manager.issue(f"sid-{i}")
+        assert challenge_manager.issue("other-sid") is None
+    with freeze_time("2023-01-01 00:02:00"):
+        assert challenge_manager.issue("other-sid") is not None
+        assert len(challenge_manager) == 1
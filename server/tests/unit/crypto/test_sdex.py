@@ -0,0 +1,116 @@
+import functools
+import operator
+import os
+import struct
+
+import pytest
+
+from sdex_server.crypto.sdex import SdexCipher, blake3_hash
+
+# Session key and cipher text from the app's SdexCrypto tests
+SESSION_KEY = bytes(
+    [
+        199, 182, 158, 16, 28, 191, 237, 76, 143, 157, 160, 176, 212, 216, 69, 149,
+        116, 80, 98, 155, 212, 183, 228, 53, 100, 16, 112, 89, 150, 82, 0, 116,
+        163, 242, 21, 164, 67, 83, 188, 5, 92, 26, 189, 251, 17, 55, 89, 90,
+        4, 193, 80, 49, 150, 142, 205, 68, 98, 31, 22, 221, 192, 211, 235, 55,
+    ]
+)  # fmt: skip
+ENCRYPTED_MESSAGE = bytes(
+    [
+        216, 52, 125, 5, 37, 138, 143, 114, 25, 15, 52, 201, 212, 18, 223, 193,
+        158, 24, 12, 232, 141, 40, 144, 183, 142, 15, 134, 10, 228, 223, 72, 148,
+    ]
+)  # fmt: skip
+
+
+def blake3_derive_key(context: bytes, material: bytes, length: int) -> bytes:
+    context_key = blake3_hash(context, flags=1 << 5)
+    return blake3_hash(material, length, struct.unpack("<8I", context_key), 1 << 6)
+
+
+def calculate_message_like_app(cipher: SdexCipher, data: bytes) -> bytes:
+    """Block by block port of SdexCrypto.calculateMessage with 1-based indexes."""
+    length = cipher.hash_length
+    zeroed = bytes(length)
+    blocks = {
+        i // length + 1: data[i : i + length].ljust(length, b"\0")
+        for i in range(0, len(data), length)
+    }
+    key, s1, s2 = (
+        cipher.session_key_hash,
+        cipher.first_part_hash,
+        cipher.second_part_hash,
+    )
+
+    def xor(*arrays: bytes) -> bytes:
+        return bytes(functools.reduce(operator.xor, values) for values in zip(*arrays))
+
+    def block(index: int) -> bytes:
+        return blocks.get(index, zeroed)
+
+    result = {1: xor(block(1), s1, key)}
+    hashes = {1: blake3_derive_key(block(1) + block(2), key, length)}
+    if 2 in blocks:
+        result[2] = xor(block(2), s1, s2)
+        hashes[2] = blake3_derive_key(block(3) + block(4), xor(hashes[1], key), length)
+    for k in range(3, len(blocks) + 2):
+        hashes[k] = blake3_derive_key(
+            block(2 * k - 1) + block(2 * k), xor(hashes[k - 1], hashes[k - 2]), length
+        )
+        result[2 * k + 1] = xor(block(2 * k + 1), hashes[k], hashes[k - 1])
+        result[2 * k + 2] = xor(block(2 * k), s2, hashes[k])
+    return b"".join(result[index] for index in sorted(result))
+
+
+@pytest.fixture
+def cipher() -> SdexCipher:
+    return SdexCipher(SESSION_KEY)
+
+
+def test_blake3_hash_matches_reference_vectors() -> None:
+    data = bytes(i % 251 for i in range(100))
+
+    assert blake3_hash(b"").hex() == (
+        "af1349b9f5f9a1a6a0404dea36dcc9499bcb25c9adc112b7cc9a93cae41f3262"
+    )
+    assert blake3_hash(data).hex() == (
+        "8e2eb1bba3040b8f611a1240a0e111c74b45cfc9caed10b95f6372db1c40b8b5"
+    )
+    assert blake3_derive_key(b"SDEx test vectors", data, 32).hex() == (
+        "a6156360c44100574041c97749f1d6e82160e934e9312ea6efbafc8c2b2a2153"
+    )
+
+
+def test_encrypt_message_matches_app(cipher: SdexCipher) -> None:
+    assert cipher.encrypt_message("Hello world!") == ENCRYPTED_MESSAGE
+
+
+def test_decrypt_message_matches_app(cipher: SdexCipher) -> None:
+    assert cipher.decrypt_message(ENCRYPTED_MESSAGE) == "Hello world!"
+
+
+@pytest.mark.parametrize("length", [1, 32, 33, 64, 65, 200, 1000])
+def test_calculate_message_follows_app_algorithm(
+    cipher: SdexCipher, length: int
+) -> None:
+    data = os.urandom(length)
+
+    assert cipher.calculate_message(data) == calculate_message_like_app(cipher, data)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 32, 100])
+def test_calculate_stream_matches_whole_message(
+    cipher: SdexCipher, chunk_size: int
+) -> None:
+    data = os.urandom(1000)
+    chunks = [data[i : i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+    assert b"".join(
+        cipher.calculate_stream(chunks, batch_size=3)
+    ) == cipher.calculate_message(data)
+
+
+def test_cipher_rejects_too_long_hashes() -> None:
+    with pytest.raises(ValueError):
+        SdexCipher(SESSION_KEY, hash_length=64)
@@ -0,0 +1,65 @@
+import pytest
+import rsa
+from freezegun import freeze_time
+
+from sdex_server.crypto.tickets import TicketManager
+
+_PUBLIC_KEY, _PRIVATE_KEY = rsa.newkeys(512)
+_OTHER_PUBLIC_KEY, _ = rsa.newkeys(512)
+
+
+@pytest.fixture
+def ticket_manager() -> TicketManager:
+    return TicketManager(_PRIVATE_KEY, ttl_seconds=60)
+
+
+@pytest.fixture
+def public_key() -> str:
+    return _PUBLIC_KEY.save_pkcs1().decode()
+
+
+def test_verify_accepts_ticket_issued_for_the_key(
+    ticket_manager: TicketManager, public_key: str
+) -> None:
+    assert ticket_manager.verify(ticket_manager.issue(public_key, 1), public_key, 1)
+
+
+def test_verify_rejects_ticket_issued_for_other_key(
+    ticket_manager: TicketManager, public_key: str
+) -> None:
+    ticket = ticket_manager.issue(public_key, 1)
+
+    assert not ticket_manager.verify(ticket, _OTHER_PUBLIC_KEY.save_pkcs1().decode(), 1)
+
+
+def test_verify_rejects_expired_ticket(
+    ticket_manager: TicketManager, public_key: str
+) -> None:
+    with freeze_time("2023-01-01 00:00:00"):
+        ticket = ticket_manager.issue(public_key, 1)
+    with freeze_time("2023-01-01 00:02:00"):
+        assert not ticket_manager.verify(ticket, public_key, 1)
+
+
+@pytest.mark.parametrize("ticket", ["", "not-base64!", "c2hvcnQ="])
+def test_verify_rejects_malformed_ticket(
+    ticket_manager: TicketManager, public_key: str, ticket: str
+) -> None:
+    assert not ticket_manager.verify(ticket, public_key, 1)
+
+
+def test_verify_rejects_tampered_ticket(
+    ticket_manager: TicketManager, public_key: str
+) -> None:
+    ticket = ticket_manager.issue(public_key, 1)
+    tampered = ticket[:10] + ("A" if ticket[10] != "A" else "B") + ticket[11:]
+
+    assert not ticket_manager.verify(tampered, public_key, 1)
+
+
+def test_verify_rejects_ticket_issued_for_other_key_version(
+    ticket_manager: TicketManager, public_key: str
+) -> None:
+    ticket = ticket_manager.issue(public_key, 1)
+
+    assert not ticket_manager.verify(ticket, public_key, 2)
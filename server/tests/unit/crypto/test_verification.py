@@ -0,0 +1,58 @@
+import base64
+
+import pytest
+import rsa
+
+from sdex_server.crypto.verification import SignatureVerifier, verify_signature
+
+
+@pytest.fixture(scope="module")
+def key_pair() -> tuple[rsa.PublicKey, rsa.PrivateKey]:
+    return rsa.newkeys(512)
+
+
+@pytest.fixture
+def public_key(key_pair: tuple[rsa.PublicKey, rsa.PrivateKey]) -> str:
+    return key_pair[0].save_pkcs1().decode()
+
+
+@pytest.fixture
+def signature(key_pair: tuple[rsa.PublicKey, rsa.PrivateKey]) -> str:
+    return base64.b64encode(rsa.sign(b"challenge", key_pair[1], "SHA-256")).decode()
+
+
+def test_verify_signature_accepts_valid_signature(
+    public_key: str, signature: str
+) -> None:
+    assert verify_signature("challenge", signature, public_key) is True
+
+
+def test_verify_signature_rejects_signature_of_other_message(
+    public_key: str, signature: str
+) -> None:
+    assert verify_signature("other challenge", signature, public_key) is False
+
+
+def test_verify_signature_rejects_malformed_input(public_key: str) -> None:
+    assert verify_signature("challenge", "not base64!", public_key) is False
+    assert verify_signature("challenge", "c2lnbmF0dXJl", "not a key") is False
+
+
+def test_verify_signature_rejects_pem_key_with_malformed_body() -> None:
+    public_key = (
+        "-----BEGIN RSA PUBLIC KEY-----\nAAAAAAAA\n-----END RSA PUBLIC KEY-----\n"
+    )
+
+    assert verify_signature("msg", "c2ln", public_key) is False
+
+
+@pytest.mark.asyncio
+async def test_signature_verifier_verifies_in_worker_process(
+    public_key: str, signature: str
+) -> None:
+    verifier = SignatureVerifier(workers=1, key_cache_size=8)
+    try:
+        assert await verifier.verify("challenge", signature, public_key) is True
+        assert await verifier.verify("other", signature, public_key) is False
+    finally:
+        verifier.close()
@@ -0,0 +1,63 @@
+import asyncio
+import pathlib
+
+import pytest
+
+from sdex_server.database.async_database import AsyncDatabaseManager
+from sdex_server.database.models import User
+
+
+def create_db_manager(db_path: pathlib.Path) -> AsyncDatabaseManager:
+    return AsyncDatabaseManager(
+        db_path,
+        readers=3,
+        max_messages_per_recipient=10,
+        ttl_seconds=60,
+        write_batch_size=4,
+        write_batch_window=0.01,
+    )
+
+
+@pytest.mark.asyncio
+async def test_open_connects_every_worker_thread_and_close_disconnects_them(
+    tmp_path: pathlib.Path,
+) -> None:
+    db_manager = create_db_manager(tmp_path / "users.db")
+    await db_manager.open()
+    try:
+        assert len(db_manager._readers._threads) == 3
+        assert await db_manager.add_user(User(login="login", public_key="key"))
+        assert await db_manager.check_public_key("key")
+    finally:
+        db_manager.close()
+
+    assert db_manager._readers._shutdown and db_manager._writer._shutdown
+
+
+@pytest.mark.asyncio
+async def test_concurrent_writes_are_committed_in_batches(
+    tmp_path: pathlib.Path,
+) -> None:
+    db_manager = create_db_manager(tmp_path / "users.db")
+    batches = []
+    write_batch = db_manager._write_batch
+
+    def recording_write_batch(queries):
+        batches.append(len(queries))
+        return write_batch(queries)
+
+    db_manager._write_batch = recording_write_batch  # type: ignore
+    try:
+        results = await asyncio.gather(
+            *(
+                db_manager.add_user(User(login=f"user-{i % 5}", public_key=f"key-{i}"))
+                for i in range(6)
+            ),
+            db_manager.update_user("doesnt-exist", "some-key"),
+        )
+        await db_manager.flush()
+    finally:
+        db_manager.close()
+
+    assert results == [True] * 5 + [False, False]
+    assert batches == [4, 3]
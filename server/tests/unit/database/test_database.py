@@ -1,4 +1,5 @@
 import pathlib
+import shutil
 
 import pytest
 
@@ -7,8 +8,13 @@ from sdex_server.database.models import User
 
 
 @pytest.fixture
-def db_manager() -> DatabaseManager:
-    db_path = pathlib.Path(__file__).parent.parent.parent / "resources" / "test-db.db"
+def db_manager(tmp_path: pathlib.Path) -> DatabaseManager:
+    # Migrations and writes of the tests don't touch the committed database
+    db_path = tmp_path / "test-db.db"
+    shutil.copy(
+        pathlib.Path(__file__).parent.parent.parent / "resources" / "test-db.db",
+        db_path,
+    )
     db_manager = DatabaseManager(db_path)
     return db_manager
 
@@ -78,3 +84,61 @@ def test_add_user_inserts_user_successfully(adding_user: bool) -> None:
 
 def test_remove_user_deletes_user_successfully(deleting_user: bool) -> None:
     assert deleting_user is True
+
+
+@pytest.fixture
+def empty_db_manager(tmp_path: pathlib.Path) -> DatabaseManager:
+    return DatabaseManager(tmp_path / "users.db")
+
+
+def test_write_reports_its_own_changes_not_earlier_ones(
+    empty_db_manager: DatabaseManager,
+) -> None:
+    assert empty_db_manager.add_user(User(login="login", public_key="key")) is True
+
+    assert empty_db_manager.update_user("doesnt-exist", "some-key") is False
+    assert empty_db_manager.remove_user("doesnt-exist") is False
+
+
+def test_write_batch_gives_every_write_its_own_result(
+    empty_db_manager: DatabaseManager,
+) -> None:
+    def failing_write(db: DatabaseManager) -> bool:
+        with db._write():
+            db.client.execute(
+                "INSERT INTO users (login, public_key, public_key_fingerprint) "
+                "VALUES ('rolled-back', 'rolled-back-key', x'00');"
+            )
+            raise RuntimeError("write failed")
+
+    results = empty_db_manager.write_batch(
+        [
+            lambda db: db.add_user(User(login="first", public_key="first-key")),
+            lambda db: db.add_user(User(login="first", public_key="other-key")),
+            failing_write,
+            lambda db: db.update_user("first", "new-first-key"),
+            lambda db: db.add_user(User(login="second", public_key="second-key")),
+        ]
+    )
+
+    assert results[:2] == [True, False]
+    assert isinstance(results[2], RuntimeError)
+    assert results[3:] == [True, True]
+    assert empty_db_manager.get_user_by_login("rolled-back") is None
+    assert empty_db_manager.check_public_key("new-first-key") is True
+    assert empty_db_manager.check_public_key("second-key") is True
+
+
+def test_key_version_changes_when_key_is_registered_again(
+    empty_db_manager: DatabaseManager,
+) -> None:
+    empty_db_manager.add_user(User(login="login", public_key="key"))
+    version = empty_db_manager.get_key_version("key")
+
+    empty_db_manager.update_user("login", "new-key")
+    assert empty_db_manager.get_key_version("key") is None
+    empty_db_manager.update_user("login", "key")
+
+    assert version is not None
+    assert empty_db_manager.get_key_version("key") > version  # type: ignore
+    assert empty_db_manager.get_key_version("unknown-key") is None
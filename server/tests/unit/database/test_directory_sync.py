@@ -0,0 +1,96 @@
+import pathlib
+
+import pytest
+
+from sdex_server.crypto.fingerprints import fingerprint_public_key
+from sdex_server.database.database import DatabaseManager
+from sdex_server.database.models import User
+
+
+@pytest.fixture
+def db_manager(tmp_path: pathlib.Path) -> DatabaseManager:
+    db_manager = DatabaseManager(tmp_path / "directory.db")
+    db_manager.add_user(User(login="alice", public_key="alice-key"))
+    db_manager.add_user(User(login="bob", public_key="bob-key"))
+    return db_manager
+
+
+def latest_version(db_manager: DatabaseManager) -> int:
+    return db_manager.get_directory_changes(0, [b"x"]).version
+
+
+def test_initial_sync_returns_unregistered_keys(db_manager: DatabaseManager) -> None:
+    result = db_manager.get_directory_changes(
+        0, [fingerprint_public_key("alice-key"), fingerprint_public_key("nobody")]
+    )
+
+    assert result.version == 2
+    assert result.changes == {fingerprint_public_key("nobody"): None}
+
+
+def test_sync_returns_only_changes_since_version(db_manager: DatabaseManager) -> None:
+    version = latest_version(db_manager)
+    db_manager.update_user("alice", "alice-new-key")
+    db_manager.remove_user("bob")
+
+    result = db_manager.get_directory_changes(
+        version,
+        [fingerprint_public_key("alice-key"), fingerprint_public_key("bob-key")],
+    )
+
+    assert result.version == version + 2
+    assert result.changes == {
+        fingerprint_public_key("alice-key"): "alice-new-key",
+        fingerprint_public_key("bob-key"): None,
+    }
+
+
+def test_sync_follows_chain_of_key_updates(db_manager: DatabaseManager) -> None:
+    version = latest_version(db_manager)
+    db_manager.update_user("alice", "alice-key-2")
+    db_manager.update_user("bob", "bob-key-2")
+    db_manager.update_user("alice", "alice-key-3")
+
+    result = db_manager.get_directory_changes(
+        version, [fingerprint_public_key("alice-key")]
+    )
+
+    assert result.changes == {fingerprint_public_key("alice-key"): "alice-key-3"}
+
+
+def test_sync_without_changes_returns_nothing(db_manager: DatabaseManager) -> None:
+    version = latest_version(db_manager)
+
+    result = db_manager.get_directory_changes(
+        version, [fingerprint_public_key("alice-key")]
+    )
+
+    assert result.version == version
+    assert result.changes == {}
+
+
+def test_sync_reports_user_registered_again_with_the_same_key(
+    db_manager: DatabaseManager,
+) -> None:
+    version = latest_version(db_manager)
+    db_manager.remove_user("bob")
+    db_manager.add_user(User(login="bob", public_key="bob-key"))
+
+    result = db_manager.get_directory_changes(
+        version, [fingerprint_public_key("bob-key")]
+    )
+
+    assert result.changes == {fingerprint_public_key("bob-key"): "bob-key"}
+
+
+def test_sync_reports_removal_after_key_update(db_manager: DatabaseManager) -> None:
+    version = latest_version(db_manager)
+    db_manager.update_user("alice", "alice-new-key")
+    db_manager.add_user(User(login="carol", public_key="alice-key"))
+    db_manager.remove_user("alice")
+
+    result = db_manager.get_directory_changes(
+        version, [fingerprint_public_key("alice-key")]
+    )
+
+    assert result.changes == {fingerprint_public_key("alice-key"): None}
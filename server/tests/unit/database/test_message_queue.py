@@ -0,0 +1,95 @@
+import pathlib
+
+import pytest
+from freezegun import freeze_time
+
+from sdex_server.database.message_queue import MessageQueue
+
+
+@pytest.fixture
+def message_queue(tmp_path: pathlib.Path) -> MessageQueue:
+    return MessageQueue(
+        tmp_path / "queue.db", max_messages_per_recipient=3, ttl_seconds=60
+    )
+
+
+@pytest.fixture
+def payload() -> dict:
+    return {
+        "publicKeyTo": "receiver-key",
+        "publicKeyFrom": "sender-key",
+        "text": "encrypted-text",
+        "createdAt": "2023-01-01T00:00:00.000Z",
+    }
+
+
+def test_enqueue_and_peek_batch_returns_messages_in_order(
+    message_queue: MessageQueue, payload: dict
+) -> None:
+    for i in range(3):
+        assert message_queue.enqueue("receiver-key", {**payload, "text": str(i)})
+
+    batch = message_queue.peek_batch("receiver-key", batch_size=2)
+
+    assert [message.payload["text"] for message in batch] == ["0", "1"]
+
+
+def test_peek_batch_doesnt_return_other_recipients_messages(
+    message_queue: MessageQueue, payload: dict
+) -> None:
+    message_queue.enqueue("other-key", payload)
+
+    assert message_queue.peek_batch("receiver-key", batch_size=10) == []
+
+
+def test_enqueue_rejects_messages_over_recipient_limit(
+    message_queue: MessageQueue, payload: dict
+) -> None:
+    for _ in range(3):
+        message_queue.enqueue("receiver-key", payload)
+
+    assert message_queue.enqueue("receiver-key", payload) is False
+    assert message_queue.enqueue("other-key", payload) is True
+
+
+def test_remove_deletes_delivered_messages(
+    message_queue: MessageQueue, payload: dict
+) -> None:
+    message_queue.enqueue("receiver-key", payload)
+    batch = message_queue.peek_batch("receiver-key", batch_size=10)
+
+    assert message_queue.remove([message.id for message in batch]) == 1
+    assert message_queue.peek_batch("receiver-key", batch_size=10) == []
+
+
+def test_expired_messages_are_not_delivered(
+    message_queue: MessageQueue, payload: dict
+) -> None:
+    with freeze_time("2023-01-01 00:00:00"):
+        message_queue.enqueue("receiver-key", payload)
+    with freeze_time("2023-01-01 00:02:00"):
+        assert message_queue.peek_batch("receiver-key", batch_size=10) == []
+        assert message_queue.purge_expired() == 1
+
+
+def test_enqueue_many_queues_only_messages_that_fit(
+    message_queue: MessageQueue, payload: dict
+) -> None:
+    message_queue.enqueue("receiver-key", payload)
+
+    assert message_queue.enqueue_many("receiver-key", [payload] * 3) == [
+        True,
+        True,
+        False,
+    ]
+
+
+def test_messages_keep_the_event_they_are_delivered_with(
+    message_queue: MessageQueue, payload: dict
+) -> None:
+    message_queue.enqueue("receiver-key", payload)
+    message_queue.enqueue_many("receiver-key", [payload], event="chatFanOut")
+
+    batch = message_queue.peek_batch("receiver-key", batch_size=10)
+
+    assert [message.event for message in batch] == ["chat", "chatFanOut"]
@@ -0,0 +1,103 @@
+import pathlib
+import sqlite3
+
+import pytest
+
+from sdex_server.crypto.fingerprints import fingerprint_public_key
+from sdex_server.database.database import DatabaseManager
+from sdex_server.database.migrations import MIGRATIONS
+from sdex_server.database.models import User
+
+PEM_PUBLIC_KEY = (
+    "-----BEGIN RSA PUBLIC KEY-----\n"
+    "MEgCQQCP7aCVrG/oQK5lFXjEEBzzM/ZpkpHJUdW/HRMh1lxM/pzxBKT/kx6UX41Z\n"
+    "4xzTSu3L9gGgvXunjcU0HGs9xIAxAgMBAAE=\n"
+    "-----END RSA PUBLIC KEY-----\n"
+)
+
+
+@pytest.fixture
+def legacy_users() -> list[tuple[str, str]]:
+    return [("legacy_user", PEM_PUBLIC_KEY)]
+
+
+@pytest.fixture
+def legacy_db_path(
+    tmp_path: pathlib.Path, legacy_users: list[tuple[str, str]]
+) -> pathlib.Path:
+    db_path = tmp_path / "legacy.db"
+    client = sqlite3.connect(db_path)
+    client.execute(
+        """
+        CREATE TABLE users
+        (
+            id         INTEGER primary key,
+            login      TEXT    not null unique,
+            public_key TEXT    not null
+        );
+        """
+    )
+    client.executemany(
+        "INSERT INTO users (login, public_key) VALUES (?, ?);", legacy_users
+    )
+    client.commit()
+    client.close()
+    return db_path
+
+
+def test_migrations_backfill_public_key_fingerprints(
+    legacy_db_path: pathlib.Path,
+) -> None:
+    db_manager = DatabaseManager(legacy_db_path)
+
+    (version,) = db_manager.client.execute("PRAGMA user_version;").fetchone()
+    (fingerprint,) = db_manager.client.execute(
+        "SELECT public_key_fingerprint FROM users WHERE login = 'legacy_user';"
+    ).fetchone()
+    assert version == len(MIGRATIONS)
+    assert fingerprint == fingerprint_public_key(PEM_PUBLIC_KEY)
+
+
+def test_check_public_key_ignores_key_formatting(
+    legacy_db_path: pathlib.Path,
+) -> None:
+    db_manager = DatabaseManager(legacy_db_path)
+
+    assert db_manager.check_public_key(PEM_PUBLIC_KEY.replace("\n", "\r\n")) is True
+
+
+def test_add_user_rejects_already_registered_public_key(
+    legacy_db_path: pathlib.Path,
+) -> None:
+    db_manager = DatabaseManager(legacy_db_path)
+
+    assert db_manager.add_user(User(login="other", public_key=PEM_PUBLIC_KEY)) is False
+
+
+@pytest.mark.parametrize(
+    "legacy_users",
+    [
+        [
+            ("legacy_user", PEM_PUBLIC_KEY),
+            ("other", "other-key"),
+            ("same_key", PEM_PUBLIC_KEY.replace("\n", "\r\n")),
+        ]
+    ],
+)
+def test_migrations_keep_users_sharing_a_public_key(
+    legacy_db_path: pathlib.Path,
+) -> None:
+    db_manager = DatabaseManager(legacy_db_path)
+
+    fingerprints = dict(
+        db_manager.client.execute("SELECT login, public_key_fingerprint FROM users;")
+    )
+    assert fingerprints == {
+        "legacy_user": fingerprint_public_key(PEM_PUBLIC_KEY),
+        "other": fingerprint_public_key("other-key"),
+        "same_key": None,
+    }
+    user = db_manager.get_user_by_login("same_key")
+    assert user and user.public_key.startswith("-----BEGIN")
+    assert db_manager.update_user("same_key", "new-key") is True
+    assert db_manager.check_public_key("new-key") is True
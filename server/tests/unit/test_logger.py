@@ -0,0 +1,79 @@
+from typing import Callable
+
+import pytest
+from loguru import logger
+
+from sdex_server.logger import EventSampler, sampled_logger
+
+
+def collect_messages(every: int, log: Callable[[], None]) -> list[str]:
+    messages: list[str] = []
+    handler_id = logger.add(
+        lambda message: messages.append(message.record["message"]), level="DEBUG"
+    )
+    sampler = sampled_logger.sampler
+    sampled_logger.sampler = EventSampler(every)
+    try:
+        log()
+    finally:
+        sampled_logger.sampler = sampler
+        logger.remove(handler_id)
+    return messages
+
+
+def test_event_sampler_passes_every_nth_sampled_record() -> None:
+    def log() -> None:
+        for i in range(10):
+            sampled_logger.info("event {}", i)
+
+    messages = collect_messages(4, log)
+
+    assert messages == ["event 0", "event 4", "event 8"]
+
+
+def test_event_sampler_passes_all_other_records() -> None:
+    def log() -> None:
+        for i in range(3):
+            logger.info("event {}", i)
+            sampled_logger.warning("warning {}", i)
+
+    messages = collect_messages(100, log)
+
+    assert len(messages) == 6
+
+
+def test_skipped_records_are_not_formatted() -> None:
+    formatted: list[int] = []
+
+    class Argument:
+        def __init__(self, i: int) -> None:
+            self.i = i
+
+        def __format__(self, format_spec: str) -> str:
+            formatted.append(self.i)
+            return str(self.i)
+
+    def log() -> None:
+        for i in range(10):
+            sampled_logger.info("event {}", Argument(i))
+
+    messages = collect_messages(5, log)
+
+    assert messages == ["event 0", "event 5"]
+    assert formatted == [0, 5]
+
+
+@pytest.mark.parametrize("every", [1, 3])
+def test_sampled_records_keep_the_caller_location(every: int) -> None:
+    records: list[dict] = []
+    handler_id = logger.add(lambda message: records.append(message.record))
+    sampler = sampled_logger.sampler
+    sampled_logger.sampler = EventSampler(every)
+    try:
+        sampled_logger.info("event")
+    finally:
+        sampled_logger.sampler = sampler
+        logger.remove(handler_id)
+
+    assert records[0]["name"] == __name__
+    assert records[0]["function"] == "test_sampled_records_keep_the_caller_location"
@@ -0,0 +1,396 @@
+import asyncio
+
+import httpx
+import pytest
+import pytest_asyncio
+import rsa
+
+from sdex_server import main
+from sdex_server.connection.outbound import OutboundQueues
+from sdex_server.connection.presence import InMemoryPresenceBackend
+from sdex_server.crypto.tickets import TicketManager
+from sdex_server.database.async_database import AsyncDatabaseManager
+from sdex_server.database.models import User
+from sdex_server.metrics import THROTTLED_EVENTS
+
+
+@pytest.fixture(scope="module")
+def server_private_key() -> rsa.PrivateKey:
+    _, private_key = rsa.newkeys(512)
+    return private_key
+
+
+@pytest_asyncio.fixture
+async def server(monkeypatch, tmp_path, socket_manager, server_private_key):
+    """Handlers of an app created with the fake socket manager."""
+    monkeypatch.setattr(main, "SocketManager", lambda **_: socket_manager)
+    main.create_app()
+    db_manager = AsyncDatabaseManager(
+        tmp_path / "users.db",
+        readers=1,
+        max_messages_per_recipient=10,
+        ttl_seconds=60,
+        write_batch_size=1,
+        write_batch_window=0,
+    )
+    await db_manager.open()
+    for name, component in (
+        ("presence", InMemoryPresenceBackend()),
+        ("db_manager", db_manager),
+        ("tickets", TicketManager(server_private_key, ttl_seconds=60)),
+    ):
+        monkeypatch.setattr(main, name, component, raising=False)
+    yield main
+    await asyncio.gather(*socket_manager.tasks)
+    db_manager.close()
+
+
+async def settle(server, socket_manager) -> None:
+    """Wait for background tasks, like flushes of queued messages, to finish."""
+    while pending := socket_manager.tasks | server.outbound._tasks:
+        await asyncio.gather(*pending)
+
+
+def fan_out(*public_keys: str) -> dict:
+    return {
+        "publicKeyFrom": "sender-key",
+        "createdAt": "now",
+        "body": "ciphertext",
+        "recipients": [
+            {"publicKeyTo": public_key, "envelope": f"envelope-{public_key}"}
+            for public_key in public_keys
+        ],
+    }
+
+
+async def connect(server, sid: str, public_key: str, ticket: bool = True) -> None:
+    """Connect the sid, authenticated with a resumption ticket unless disabled.
+
+    Users authenticated with a ticket are registered first.
+    """
+    auth = {"publicKey": public_key}
+    if ticket:
+        key_version = await server.db_manager.get_key_version(public_key)
+        if key_version is None:
+            await server.db_manager.add_user(
+                User(login=public_key, public_key=public_key)
+            )
+            key_version = await server.db_manager.get_key_version(public_key)
+        auth["ticket"] = server.tickets.issue(public_key, key_version)
+    await server.handle_connect(sid, {}, auth)
+
+
+@pytest.mark.asyncio
+async def test_connecting_with_someone_elses_key_doesnt_lock_them_out(
+    server, socket_manager
+):
+    await connect(server, "victim", "victim-key")
+
+    for i in range(5):
+        await connect(server, f"intruder-{i}", "victim-key", ticket=False)
+    await connect(server, "victim-again", "victim-key")
+
+    assert await server.presence.get_sid("victim-key") == "victim-again"
+    assert not await server.presence.is_authenticated("intruder-0")
+    assert await server.presence.get_public_key("intruder-0") is None
+    assert socket_manager.disconnected == ["victim"]
+    assert len(server.admission) == 6
+
+
+@pytest.mark.asyncio
+async def test_authenticating_again_replaces_previous_socket(server, socket_manager):
+    await connect(server, "old-sid", "key")
+    await connect(server, "new-sid", "key")
+
+    assert socket_manager.disconnected == ["old-sid"]
+    assert await server.presence.get_sid("key") == "new-sid"
+    assert await server.presence.is_authenticated("new-sid")
+    assert len(server.admission) == 1
+    assert server.admission.expired() == []
+
+
+@pytest.mark.asyncio
+async def test_presence_is_published_only_for_authenticated_users(
+    server, socket_manager
+):
+    room = server.presence_room("key")
+
+    await connect(server, "intruder", "key", ticket=False)
+    await server.handle_disconnect("intruder")
+    await connect(server, "old-sid", "key")
+    await connect(server, "new-sid", "key")
+    await server.handle_disconnect("new-sid")
+
+    assert [
+        data["online"] for event, data, to in socket_manager.emitted if to == room
+    ] == [True, False]
+
+
+@pytest.mark.asyncio
+async def test_presence_subscriptions(server, socket_manager):
+    await connect(server, "sid", "key")
+    await connect(server, "contact", "contact-key")
+    keys = ["contact-key", "offline-key"]
+
+    assert await server.handle_check_online_status_bulk("sid", keys) == [True, False]
+    assert await server.handle_subscribe_presence("sid", keys) == [True, False]
+    assert socket_manager.rooms[server.presence_room("offline-key")] == {"sid"}
+    assert await server.handle_unsubscribe_presence("sid", keys) is True
+    assert socket_manager.rooms[server.presence_room("offline-key")] == set()
+
+    await connect(server, "stranger", "stranger-key", ticket=False)
+    assert await server.handle_subscribe_presence("stranger", keys) is False
+    assert await server.handle_subscribe_presence("sid", "contact-key") is False
+
+
+@pytest.mark.asyncio
+async def test_presence_subscriptions_per_socket_are_limited(
+    server, socket_manager, monkeypatch
+):
+    monkeypatch.setattr(server, "PRESENCE_MAX_SUBSCRIPTIONS", 2)
+    await connect(server, "sid", "key")
+
+    assert await server.handle_subscribe_presence("sid", ["a", "b"]) == [False] * 2
+    assert await server.handle_subscribe_presence("sid", ["b", "c"]) is False
+    assert socket_manager.rooms.get(server.presence_room("c"), set()) == set()
+    assert await server.handle_unsubscribe_presence("sid", ["a"]) is True
+    assert await server.handle_subscribe_presence("sid", ["b", "c"]) == [False] * 2
+
+    await server.handle_disconnect("sid")
+    await connect(server, "sid", "key")
+    assert await server.handle_subscribe_presence("sid", ["d", "e"]) == [False] * 2
+
+
+@pytest.mark.asyncio
+async def test_fan_out_reaches_online_offline_and_overflowing_recipients(
+    server, socket_manager, monkeypatch
+):
+    monkeypatch.setattr(
+        server, "outbound", OutboundQueues(socket_manager, 0, max_in_flight=1)
+    )
+    for public_key in ("online-key", "offline-key", "busy-key"):
+        await server.db_manager.add_user(User(login=public_key, public_key=public_key))
+    await connect(server, "sender", "sender-key")
+    await connect(server, "online", "online-key")
+    await connect(server, "busy", "busy-key")
+    socket_manager.acks = asyncio.Event()
+    sending = asyncio.create_task(server.outbound.send("busy", "chat", {}))
+    await asyncio.sleep(0)
+
+    fanning_out = asyncio.create_task(
+        server.handle_chat_fan_out(
+            "sender", fan_out("online-key", "offline-key", "busy-key")
+        )
+    )
+    await asyncio.sleep(0.05)
+    socket_manager.acks.set()
+    statuses = await fanning_out
+    await sending
+    await connect(server, "offline", "offline-key")
+    await settle(server, socket_manager)
+
+    assert statuses == ["success"] * 3
+    fan_outs = {
+        to: data for event, data, to in socket_manager.called if event != "chat"
+    }
+    assert fan_outs.keys() == {"online", "offline", "busy"}
+    assert all(event == "chatFanOut" for event, _, _ in socket_manager.called[1:])
+    assert fan_outs["offline"]["envelope"] == "envelope-offline-key"
+    assert fan_outs["busy"]["body"] == "ciphertext"
+
+
+@pytest.mark.asyncio
+async def test_fan_out_takes_a_chat_token_per_recipient(
+    server, socket_manager, monkeypatch
+):
+    monkeypatch.setitem(server.rate_limiter._limits, "chatFanOut", (1, 4))
+    await connect(server, "sender", "sender-key")
+    recipients = [f"key-{i}" for i in range(3)]
+    for public_key in recipients:
+        await connect(server, public_key, public_key)
+
+    first = await server.handle_chat_fan_out("sender", fan_out(*recipients))
+    second = await server.handle_chat_fan_out("sender", fan_out(*recipients))
+
+    assert first == ["success"] * 3
+    assert second == "busy"
+
+
+@pytest.mark.asyncio
+async def test_queued_messages_are_flushed_to_clients_handling_only_chat(
+    server, socket_manager, monkeypatch
+):
+    async def call(event: str, data: dict, to: str, timeout=None) -> bool:
+        socket_manager.called.append((event, data, to))
+        if event != "chat":
+            raise TimeoutError
+        return True
+
+    monkeypatch.setattr(socket_manager, "call", call)
+    monkeypatch.setattr(
+        server, "outbound", OutboundQueues(socket_manager, 100, max_in_flight=4)
+    )
+    await server.db_manager.add_user(User(login="receiver", public_key="receiver-key"))
+    await connect(server, "sender", "sender-key")
+    statuses = [
+        await server.handle_chat(
+            "sender",
+            {
+                "publicKeyTo": "receiver-key",
+                "publicKeyFrom": "sender-key",
+                "text": str(number),
+                "createdAt": "now",
+            },
+        )
+        for number in range(10)
+    ]
+
+    await connect(server, "receiver", "receiver-key")
+    await settle(server, socket_manager)
+
+    assert statuses == ["success"] * 10
+    assert [(event, data["text"]) for event, data, _ in socket_manager.called] == [
+        ("chat", str(number)) for number in range(10)
+    ]
+    assert await server.db_manager.peek_queued_messages("receiver-key", 10) == []
+
+
+@pytest.mark.asyncio
+async def test_messages_after_a_spill_dont_overtake_spilled_ones(
+    server, socket_manager, monkeypatch
+):
+    monkeypatch.setattr(
+        server, "outbound", OutboundQueues(socket_manager, 0, max_in_flight=1)
+    )
+    await server.db_manager.add_user(User(login="receiver", public_key="receiver-key"))
+    await connect(server, "sender", "sender-key")
+    await connect(server, "receiver", "receiver-key")
+    await settle(server, socket_manager)
+    socket_manager.acks = asyncio.Event()
+
+    def chat(text: str) -> dict:
+        return {
+            "publicKeyTo": "receiver-key",
+            "publicKeyFrom": "sender-key",
+            "text": text,
+            "createdAt": "now",
+        }
+
+    first = asyncio.create_task(server.handle_chat("sender", chat("1")))
+    await asyncio.sleep(0)
+    assert await server.handle_chat("sender", chat("2")) == "success"
+    socket_manager.acks.set()
+    assert await first == "success"
+    # The receiver's queue is empty again, but the spilled message isn't flushed
+    assert await server.handle_chat("sender", chat("3")) == "success"
+    await settle(server, socket_manager)
+    assert await server.handle_chat("sender", chat("4")) == "success"
+
+    assert [data["text"] for _, data, _ in socket_manager.called] == [
+        "1",
+        "2",
+        "3",
+        "4",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_retried_batch_messages_are_delivered_once(server, socket_manager):
+    await connect(server, "sender", "sender-key")
+    await connect(server, "receiver", "receiver-key")
+    message = {
+        "publicKeyTo": "receiver-key",
+        "publicKeyFrom": "sender-key",
+        "text": "hello",
+        "createdAt": "now",
+    }
+
+    first = await server.handle_chat_batch(
+        "sender", [{**message, "messageId": "1"}, message]
+    )
+    retry = await server.handle_chat_batch(
+        "sender", [{**message, "messageId": "1"}, {**message, "messageId": "2"}]
+    )
+
+    assert first == retry == ["success", "success"]
+    assert [len(data) for event, data, _ in socket_manager.called] == [2, 1]
+    assert socket_manager.called[1][1][0]["messageId"] == "2"
+
+
+@pytest.mark.asyncio
+async def test_lifespan_starts_and_releases_resources(
+    monkeypatch, tmp_path, server_private_key
+):
+    reapers = []
+
+    async def reap_unauthenticated() -> None:
+        reapers.append(asyncio.current_task())
+        await asyncio.sleep(3600)
+
+    monkeypatch.setattr(main, "SQLITE_DB_PATH", tmp_path / "users.db")
+    monkeypatch.setattr(main, "PRESENCE_BACKEND", "memory")
+    monkeypatch.setattr(main, "AUTH_VERIFICATION_WORKERS", 1)
+    monkeypatch.setattr(main, "server_private_key", lambda: server_private_key)
+    monkeypatch.setattr(main, "reap_unauthenticated", reap_unauthenticated)
+
+    app = main.create_app()
+    async with app.router.lifespan_context(app), httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://server"
+    ) as client:
+        response = await client.get("/metrics")
+        # Let the reaper start
+        await asyncio.sleep(0)
+
+        assert response.status_code == 200
+        assert "sdex_connected_sids 0" in response.text
+        assert main.rate_limiter.allow("chat", "sid")
+
+    await asyncio.sleep(0)
+    assert [reaper.cancelled() for reaper in reapers] == [True]
+    assert main.db_manager._writer._shutdown
+
+
+@pytest.mark.asyncio
+async def test_register_init_answers_none_when_no_challenge_is_issued(
+    server, monkeypatch
+):
+    monkeypatch.setitem(server.rate_limiter._limits, "registerInit", (1, 1))
+    monkeypatch.setattr(server.challenges, "max_pending", 0)
+
+    throttled = THROTTLED_EVENTS.value("registerInit")
+
+    # Refused by the challenge manager, then by the rate limiter
+    assert await server.handle_register_init("sid") is None
+    assert await server.handle_register_init("sid") is None
+    assert THROTTLED_EVENTS.value("registerInit") == throttled + 1
+
+    monkeypatch.setattr(server.challenges, "max_pending", 10)
+    assert await server.handle_register_init("other-sid")
+
+
+@pytest.mark.asyncio
+async def test_tickets_are_revoked_when_the_key_changes(server, socket_manager):
+    await server.db_manager.add_user(User(login="user", public_key="old-key"))
+    old_ticket = server.tickets.issue("old-key", 1)
+    await server.handle_connect(
+        "sid", {}, {"publicKey": "old-key", "ticket": old_ticket}
+    )
+
+    assert await server.handle_update_public_key(
+        "sid", {"login": "user", "publicKey": "new-key"}
+    )
+    (new_ticket,) = [
+        data for event, data, _ in socket_manager.emitted if event == "ticket"
+    ]
+    assert await server.handle_update_public_key(
+        "sid", {"login": "user", "publicKey": "old-key"}
+    )
+
+    for sid, public_key, ticket in (
+        ("old", "old-key", old_ticket),
+        ("new", "new-key", new_ticket["ticket"]),
+    ):
+        await server.handle_connect(
+            sid, {}, {"publicKey": public_key, "ticket": ticket}
+        )
+        assert not await server.presence.is_authenticated(sid)
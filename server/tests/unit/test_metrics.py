@@ -0,0 +1,81 @@
+import pytest
+
+from sdex_server.metrics import (
+    EVENT_ERRORS,
+    EVENT_LATENCY,
+    EVENTS,
+    Counter,
+    Histogram,
+    Metric,
+    instrumented,
+    render,
+)
+
+
+@pytest.fixture
+def registry() -> list[Metric]:
+    return []
+
+
+def test_histogram_renders_cumulative_buckets(registry) -> None:
+    histogram = Histogram(
+        "test_duration_seconds",
+        "Test durations.",
+        "event",
+        buckets=(0.1, 1.0),
+        registry=registry,
+    )
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, "chat")
+
+    assert histogram.samples() == [
+        'test_duration_seconds_bucket{event="chat",le="0.1"} 1',
+        'test_duration_seconds_bucket{event="chat",le="1.0"} 2',
+        'test_duration_seconds_bucket{event="chat",le="+Inf"} 3',
+        'test_duration_seconds_sum{event="chat"} 5.55',
+        'test_duration_seconds_count{event="chat"} 3',
+    ]
+
+
+def test_render_includes_metric_headers(registry) -> None:
+    Counter("test_requests_total", "Test requests.", registry=registry).inc()
+
+    assert render(registry) == (
+        "# HELP test_requests_total Test requests.\n"
+        "# TYPE test_requests_total counter\n"
+        "test_requests_total 1\n"
+    )
+
+
+def test_metrics_must_implement_samples() -> None:
+    class Incomplete(Metric):
+        type = "untyped"
+
+    with pytest.raises(TypeError):
+        Incomplete("test_incomplete", "Incomplete metric.", registry=[])
+
+
+@pytest.mark.asyncio
+async def test_instrumented_counts_calls_and_error_responses() -> None:
+    @instrumented("testEvent")
+    async def handler(sid: str, data: str) -> str:
+        return data
+
+    await handler("sid", "success")
+    await handler("sid", "error")
+
+    assert EVENTS.value("testEvent") == 2
+    assert EVENT_ERRORS.value("testEvent") == 1
+    assert EVENT_LATENCY.count("testEvent") == 2
+
+
+@pytest.mark.asyncio
+async def test_instrumented_counts_exceptions_as_errors() -> None:
+    @instrumented("failingEvent")
+    async def handler(sid: str) -> None:
+        raise ValueError
+
+    with pytest.raises(ValueError):
+        await handler("sid")
+
+    assert EVENT_ERRORS.value("failingEvent") == 1